@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional
+from code_analyzer import CodeAnalyzer
+from doc_generator import DocumentGenerator, create_runner
+from cache import AnalysisCache
+from metrics import Metrics
+from parallel_scan import ScanPools
+from utils import setup_directories, write_json_atomic
+from main import setup_langsmith, load_incremental_state
+from exporter import export_many
+from config import CACHE_DIR, CACHE_MAX_SIZE_MB, CACHE_MAX_AGE_DAYS, LLM_MAX_CONCURRENCY, SCAN_WORKERS
+from config import BATCH_REPO_CONCURRENCY, EXPORT_FORMATS
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """Read a JSONL manifest with one {"source", "output"} entry per repository.
+
+    Entries may also set "name", "incremental", "since" and "resume", as on the single-repository command line.
+    """
+    repos = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "source" not in entry or "output" not in entry:
+                raise SystemExit(f"{path}:{number}: each entry needs a source and an output directory")
+            entry.setdefault("name", os.path.basename(os.path.normpath(entry["source"])))
+            repos.append(entry)
+    return repos
+
+
+class BatchRunner:
+    """Documents many repositories at once, sharing the LLM rate limits, the result cache and the scan pools."""
+
+    def __init__(self, runner, cache: Optional[AnalysisCache], pools: ScanPools, cache_dir: Optional[str] = None,
+                 repo_concurrency: int = BATCH_REPO_CONCURRENCY, memory: Optional[Dict[str, Any]] = None):
+        self.runner = runner
+        self.cache = cache
+        self.cache_dir = cache_dir
+        self.pools = pools
+        self.repo_concurrency = max(1, repo_concurrency)
+        # Structure and history indexes kept in memory between runs (see server.py)
+        self.memory = memory
+
+    async def run(self, repos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Document every repository; a failing repository is reported and does not stop the others."""
+        slots = asyncio.Semaphore(self.repo_concurrency)
+
+        async def run_one(repo: Dict[str, Any]) -> Dict[str, Any]:
+            async with slots:
+                return await self.document(repo)
+
+        return await asyncio.gather(*(run_one(repo) for repo in repos))
+
+    async def document(self, repo: Dict[str, Any], metrics: Optional[Metrics] = None) -> Dict[str, Any]:
+        """Document one repository entry and return its result; errors are reported in the result."""
+        metrics = metrics or Metrics()
+        started_at = time.perf_counter()
+        result = {"name": repo["name"], "source": repo["source"], "output": repo["output"]}
+        try:
+            setup_directories(repo["output"])
+            # Scanning is blocking work; it runs in a thread while other repositories wait on the LLM
+            analyzer = CodeAnalyzer(repo["source"], cache_dir=self.cache_dir,
+                                    scan_workers=self.pools.workers, metrics=metrics, scan_pools=self.pools,
+                                    memory=self.memory)
+            loop = asyncio.get_running_loop()
+            code_analysis = await loop.run_in_executor(None, analyzer.analyze)
+            previous_spec, changes = load_incremental_state(analyzer, repo["output"], repo.get("incremental", False),
+                                                            repo.get("since"))
+
+            generator = DocumentGenerator(code_analysis, cache=self.cache, runner=self.runner,
+                                          previous_spec=previous_spec, changes=changes, metrics=metrics,
+                                          resume=repo.get("resume", False))
+            result["documents"] = await generator.agenerate_documents(repo["output"])
+            result["commit"] = (code_analysis["git_info"] or {}).get("head_commit")
+            metrics.write_report(os.path.join(repo["output"], "run_metrics.json"))
+            result["status"] = "ok"
+        except Exception as e:
+            print(f"Error: {repo['name']}: {type(e).__name__}: {e}")
+            result["status"] = "failed"
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["seconds"] = round(time.perf_counter() - started_at, 3)
+        result.update(metrics.llm_totals())
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate specification documents for many repositories")
+    parser.add_argument("manifest", help="JSONL file with one {\"source\": ..., \"output\": ...} entry per repository")
+    parser.add_argument("--cache-dir", help="Directory for the shared LLM result cache", default=CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true", help="Disable the persistent LLM result cache")
+    parser.add_argument("--concurrency", "-j", type=int, default=LLM_MAX_CONCURRENCY,
+                        help="Maximum number of concurrent LLM calls across all repositories")
+    parser.add_argument("--repo-concurrency", type=int, default=BATCH_REPO_CONCURRENCY,
+                        help="Number of repositories processed at the same time")
+    parser.add_argument("--scan-workers", type=int, default=SCAN_WORKERS,
+                        help="Threads/processes shared by the scans of all repositories")
+    parser.add_argument("--report", default="batch_report.json", help="Where to write the per-repository report")
+    parser.add_argument("--export", metavar="FORMATS", nargs="?", const=",".join(EXPORT_FORMATS),
+                        help="Also export the documents of every repository to these formats (md, docx; default: both)")
+    args = parser.parse_args()
+
+    repos = load_manifest(args.manifest)
+    setup_langsmith()
+
+    # One runner for every repository, so the concurrency and rate limits hold for the whole batch
+    runner = create_runner(max_concurrency=args.concurrency)
+    cache = None if args.no_cache else AnalysisCache(args.cache_dir, CACHE_MAX_SIZE_MB, CACHE_MAX_AGE_DAYS)
+    started_at = time.perf_counter()
+    with ScanPools(args.scan_workers) as pools:
+        results = asyncio.run(BatchRunner(runner, cache, pools, None if args.no_cache else args.cache_dir,
+                                          args.repo_concurrency).run(repos))
+
+    print("Batch results:")
+    for result in results:
+        error = f" ({result['error']})" if result.get("error") else ""
+        print(f"  - {result['name']}: {result['status']} in {result['seconds']:.2f}s, "
+              f"{result['llmCalls']} LLM calls, {result['promptTokens']} prompt tokens{error}")
+    if args.export:
+        exported = export_many([result["output"] for result in results if result["status"] == "ok"],
+                               args.export.split(","), args.scan_workers)
+        for result, export in zip([result for result in results if result["status"] == "ok"], exported):
+            result["exported"] = export["written"] + export["skipped"]
+            if export.get("error"):
+                print(f"Error: exporting {result['name']}: {export['error']}")
+    report = {"wallSeconds": round(time.perf_counter() - started_at, 3), "repositories": results}
+    if cache:
+        report["cache"] = cache.stats()
+        cache.close()
+    write_json_atomic(args.report, report)
+    print(f"Report written to {args.report}")
+
+    if any(result["status"] != "ok" for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Offline benchmark: synthetic repositories, a deterministic fake LLM, end-to-end measurements.
+
+Usage:
+    python benchmark.py --sizes 1000,10000 --latency 0.05 --output bench_results/run.json
+    python benchmark.py --sizes 1000 --compare bench_results/baseline.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import subprocess
+import tempfile
+from typing import Any, Dict, List, Optional
+from langchain_core.language_models.llms import LLM
+
+# Mix of generated languages: (extension, weight)
+LANGUAGE_MIX = [('py', 35), ('js', 20), ('ts', 15), ('java', 10), ('go', 10), ('json', 5), ('css', 5)]
+
+
+class FakeLLM(LLM):
+    """Deterministic stand-in for GoogleGenerativeAI that answers every prompt with valid JSON."""
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _respond(self, prompt: str) -> str:
+        paths = re.findall(r"^\s*File path: (\S+)", prompt, re.MULTILINE)
+        lowered = prompt.lower()
+        if "for each of the following files" in lowered:
+            return json.dumps({"components": [self._component(path) for path in paths]})
+        if paths:
+            return json.dumps(self._component(paths[0]))
+        if "sub-directories inside the directory" in lowered:
+            directory = re.search(r'directory "([^"]*)"', prompt).group(1)
+            return json.dumps({"directory": directory, "summary": f"Code under {directory}",
+                               "keyComponents": [], "publicInterface": [], "dependencies": []})
+        if "integration analysis" in lowered:
+            return json.dumps({"systemArchitecture": "Synthetic", "componentInteractions": [], "dataFlow": "",
+                               "integrationPoints": [], "dependencies": {}, "apiContracts": [],
+                               "systemRequirements": [], "deploymentArchitecture": ""})
+        return json.dumps({"introduction": "Synthetic", "architecture": "", "technologies": [], "components": [],
+                           "dataFlow": "", "integrationPoints": [], "developmentConsiderations": ""})
+
+    def _component(self, path: str) -> Dict[str, Any]:
+        name = os.path.splitext(os.path.basename(path))[0]
+        return {"sourcePath": path, "componentName": name, "componentType": "module",
+                "primaryFunctionality": f"Synthetic module {name}",
+                "publicInterface": [{"name": f"{name}_run", "parameters": [], "returnType": "None", "description": ""}],
+                "dependencies": [], "dataStructures": [], "errorHandling": "", "notes": ""}
+
+    def _call(self, prompt: str, stop=None, run_manager=None, **kwargs) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(prompt)
+
+    async def _acall(self, prompt: str, stop=None, run_manager=None, **kwargs) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(prompt)
+
+
+def _source(ext: str, name: str, imports: List[str], rng: random.Random) -> str:
+    """Generate a plausible source file of random length in the given language."""
+    functions = rng.randint(2, 25)
+    if ext == 'py':
+        head = "".join(f"from {module.replace('/', '.')} import helper\n" for module in imports)
+        body = "".join(f"\n\ndef {name}_{i}(value, factor={i}):\n    \"\"\"Compute step {i}.\"\"\"\n"
+                       f"    result = helper(value) * factor\n    if result > {i * 10}:\n        return result - {i}\n"
+                       f"    return result\n" for i in range(functions))
+        return head + body
+    if ext in ('js', 'ts'):
+        head = "".join(f"import {{ helper }} from './{os.path.relpath(module, '.')}';\n" for module in imports)
+        body = "".join(f"\nexport function {name}_{i}(value) {{\n  const result = helper(value) * {i};\n"
+                       f"  if (result > {i * 10}) {{\n    return result - {i};\n  }}\n  return result;\n}}\n"
+                       for i in range(functions))
+        return head + body
+    if ext == 'java':
+        body = "".join(f"    public int {name}_{i}(int value) {{\n        int result = value * {i};\n"
+                       f"        return result > {i * 10} ? result - {i} : result;\n    }}\n" for i in range(functions))
+        return f"package synthetic;\n\npublic class {name.capitalize()} {{\n{body}}}\n"
+    if ext == 'go':
+        body = "".join(f"\nfunc {name.capitalize()}{i}(value int) int {{\n\tresult := value * {i}\n"
+                       f"\tif result > {i * 10} {{\n\t\treturn result - {i}\n\t}}\n\treturn result\n}}\n"
+                       for i in range(functions))
+        return f"package synthetic\n{body}"
+    if ext == 'json':
+        return json.dumps({f"{name}_{i}": {"enabled": i % 2 == 0, "limit": i * 10} for i in range(functions)}, indent=2)
+    return "".join(f".{name}-{i} {{\n  margin: {i}px;\n  padding: {i * 2}px;\n}}\n" for i in range(functions))
+
+
+def generate_repository(root: str, num_files: int, seed: int = 42) -> str:
+    """Create a deterministic synthetic source tree with mixed languages and import relations."""
+    marker = os.path.join(root, ".synthetic-complete")
+    if os.path.exists(marker):
+        return root
+    rng = random.Random(seed)
+    extensions = [ext for ext, weight in LANGUAGE_MIX for _ in range(weight)]
+    created = []
+    for i in range(num_files):
+        depth = rng.randint(1, 4)
+        directory = "/".join(f"pkg{rng.randint(0, 9)}" for _ in range(depth))
+        ext = rng.choice(extensions)
+        name = f"mod{i}"
+        stem = f"{directory}/{name}"
+        # Imports point at earlier files of the same language, so the graph has hubs
+        same_language = [path for path, path_ext in created[-200:] if path_ext == ext]
+        imports = rng.sample(same_language, min(len(same_language), rng.randint(0, 3)))
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+        with open(os.path.join(root, f"{stem}.{ext}"), 'w') as f:
+            f.write(_source(ext, name, imports, rng))
+        created.append((stem, ext))
+    with open(marker, 'w') as f:
+        f.write(str(num_files))
+    return root
+
+
+def count_lines(files: List[Any]) -> int:
+    """Lines of code in the scanned files, the denominator of callsPerKLOC."""
+    lines = 0
+    for file_info in files:
+        try:
+            with open(file_info.abs_path, 'rb') as f:
+                lines += sum(1 for _ in f)
+        except OSError:
+            continue
+    return lines
+
+
+def run_single(source_dir: str, latency: float, concurrency: int) -> Dict[str, Any]:
+    """Run the scan and both documents end to end in this process and measure them."""
+    # Rate limits are lifted so only the fake latency and the code under test are measured
+    os.environ["LLM_REQUESTS_PER_MINUTE"] = "100000000"
+    os.environ["LLM_TOKENS_PER_MINUTE"] = "1000000000000"
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    from code_analyzer import CodeAnalyzer
+    from doc_generator import DocumentGenerator
+    from metrics import Metrics
+    
+    metrics = Metrics()
+    started_at = time.perf_counter()
+    analysis = CodeAnalyzer(source_dir, metrics=metrics).analyze()
+    scan_seconds = time.perf_counter() - started_at
+    
+    output_dir = tempfile.mkdtemp(prefix="specdoc-bench-out-")
+    generator = DocumentGenerator(analysis, llm=FakeLLM(latency=latency), max_concurrency=concurrency, metrics=metrics)
+    generator.generate_documents(output_dir)
+    total_seconds = time.perf_counter() - started_at
+    totals = metrics.llm_totals()
+    lines = count_lines(analysis["files"])
+    
+    return {
+        "files": len(analysis["files"]),
+        "linesOfCode": lines,
+        "scanSeconds": round(scan_seconds, 3),
+        "endToEndSeconds": round(total_seconds, 3),
+        **totals,
+        # Call volume relative to the code size, comparable across repository sizes
+        "callsPerKLOC": round(totals["llmCalls"] * 1000 / lines, 3) if lines else None,
+        # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+        "peakRssMB": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+        "stages": metrics.summary()["stages"]
+    }
+
+
+def _timed_run(command: List[str], repeat: int = 3) -> float:
+    """Best wall time of a command over a few runs, in seconds."""
+    best = None
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        proc = subprocess.run(command, capture_output=True, text=True)
+        elapsed = time.perf_counter() - started_at
+        if proc.returncode != 0:
+            print(proc.stderr)
+            raise SystemExit(f"Startup benchmark failed: {' '.join(command)}")
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 3)
+
+
+def measure_startup(workdir: str) -> Dict[str, Any]:
+    """Time `main.py --help` and a dry run over a tiny tree, neither of which should load the LLM libraries."""
+    main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    source_dir = generate_repository(os.path.join(workdir, "repo-startup"), 20)
+    output_dir = tempfile.mkdtemp(prefix="specdoc-bench-out-")
+    dry_run = [main_py, "--source", source_dir, "--output", output_dir, "--no-cache", "--dry-run", "--scan-workers", "1"]
+    # -X importtime lists every imported module on stderr
+    imports = subprocess.run([sys.executable, "-X", "importtime", *dry_run], capture_output=True, text=True).stderr
+    return {
+        "helpSeconds": _timed_run([sys.executable, main_py, "--help"]),
+        "dryRunSeconds": _timed_run([sys.executable, *dry_run]),
+        "dryRunLoadsLangchain": "langchain" in imports
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print the relative change of each headline metric against a baseline result file."""
+    fields = ["scanSeconds", "endToEndSeconds", "llmCalls", "callsPerKLOC", "promptTokens", "peakRssMB"]
+    if "startup" in baseline:
+        print(f"Startup vs {str(baseline.get('commit'))[:12]}:")
+        for field, new in current["startup"].items():
+            old = baseline["startup"].get(field)
+            if isinstance(old, float):
+                change = (new - old) / old * 100 if old else 0.0
+                print(f"  {field:16} {old:>12} -> {new:>12} ({change:+.1f}%)")
+    for size, result in current["results"].items():
+        base = baseline.get("results", {}).get(size)
+        if not base:
+            continue
+        print(f"{size} files vs {str(baseline.get('commit'))[:12]}:")
+        for field in fields:
+            # Baselines written before a field was added are compared on the others
+            if base.get(field) is None or result.get(field) is None:
+                continue
+            old, new = base[field], result[field]
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"  {field:16} {old:>12} -> {new:>12} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the documentation pipeline against a fake LLM")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated synthetic repository sizes (files)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM latency per call in seconds")
+    parser.add_argument("--concurrency", type=int, default=16, help="Maximum concurrent LLM calls")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "specdoc-bench"),
+                        help="Where synthetic repositories are generated (reused between runs)")
+    parser.add_argument("--output", "-o", default=os.path.join("bench_results", "latest.json"),
+                        help="Where to write the JSON results")
+    parser.add_argument("--compare", metavar="BASELINE", help="Compare with a previous results file")
+    parser.add_argument("--single", metavar="SOURCE", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.single:
+        print(json.dumps(run_single(args.single, args.latency, args.concurrency)))
+        return
+    
+    startup = measure_startup(args.workdir)
+    print(f"Startup: --help {startup['helpSeconds']}s, --dry-run {startup['dryRunSeconds']}s")
+    if startup["dryRunLoadsLangchain"]:
+        print("Warning: --dry-run imports langchain; keep LLM imports inside the code paths that need them.")
+    
+    results = {}
+    for size in [int(size) for size in args.sizes.split(",") if size]:
+        source_dir = generate_repository(os.path.join(args.workdir, f"repo-{size}"), size)
+        # Each size runs in a fresh process so peak RSS and imports are measured in isolation
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--single", source_dir,
+             "--latency", str(args.latency), "--concurrency", str(args.concurrency)],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(proc.stderr)
+            raise SystemExit(f"Benchmark for {size} files failed")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        results[str(size)] = result
+        print(f"{size} files: scan {result['scanSeconds']}s, end-to-end {result['endToEndSeconds']}s, "
+              f"{result['llmCalls']} LLM calls ({result['callsPerKLOC']} per kLOC), {result['promptTokens']} prompt tokens, "
+              f"peak RSS {result['peakRssMB']} MB")
+    
+    report = {"commit": _git_commit(), "createdAt": time.time(), "latency": args.latency,
+              "concurrency": args.concurrency, "startup": startup, "results": results}
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+
+class AnalysisCache:
+    """Persistent, content-addressed cache of LLM results backed by SQLite."""
+
+    def __init__(self, cache_dir: str, max_size_mb: float = 512, max_age_days: float = 30):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "analysis_cache.sqlite3")
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed ON results (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Build a cache key from every input that affects the LLM result."""
+        digest = hashlib.sha256()
+        for part in parts:
+            if not isinstance(part, str):
+                part = json.dumps(part, sort_keys=True, default=str)
+            digest.update(part.encode("utf-8", errors="ignore"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached result for a key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        """Store a result under a key."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8", errors="ignore")), now, now)
+            )
+            self._conn.commit()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until the cache fits its size limit."""
+        with self._lock:
+            cutoff = time.time() - self.max_age_seconds
+            removed = self._conn.execute("DELETE FROM results WHERE created_at < ?", (cutoff,)).rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > self.max_bytes:
+                freed = 0
+                stale = []
+                for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY accessed_at"):
+                    if total - freed <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    freed += size
+                self._conn.executemany("DELETE FROM results WHERE key = ?", stale)
+                removed += len(stale)
+            self._conn.commit()
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current cache size."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "sizeBytes": size
+        }
+
+    def close(self):
+        """Run eviction and close the database."""
+        self.evict()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,166 @@
+import ast
+from typing import Iterable, Iterator, List, Tuple
+from utils import count_tokens, extract_file_extension
+
+# Languages whose blocks are delimited by braces
+BRACE_LANGUAGES = ['JavaScript', 'TypeScript', 'Java', 'C++', 'C', 'C#', 'Go', 'PHP', 'Rust', 'Swift', 'Kotlin', 'Scala']
+BRACE_EXTENSIONS = ['css', 'json']
+
+# Boundary depth used for places where a cut is possible but undesirable
+NO_BOUNDARY = 99
+
+
+class ChunkPart:
+    """A contiguous piece of one source file."""
+
+    def __init__(self, path: str, language: str, code: str, tokens: int):
+        self.path = path
+        self.language = language
+        self.code = code
+        self.tokens = tokens
+
+
+class Chunk:
+    """One analysis request: a piece of a large file or several small files packed together."""
+
+    def __init__(self):
+        self.parts = []
+        self.tokens = 0
+
+    def add(self, part: ChunkPart):
+        self.parts.append(part)
+        self.tokens += part.tokens
+
+    @property
+    def paths(self) -> List[str]:
+        return [part.path for part in self.parts]
+
+
+def _python_boundaries(lines: List[str]) -> List[int]:
+    """Boundary depths for Python: 0 before top-level statements, 1 before statements in their bodies."""
+    depths = [NO_BOUNDARY] * len(lines)
+    tree = ast.parse("\n".join(lines))
+    
+    def mark(body, level):
+        for node in body:
+            start = min([node.lineno] + [d.lineno for d in getattr(node, 'decorator_list', [])])
+            # depths[i] is the cost of cutting after line i, i.e. before line i + 1 (1-based start)
+            if start >= 2:
+                depths[start - 2] = min(depths[start - 2], level)
+            if level < 2 and isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                mark(node.body, level + 1)
+    
+    mark(tree.body, 0)
+    return depths
+
+
+def _brace_boundaries(lines: List[str]) -> List[int]:
+    """Boundary depths for brace languages: the brace nesting depth at the end of each line."""
+    depths = []
+    depth = 0
+    in_block_comment = False
+    for line in lines:
+        quote = None
+        i = 0
+        while i < len(line):
+            ch = line[i]
+            if in_block_comment:
+                if line.startswith('*/', i):
+                    in_block_comment = False
+                    i += 1
+            elif quote:
+                if ch == '\\':
+                    i += 1
+                elif ch == quote:
+                    quote = None
+            elif line.startswith('//', i):
+                break
+            elif line.startswith('/*', i):
+                in_block_comment = True
+                i += 1
+            elif ch in '"\'`':
+                quote = ch
+            elif ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth = max(0, depth - 1)
+            i += 1
+        depths.append(NO_BOUNDARY if in_block_comment else depth)
+    return depths
+
+
+def _indent_boundaries(lines: List[str]) -> List[int]:
+    """Boundary depths from indentation: the indentation level of the next non-blank line."""
+    depths = [NO_BOUNDARY] * len(lines)
+    next_depth = 0
+    for i in range(len(lines) - 1, -1, -1):
+        depths[i] = next_depth
+        stripped = lines[i].lstrip()
+        if stripped:
+            indent = len(lines[i]) - len(stripped)
+            # Never cut in front of a closing line such as Ruby's "end"
+            closing = stripped.split()[0] in ('end', '}', ')', ']', '</html>', '</body>')
+            next_depth = NO_BOUNDARY if closing else indent // 2
+    return depths
+
+
+def boundary_depths(path: str, language: str, lines: List[str]) -> List[int]:
+    """Return, for every line, how deeply nested a cut right after that line would be."""
+    if language == 'Python':
+        try:
+            return _python_boundaries(lines)
+        except (SyntaxError, ValueError):
+            return _indent_boundaries(lines)
+    if language in BRACE_LANGUAGES or extract_file_extension(path).lower() in BRACE_EXTENSIONS:
+        return _brace_boundaries(lines)
+    return _indent_boundaries(lines)
+
+
+def split_file(path: str, language: str, content: str, budget: int) -> List[ChunkPart]:
+    """Split a file into parts of at most `budget` tokens, cutting at the shallowest syntax boundaries."""
+    total = count_tokens(content)
+    if total <= budget:
+        return [ChunkPart(path, language, content, total)]
+    
+    lines = content.split("\n")
+    depths = boundary_depths(path, language, lines)
+    line_tokens = [count_tokens(line) + 1 for line in lines]
+    
+    parts = []
+    start = 0
+    while start < len(lines):
+        # Find how far the budget reaches from the current start line
+        end = start
+        tokens = line_tokens[start]
+        while end + 1 < len(lines) and tokens + line_tokens[end + 1] <= budget:
+            end += 1
+            tokens += line_tokens[end]
+        
+        # Cut after the shallowest boundary within reach, preferring the furthest one
+        if end + 1 < len(lines):
+            cut = min(range(start, end + 1), key=lambda i: (depths[i], -i))
+        else:
+            cut = end
+        code = "\n".join(lines[start:cut + 1])
+        parts.append(ChunkPart(path, language, code, sum(line_tokens[start:cut + 1])))
+        start = cut + 1
+    return parts
+
+
+def iter_chunks(files: Iterable[Tuple[str, str, str]], budget: int, max_files: int) -> Iterator[Chunk]:
+    """Pack (path, language, content) files into analysis chunks of at most `budget` tokens.
+    
+    Large files are split along function and class boundaries; small files are packed
+    together, at most `max_files` per chunk.
+    """
+    current = Chunk()
+    for path, language, content in files:
+        if not content:
+            continue
+        for part in split_file(path, language, content, budget):
+            if current.parts and (current.tokens + part.tokens > budget or len(current.parts) >= max_files):
+                yield current
+                current = Chunk()
+            current.add(part)
+    if current.parts:
+        yield current
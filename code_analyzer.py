@@ -1,96 +1,225 @@
 import os
-import glob
-from typing import Dict, List, Any
-import git
-from utils import extract_file_extension, detect_programming_language, clean_code_for_llm
+import hashlib
+import subprocess
+from typing import Dict, List, Any, Iterator, Optional
+from config import SCAN_WORKERS, DEDUPLICATE, NEAR_DUPLICATE_THRESHOLD, GIT_HISTORY, GIT_HISTORY_MAX_COMMITS
+from dedupe import find_duplicates
+from git_history import HistoryIndex
+from metrics import Metrics
+from parallel_scan import ScanPools, ScanStats, parse_files
+from scan_model import DirectoryNode, SourceFile
+from structure_index import StructureIndex
+from traversal import SourceTree
+from utils import extract_file_extension, detect_programming_language
+
+# File extensions that are analyzed as source code
+SOURCE_EXTENSIONS = ['py', 'js', 'ts', 'java', 'cpp', 'c', 'cs', 'go', 'rb', 'php', 'html', 'css', 'json']
+
+# Filename patterns that suggest an important module (used to break ties in centrality)
+KEY_COMPONENT_PATTERNS = ['main', 'app', 'index', 'core', 'service']
+
+# Number of most central files reported as key components
+KEY_COMPONENT_COUNT = 10
+
 
 class CodeAnalyzer:
-    def __init__(self, source_dir: str):
+    def __init__(self, source_dir: str, cache_dir: Optional[str] = None, scan_workers: int = SCAN_WORKERS,
+                 metrics: Optional[Metrics] = None, scan_pools: Optional[ScanPools] = None,
+                 memory: Optional[Dict[str, Any]] = None):
         self.source_dir = source_dir
+        self.metrics = metrics or Metrics()
+        self.cache_dir = cache_dir
+        self.scan_workers = scan_workers
+        # Pools shared with other scans (batch mode); by default each scan starts its own
+        self.scan_pools = scan_pools
+        # Indexes kept in memory between scans by a long-running server; read from the cache files otherwise
+        self.memory = memory
         self.git_repo = None
+        # GitPython is only loaded once a scan starts, which keeps `main.py --help` fast
+        import git
         try:
-            self.git_repo = git.Repo(source_dir)
+            self.git_repo = git.Repo(source_dir, search_parent_directories=True)
         except git.InvalidGitRepositoryError:
             print("Warning: Not a git repository. Git-based analysis will be skipped.")
     
     def analyze(self) -> Dict[str, Any]:
         """Analyze source code and return structured information."""
-        result = {
-            "files": self._collect_files(),
-            "project_structure": self._analyze_project_structure(),
-            "languages": self._detect_languages(),
-            "git_info": self._extract_git_info() if self.git_repo else None,
-            "key_components": self._identify_key_components()
-        }
+        with self.metrics.span("scan") as span:
+            result = self._scan()
+            span["files"] = len(result["files"])
+            span["bytes"] = result["scan_stats"]["bytesRead"]
+        with self.metrics.span("git_info", "scan"):
+            result["git_info"] = self._extract_git_info() if self.git_repo else None
+        with self.metrics.span("git_history", "scan"):
+            result["git_history"] = self._index_history() if self.git_repo and GIT_HISTORY else None
         return result
-    
-    def _collect_files(self) -> List[Dict[str, Any]]:
-        """Collect relevant source files for analysis."""
-        files = []
-        for root, _, filenames in os.walk(self.source_dir):
-            for filename in filenames:
-                # Skip hidden files, build artifacts, etc.
-                if filename.startswith('.') or any(p in root for p in ['node_modules', '__pycache__', 'build', 'dist']):
-                    continue
-                    
-                file_path = os.path.join(root, filename)
-                relative_path = os.path.relpath(file_path, self.source_dir)
+
+    def _walk_files(self, structure: DirectoryNode) -> Iterator[SourceFile]:
+        """Walk the source tree once, filling in the directory trie and yielding source files."""
+        nodes = {'.': structure}
+        for rel_root, dirs, filenames in SourceTree(self.source_dir, self.git_repo).walk():
+            node = nodes.pop(rel_root, None)
+            if node is None:
+                continue
+            
+            visible = [f for f in filenames if not f.startswith('.')]
+            if rel_root != '.':
+                node.set_files(visible)
+            for d in dirs:
+                nodes[d if rel_root == '.' else f"{rel_root}/{d}"] = node.add_directory(d)
+            
+            root = self.source_dir if rel_root == '.' else os.path.join(self.source_dir, rel_root)
+            for filename in visible:
                 ext = extract_file_extension(filename)
-                
                 # Skip binary files and other non-code files
-                if ext not in ['py', 'js', 'ts', 'java', 'cpp', 'c', 'cs', 'go', 'rb', 'php', 'html', 'css', 'json']:
+                if ext not in SOURCE_EXTENSIONS:
+                    continue
+                
+                file_path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(file_path)
+                except OSError as e:
+                    print(f"Error reading {file_path}: {e}")
                     continue
                 
-                with open(file_path, 'r', errors='ignore') as f:
-                    try:
-                        content = f.read()
-                        files.append({
-                            "path": relative_path,
-                            "language": detect_programming_language(ext),
-                            "content": clean_code_for_llm(content),
-                            "size": len(content)
-                        })
-                    except Exception as e:
-                        print(f"Error reading {file_path}: {e}")
+                yield SourceFile(
+                    directory=node,
+                    name=filename,
+                    language=detect_programming_language(ext),
+                    size=stat.st_size,
+                    mtime=stat.st_mtime
+                )
+
+    def _scan(self) -> Dict[str, Any]:
+        """Collect files, languages, project structure and the structural index in a single pass."""
+        structure = DirectoryNode(self.source_dir)
+        files = []
+        languages = {}
         
-        return files
-    
-    def _analyze_project_structure(self) -> Dict[str, Any]:
-        """Analyze project directory structure."""
-        structure = {"directories": {}}
+        index = StructureIndex(root_package=os.path.basename(os.path.abspath(self.source_dir)))
+        index_cache = self._index_cache_file()
+        warm = self._remembered("structure_index")
+        if warm is not None:
+            index.reuse(warm)
+        elif index_cache:
+            index.load(index_cache)
         
-        for root, dirs, files in os.walk(self.source_dir):
-            # Skip hidden directories and common ignore patterns
-            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ['node_modules', '__pycache__', 'build', 'dist']]
-            
-            rel_path = os.path.relpath(root, self.source_dir)
-            if rel_path == '.':
-                continue
-                
-            parts = rel_path.split(os.sep)
-            current = structure["directories"]
-            
-            for i, part in enumerate(parts):
-                if part not in current:
-                    current[part] = {"directories": {}, "files": []}
-                
-                if i == len(parts) - 1:
-                    # Add files to the deepest directory level
-                    current[part]["files"] = [f for f in files if not f.startswith('.')]
-                
-                current = current[part]["directories"]
+        stats = ScanStats()
+        
+        def uncached_files():
+            for file_info in self._walk_files(structure):
+                files.append(file_info)
+                # Files are only read and parsed when their cached parse result is stale
+                parsed = index.cached(file_info.path, [file_info.size, file_info.mtime])
+                if parsed is not None:
+                    stats.cached += 1
+                    index.add_file(file_info.path, file_info.language, parsed)
+                else:
+                    yield file_info
+        
+        for file_info, parsed in parse_files(uncached_files(), self.scan_workers, stats, self.scan_pools):
+            index.add_file(file_info.path, file_info.language, parsed)
+        stats.finish()
+        print(stats.report())
+        
+        # Binary files are dropped after sniffing their first bytes
+        files = [file_info for file_info in files if not index.is_binary(file_info.path)]
+        for file_info in files:
+            file_info.content_hash = index.content_hash(file_info.path)
+            languages[file_info.language] = languages.get(file_info.language, 0) + 1
         
-        return structure
+        index.build()
+        if index_cache:
+            index.save(index_cache)
+        self._remember("structure_index", index)
+        
+        duplicate_clusters = self._find_duplicates(files, index) if DEDUPLICATE else {}
+        
+        return {
+            "files": files,
+            "project_structure": structure,
+            "languages": languages,
+            "key_components": self._identify_key_components(files, index),
+            "structure_index": index,
+            "duplicate_clusters": duplicate_clusters,
+            "scan_stats": stats.to_dict()
+        }
     
-    def _detect_languages(self) -> Dict[str, int]:
-        """Detect programming languages used in the project."""
-        languages = {}
+    def _find_duplicates(self, files: List[SourceFile], index: StructureIndex) -> Dict[str, List[str]]:
+        """Cluster exact and near-duplicate files; returns {representative path: [member paths]}."""
+        with self.metrics.span("deduplicate", "scan") as span:
+            clusters = find_duplicates(
+                [(file.path, file.language, file.content_hash, index.signature(file.path)) for file in files],
+                NEAR_DUPLICATE_THRESHOLD,
+                index.rank
+            )
+            duplicates = sum(len(members) for members in clusters.values())
+            span["files"] = duplicates
+        if clusters:
+            print(f"Duplicates: {duplicates} files are copies or near copies of {len(clusters)} others "
+                  f"and reuse their analysis")
+        return clusters
+    
+    def _identify_key_components(self, files: List[SourceFile], index: StructureIndex) -> List[Dict[str, Any]]:
+        """Pick the most central files of the import graph as key components."""
+        languages = {file_info.path: file_info.language for file_info in files}
+        dependents = index.dependents()
         
-        for file_info in self._collect_files():
-            lang = file_info["language"]
-            languages[lang] = languages.get(lang, 0) + 1
+        def score(path: str):
+            # Centrality first; the filename heuristic only breaks ties (e.g. when there are no imports)
+            filename = os.path.basename(path).lower()
+            return (index.rank.get(path, 0.0), any(pattern in filename for pattern in KEY_COMPONENT_PATTERNS))
         
-        return languages
+        ranked = sorted(languages, key=lambda path: (score(path), path), reverse=True)
+        return [
+            {
+                "path": path,
+                "type": "Core Component",
+                "language": languages[path],
+                "centrality": round(index.rank.get(path, 0.0), 4),
+                "dependents": len(dependents.get(path, []))
+            }
+            for path in ranked[:KEY_COMPONENT_COUNT]
+        ]
+    
+    def _index_cache_file(self, name: str = "structure_index") -> Optional[str]:
+        """Location of a cached index for this source directory, if caching is enabled."""
+        if not self.cache_dir:
+            return None
+        source_id = hashlib.sha256(os.path.abspath(self.source_dir).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{name}_{source_id}.json")
+    
+    def _index_history(self) -> Optional[HistoryIndex]:
+        """Mine churn, ownership and change coupling from the git history, reading only new commits."""
+        history = self._remembered("git_history")
+        cache_file = self._index_cache_file("git_history")
+        if history is None:
+            history = HistoryIndex()
+            if cache_file:
+                history.load(cache_file)
+        indexed, indexed_head = history.commits, history.head
+        try:
+            history.update(self.source_dir, self.git_repo.head.commit.hexsha, GIT_HISTORY_MAX_COMMITS)
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            print(f"Warning: Could not read the git history ({e}). Churn data will not be used.")
+            # A partly updated index is not kept; the next scan starts from the cache file again
+            self._remember("git_history", None)
+            return None
+        if cache_file and history.head != indexed_head:
+            history.save(cache_file)
+        self._remember("git_history", history)
+        print(f"History: {history.commits} commits indexed ({history.commits - indexed} new), "
+              f"{len(history.files)} files with changes")
+        return history
+    
+    def _remembered(self, name: str):
+        if self.memory is None:
+            return None
+        return self.memory.get(f"{name}:{os.path.abspath(self.source_dir)}")
+    
+    def _remember(self, name: str, index):
+        if self.memory is not None:
+            self.memory[f"{name}:{os.path.abspath(self.source_dir)}"] = index
     
     def _extract_git_info(self) -> Dict[str, Any]:
         """Extract useful information from git repository."""
@@ -100,7 +229,9 @@ class CodeAnalyzer:
         commits = list(self.git_repo.iter_commits(max_count=10))
         
         return {
-            "active_branch": self.git_repo.active_branch.name,
+            # None when HEAD is detached, as in CI checkouts and the server's worktrees
+            "active_branch": None if self.git_repo.head.is_detached else self.git_repo.active_branch.name,
+            "head_commit": self.git_repo.head.commit.hexsha,
             "recent_commits": [
                 {
                     "hash": commit.hexsha,
@@ -111,21 +242,32 @@ class CodeAnalyzer:
                 for commit in commits
             ]
         }
-    
-    def _identify_key_components(self) -> List[Dict[str, Any]]:
-        """Identify key components in the codebase."""
-        # This is a simplified implementation
-        # In a real system, you'd use more sophisticated heuristics
-        key_components = []
+
+    def diff_since(self, ref: str) -> Dict[str, List[str]]:
+        """Return source-relative paths added, modified and deleted since a git ref.
+        
+        The diff is taken against the working tree, so uncommitted and untracked files are included.
+        """
+        changes = {"added": [], "modified": [], "deleted": []}
+        prefix = os.path.relpath(os.path.abspath(self.source_dir), self.git_repo.working_tree_dir)
+        relative = [] if prefix == '.' else [f"--relative={prefix}"]
+        
+        output = self.git_repo.git.diff("--name-status", "-M", *relative, ref)
+        for line in output.splitlines():
+            fields = line.split('\t')
+            status = fields[0][:1]
+            if status == 'R':
+                changes["deleted"].append(fields[1])
+                changes["added"].append(fields[2])
+            elif status in ('A', 'C'):
+                changes["added"].append(fields[-1])
+            elif status == 'D':
+                changes["deleted"].append(fields[1])
+            else:
+                changes["modified"].append(fields[1])
         
-        # Look for patterns that might indicate important modules
-        for file_info in self._collect_files():
-            filename = os.path.basename(file_info["path"])
-            if any(pattern in filename.lower() for pattern in ['main', 'app', 'index', 'core', 'service']):
-                key_components.append({
-                    "path": file_info["path"],
-                    "type": "Core Component",
-                    "language": file_info["language"]
-                })
+        untracked = self.git_repo.git.ls_files("--others", "--exclude-standard", "--", prefix)
+        for path in untracked.splitlines():
+            changes["added"].append(path if prefix == '.' else os.path.relpath(path, prefix))
         
-        return key_components
+        return {kind: [os.path.normpath(path) for path in paths] for kind, paths in changes.items()}
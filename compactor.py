@@ -0,0 +1,284 @@
+import re
+import ast
+import os
+from typing import Dict, List, Optional, Tuple
+from chunker import BRACE_LANGUAGES, NO_BOUNDARY, boundary_depths
+from utils import clean_code_for_llm
+
+# Comment syntax per language (as returned by detect_programming_language) or, for languages
+# detected as "Unknown", per file extension
+# "strings" are string delimiters; only the multi-line ones (triple quotes, template strings) span lines
+C_STYLE = {"line": ["//"], "block": [("/*", "*/")], "doc": ["/**", "///", "//!"], "strings": ['"', "'", "`"]}
+LANGUAGE_SYNTAX = {
+    'Python': {"line": ["#"], "block": [], "doc": [], "strings": ['"""', "'''", '"', "'"]},
+    'Ruby': {"line": ["#"], "block": [("=begin", "=end")], "doc": [], "strings": ['"', "'"]},
+    'PHP': {"line": ["//", "#"], "block": [("/*", "*/")], "doc": ["/**"], "strings": ['"', "'"]},
+    'css': {"line": [], "block": [("/*", "*/")], "doc": [], "strings": ['"', "'"]},
+    'html': {"line": [], "block": [("<!--", "-->")], "doc": [], "strings": []},
+    'json': {"line": [], "block": [], "doc": [], "strings": ['"']},
+}
+MULTILINE_STRINGS = ['"""', "'''", "`"]
+for _language in BRACE_LANGUAGES:
+    LANGUAGE_SYNTAX.setdefault(_language, C_STYLE)
+
+# Comments containing these are dropped even when they are doc comments
+LICENSE_MARKERS = ['copyright', 'license', 'spdx-license-identifier', 'all rights reserved']
+# Doc comments are kept, shortened to this many lines
+DOC_COMMENT_MAX_LINES = 3
+# Runs of this many data-only lines (literal tables) or same-shaped lines are collapsed
+LITERAL_RUN_LINES = 12
+REPEATED_RUN_LINES = 8
+# Lines kept at the start of a collapsed run
+RUN_KEEP_LINES = 3
+# A file whose average line is this long is treated as minified or generated
+MINIFIED_AVERAGE_LINE = 300
+MINIFIED_KEEP_CHARS = 500
+# Placeholder for removed comments, so lines that held only a comment can be dropped
+_REMOVED = "\x00"
+
+# String and number literals, and the names that may appear in a data-only line
+_LITERAL_RE = re.compile(r'"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|\b(?:0[xX][0-9a-fA-F]+|\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)\b')
+_DATA_NAME_RE = re.compile(r'\b(?:true|false|null|None|True|False|nil|undefined)\b|[A-Za-z_]\w*\s*:(?!:)')
+_NAME_RE = re.compile(r'[A-Za-z_]')
+_IMPORT_RE = re.compile(r'^\s*(import|from|#include|using|require|use|package)\b')
+_BRACKET_RE = re.compile(r'[()\[\]{}]')
+_CONTAINER_RE = re.compile(r'\b(class|interface|struct|impl|namespace|trait|enum|object|module|extension|protocol)\b')
+
+
+def syntax_for(language: str, path: str) -> Optional[Dict]:
+    """Comment syntax for a file, or None when the language is not known."""
+    syntax = LANGUAGE_SYNTAX.get(language)
+    if syntax is None:
+        syntax = LANGUAGE_SYNTAX.get(os.path.splitext(path)[1][1:].lower())
+    return syntax
+
+
+def compact_code(code: str, language: str, path: str = "", signatures_only: bool = False) -> str:
+    """Shrink source code before it is sent to the LLM without losing what the analysis needs.
+
+    License headers and comments are removed (doc comments are shortened), minified files are
+    reduced to a short sample, literal tables and runs of same-shaped lines are collapsed and
+    blank runs are squeezed. With signatures_only, function bodies are replaced by their signatures.
+    """
+    syntax = syntax_for(language, path)
+    if _is_minified(code, path):
+        return clean_code_for_llm(
+            code[:MINIFIED_KEEP_CHARS] + "\n" + _note(syntax, f"minified or generated code omitted: {len(code)} characters")
+        )
+    if syntax is not None:
+        code = _strip_comments(code, syntax)
+    if signatures_only:
+        if language == 'Python':
+            code = _python_signatures(code)
+        elif language in BRACE_LANGUAGES:
+            code = _brace_signatures(code, path, language, syntax)
+    lines = _collapse_runs(code.split("\n"), syntax)
+    return clean_code_for_llm(_squeeze_blank_lines(lines))
+
+
+def _note(syntax: Optional[Dict], text: str) -> str:
+    """Render a note as a comment in the file's language."""
+    if syntax and syntax["line"]:
+        return f"{syntax['line'][0]} ... {text}"
+    if syntax and syntax["block"]:
+        start, end = syntax["block"][0]
+        return f"{start} ... {text} {end}"
+    return f"... {text}"
+
+
+def _is_minified(code: str, path: str) -> bool:
+    name = os.path.basename(path)
+    if '.min.' in name:
+        return True
+    lines = code.count("\n") + 1
+    return len(code) > MINIFIED_KEEP_CHARS * 4 and len(code) / lines > MINIFIED_AVERAGE_LINE
+
+
+def _is_license(comment: str) -> bool:
+    lowered = comment.lower()
+    return any(marker in lowered for marker in LICENSE_MARKERS)
+
+
+def _comment_pattern(syntax: Dict) -> "re.Pattern":
+    """One regex matching the strings and comments of a language, so a single pass can tell them apart."""
+    pattern = syntax.get("pattern")
+    if pattern is None:
+        alternatives = []
+        for delimiter in syntax["strings"]:
+            d = re.escape(delimiter)
+            if delimiter in MULTILINE_STRINGS:
+                body = rf'[\s\S]*?(?:(?<!\\){d}|$)' if len(delimiter) == 3 else rf'(?:[^{d}\\]|\\.)*{d}?'
+            else:
+                # A stray quote (e.g. in a regular expression) ends at the line
+                body = rf'(?:[^{d}\\\n]|\\.)*{d}?'
+            alternatives.append(rf'(?P<s{len(alternatives)}>{d}{body})')
+        alternatives += [rf'{re.escape(start)}[\s\S]*?(?:{re.escape(end)}|$)' for start, end in syntax["block"]]
+        alternatives += [rf'{re.escape(prefix)}[^\n]*' for prefix in syntax["line"]]
+        pattern = syntax["pattern"] = re.compile("|".join(alternatives) or r'(?!)')
+    return pattern
+
+
+def _strip_comments(code: str, syntax: Dict) -> str:
+    """Remove comments, leaving strings alone; doc comments are shortened instead."""
+    def replace(match: "re.Match") -> str:
+        text = match.group(0)
+        if match.lastgroup:
+            return text
+        if any(text.startswith(prefix) for prefix in syntax["doc"]) and not _is_license(text):
+            block_end = next((end for start, end in syntax["block"] if text.startswith(start)), None)
+            return _shorten_doc_comment(text, block_end) if block_end else text
+        # Keep line breaks so that lines holding only the comment can be dropped
+        return (_REMOVED + "\n") * text.count("\n") + _REMOVED
+    
+    return _drop_removed(_comment_pattern(syntax).sub(replace, code))
+
+
+def _shorten_doc_comment(comment: str, end: str) -> str:
+    lines = comment.split("\n")
+    if len(lines) <= DOC_COMMENT_MAX_LINES:
+        return comment
+    indent = re.match(r'\s*', lines[-1]).group(0)
+    return "\n".join(lines[:DOC_COMMENT_MAX_LINES] + [f"{indent}... {end}"])
+
+
+def _drop_removed(code: str) -> str:
+    """Drop lines that held only comments and remove the placeholders from the rest."""
+    return "\n".join(
+        line.replace(_REMOVED, "").rstrip() if _REMOVED in line else line
+        for line in code.split("\n")
+        if not (_REMOVED in line and not line.replace(_REMOVED, "").strip())
+    )
+
+
+def _line_shapes(lines: List[str]) -> List[Tuple[str, bool]]:
+    """Return every line with its literals abstracted, and whether it holds only data."""
+    # One substitution over the whole text; literals never span lines, so lines stay aligned
+    shapes = []
+    for shape in _LITERAL_RE.sub("0", "\n".join(lines)).split("\n"):
+        shape = shape.strip()
+        # Data lines hold literals and no names besides literal words and record keys
+        is_data = "0" in shape and (not _NAME_RE.search(shape) or not _NAME_RE.search(_DATA_NAME_RE.sub("", shape)))
+        shapes.append((shape, is_data))
+    return shapes
+
+
+def _self_contained_lines(lines: List[str], syntax: Optional[Dict]) -> List[bool]:
+    """Return for every line whether it opens no bracket it does not close and continues no expression.
+
+    Brackets in strings and comments are not counted. Runs are collapsed only over such lines, so the
+    omitted lines never hold part of a multi-line expression.
+    """
+    text = "\n".join(lines)
+    if syntax is not None:
+        # Strings and comments (which may span lines) are blanked, keeping the line breaks
+        text = _comment_pattern(syntax).sub(lambda match: "\n" * match.group(0).count("\n"), text)
+    else:
+        text = _LITERAL_RE.sub("0", text)
+    contained = []
+    depth = 0
+    continued = False
+    for line in text.split("\n"):
+        start = lowest = depth
+        for bracket in _BRACKET_RE.findall(line):
+            depth += 1 if bracket in "([{" else -1
+            lowest = min(lowest, depth)
+        contained.append(not continued and lowest == start == depth)
+        continued = line.rstrip().endswith("\\")
+    return contained
+
+
+def _collapse_runs(lines: List[str], syntax: Optional[Dict]) -> List[str]:
+    """Collapse literal tables and runs of lines with the same shape, keeping their first lines."""
+    shapes = _line_shapes(lines)
+    contained = _self_contained_lines(lines, syntax)
+    out = []
+    i = 0
+    while i < len(lines):
+        shape, is_data = shapes[i]
+        j = i + 1
+        if not contained[i]:
+            limit = None
+        elif is_data:
+            while j < len(lines) and shapes[j][1] and contained[j]:
+                j += 1
+            limit = LITERAL_RUN_LINES
+        elif shape and not _IMPORT_RE.match(lines[i]):
+            while j < len(lines) and shapes[j][0] == shape and contained[j]:
+                j += 1
+            limit = REPEATED_RUN_LINES
+        else:
+            limit = None
+        if limit is not None and j - i >= limit:
+            indent = lines[i][:len(lines[i]) - len(lines[i].lstrip())]
+            out.extend(lines[i:i + RUN_KEEP_LINES])
+            out.append(indent + _note(syntax, f"{j - i - RUN_KEEP_LINES - 1} similar lines omitted"))
+            out.append(lines[j - 1])
+        else:
+            out.extend(lines[i:j])
+        i = j
+    return out
+
+
+def _squeeze_blank_lines(lines: List[str]) -> str:
+    out = []
+    for line in lines:
+        line = line.rstrip()
+        if line or (out and out[-1]):
+            out.append(line)
+    return "\n".join(out)
+
+
+def _python_signatures(code: str) -> str:
+    """Replace the bodies of Python functions with '...', keeping signatures and docstrings."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return code
+    lines = code.split("\n")
+    replacements = []
+
+    def visit(body):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                statements = node.body
+                if statements and isinstance(statements[0], ast.Expr) and isinstance(statements[0].value, ast.Constant) \
+                        and isinstance(statements[0].value.value, str):
+                    statements = statements[1:]
+                if statements:
+                    # A decorated statement starts at its first decorator
+                    first = min([statements[0].lineno] + [decorator.lineno for decorator in
+                                                          getattr(statements[0], 'decorator_list', [])])
+                    indent = lines[statements[0].lineno - 1][:statements[0].col_offset]
+                    replacements.append((first - 1, statements[-1].end_lineno, indent + "..."))
+            elif isinstance(node, ast.ClassDef):
+                visit(node.body)
+
+    visit(tree.body)
+    for start, end, text in reversed(replacements):
+        lines[start:end] = [text]
+    return "\n".join(lines)
+
+
+def _brace_signatures(code: str, path: str, language: str, syntax: Dict) -> str:
+    """Keep declarations at the top level and inside classes; drop what is inside other blocks."""
+    lines = code.split("\n")
+    depths = boundary_depths(path, language, lines)
+    out = []
+    kinds = []  # for each open brace level, whether it is a container (class, namespace, ...)
+    depth = 0
+    for line, end_depth in zip(lines, depths):
+        if end_depth == NO_BOUNDARY:
+            end_depth = depth
+        visible = all(kinds)
+        if visible:
+            if end_depth > depth and not _CONTAINER_RE.search(line):
+                # Opening a function body: keep the signature only
+                out.append(line.rstrip() + " ... }")
+            else:
+                out.append(line)
+        if end_depth > depth:
+            kinds.extend([bool(_CONTAINER_RE.search(line)) and visible] * (end_depth - depth))
+        else:
+            del kinds[end_depth:]
+        depth = end_depth
+    return "\n".join(out)
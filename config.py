@@ -16,9 +16,29 @@ MODEL_NAME = "gemini-2.0-flash-exp"
 TEMPERATURE = 0.2
 MAX_OUTPUT_TOKENS = 4096
 
-# Document generation settings
-ANALYSIS_CHUNK_SIZE = 4000
-ANALYSIS_CHUNK_OVERLAP = 200
+# Number of threads reading and processes parsing files during the scan (1 = no pools)
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", str(os.cpu_count() or 1)))
+
+# Document generation settings: code tokens per component analysis request, and how many
+# small files may be packed into one request (bounded by what fits in MAX_OUTPUT_TOKENS)
+ANALYSIS_CHUNK_TOKENS = int(os.getenv("ANALYSIS_CHUNK_TOKENS", "6000"))
+MAX_FILES_PER_CHUNK = int(os.getenv("MAX_FILES_PER_CHUNK", "8"))
+
+# Prompt compaction: "standard" strips comments, license headers, minified code and literal tables
+# before analysis, "off" sends files as they are. The least important SIGNATURE_ONLY_FRACTION of
+# files is analyzed from signatures only (function bodies removed).
+COMPACTION_MODE = os.getenv("COMPACTION_MODE", "standard")
+SIGNATURE_ONLY_FRACTION = float(os.getenv("SIGNATURE_ONLY_FRACTION", "0"))
+
+# Duplicate detection: exact copies and files at least NEAR_DUPLICATE_THRESHOLD similar (estimated
+# Jaccard similarity of word shingles) are analyzed once, through a representative file
+DEDUPLICATE = os.getenv("DEDUPLICATE", "true").lower() == "true"
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.85"))
+
+# Git history mining: churn, ownership and change coupling from `git log --numstat`. The first run
+# reads at most GIT_HISTORY_MAX_COMMITS recent commits (0 = all); later runs only read new ones.
+GIT_HISTORY = os.getenv("GIT_HISTORY", "true").lower() == "true"
+GIT_HISTORY_MAX_COMMITS = int(os.getenv("GIT_HISTORY_MAX_COMMITS", "20000"))
 
 # LangSmith Configuration - updated variable names
 LANGSMITH_TRACING = os.getenv("LANGSMITH_TRACING", "true").lower() == "true"
@@ -31,3 +51,59 @@ LANGCHAIN_TRACING_V2 = LANGSMITH_TRACING
 LANGCHAIN_ENDPOINT = LANGSMITH_ENDPOINT
 LANGCHAIN_API_KEY = LANGSMITH_API_KEY
 LANGCHAIN_PROJECT = LANGSMITH_PROJECT
+
+# Result cache settings
+CACHE_DIR = os.getenv("SPEC_DOC_CACHE_DIR", ".spec_doc_cache")
+CACHE_MAX_SIZE_MB = float(os.getenv("SPEC_DOC_CACHE_MAX_SIZE_MB", "512"))
+CACHE_MAX_AGE_DAYS = float(os.getenv("SPEC_DOC_CACHE_MAX_AGE_DAYS", "30"))
+
+# Batch mode: repositories scanned and documented at the same time (LLM calls share one limit)
+BATCH_REPO_CONCURRENCY = int(os.getenv("BATCH_REPO_CONCURRENCY", "4"))
+
+# LLM concurrency and rate limiting
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+
+# Model routing (model_router.py). With LIGHT_MODEL_NAME set, component analyses of routine files go to
+# that cheaper model, with its own output cap and concurrency limit. A chunk stays on MODEL_NAME when it
+# holds one of the STRONG_TIER_FRACTION most important files or more than LIGHT_TIER_MAX_CHUNK_TOKENS
+# of code. Directory summaries, the overview and integration also stay on MODEL_NAME. A call that fails
+# with a 429/5xx after its retries, or runs longer than LLM_CALL_TIMEOUT seconds (0 = no limit), is
+# tried once more on the other model.
+LIGHT_MODEL_NAME = os.getenv("LIGHT_MODEL_NAME", "")
+LIGHT_MAX_OUTPUT_TOKENS = int(os.getenv("LIGHT_MAX_OUTPUT_TOKENS", str(MAX_OUTPUT_TOKENS)))
+LIGHT_MAX_CONCURRENCY = int(os.getenv("LIGHT_MAX_CONCURRENCY", "8"))
+STRONG_TIER_FRACTION = float(os.getenv("STRONG_TIER_FRACTION", "0.2"))
+LIGHT_TIER_MAX_CHUNK_TOKENS = int(os.getenv("LIGHT_TIER_MAX_CHUNK_TOKENS", str(ANALYSIS_CHUNK_TOKENS)))
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "180" if LIGHT_MODEL_NAME else "0"))
+
+# Map-reduce settings: maximum estimated tokens of analyses fed into a single reduce or integration prompt
+REDUCE_TOKEN_BUDGET = int(os.getenv("REDUCE_TOKEN_BUDGET", "24000"))
+STRUCTURE_TOKEN_BUDGET = int(os.getenv("STRUCTURE_TOKEN_BUDGET", "2000"))
+# Estimated tokens of summaries and retrieved component analyses in the integration prompt
+INTEGRATION_CONTEXT_TOKENS = int(os.getenv("INTEGRATION_CONTEXT_TOKENS", "12000"))
+
+# Times a response that does not match its schema is re-prompted (only that request is repeated)
+STRUCTURED_OUTPUT_RETRIES = int(os.getenv("STRUCTURED_OUTPUT_RETRIES", "1"))
+
+# Run budget: maximum estimated prompt tokens and LLM calls per run (0 = unlimited). Up to
+# BUDGET_RESERVE_FRACTION of it is held back for the overview and integration, and up to
+# SUMMARY_BUDGET_FRACTION for the directory summaries the plan covers (the largest directories first).
+MAX_RUN_TOKENS = int(os.getenv("MAX_RUN_TOKENS", "0"))
+MAX_RUN_CALLS = int(os.getenv("MAX_RUN_CALLS", "0"))
+BUDGET_RESERVE_FRACTION = float(os.getenv("BUDGET_RESERVE_FRACTION", "0.3"))
+SUMMARY_BUDGET_FRACTION = float(os.getenv("SUMMARY_BUDGET_FRACTION", "0.3"))
+
+# Documentation server (server.py): jobs run at the same time, jobs waiting in the queue, finished jobs kept
+SERVER_HOST = os.getenv("SPEC_DOC_SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SPEC_DOC_SERVER_PORT", "8765"))
+SERVER_WORKERS = int(os.getenv("SPEC_DOC_SERVER_WORKERS", "2"))
+SERVER_QUEUE_SIZE = int(os.getenv("SPEC_DOC_SERVER_QUEUE_SIZE", "16"))
+SERVER_JOB_HISTORY = int(os.getenv("SPEC_DOC_SERVER_JOB_HISTORY", "200"))
+SERVER_WORKDIR = os.getenv("SPEC_DOC_SERVER_WORKDIR", ".spec_doc_server")
+
+# Formats written by the export stage (exporter.py, --export): md, docx
+EXPORT_FORMATS = [fmt.strip() for fmt in os.getenv("EXPORT_FORMATS", "md,docx").split(",") if fmt.strip()]
@@ -0,0 +1,111 @@
+import re
+import zlib
+import struct
+from typing import Dict, List, Optional, Tuple
+
+# Words per shingle, and signature size (number of MinHash bins)
+SHINGLE_SIZE = 5
+SIGNATURE_BINS = 64
+# LSH banding: files whose signatures agree on all rows of any band become candidates.
+# 8 bands of 8 rows find pairs from a similarity of about (1/8)^(1/8) = 0.77 up.
+LSH_BANDS = 8
+LSH_ROWS = SIGNATURE_BINS // LSH_BANDS
+# Files with fewer shingles than this are too small to compare reliably (exact duplicates still count)
+MIN_SHINGLES = 20
+
+_TOKEN_RE = re.compile(r'\w+')
+_EMPTY_BIN = 0xFFFFFFFF
+# Bytes per bin in a signature
+BIN_BYTES = 4
+
+
+def minhash_signature(content: str) -> Optional[bytes]:
+    """MinHash signature of a file's word shingles, 4 bytes per bin, or None for very small files.
+
+    Uses one-permutation hashing: every shingle is hashed once and the hash picks both the bin and
+    the value, so the cost is linear in the file size. Empty bins borrow from the next filled bin.
+    """
+    tokens = _TOKEN_RE.findall(content)
+    shingles = len(tokens) - SHINGLE_SIZE + 1
+    if shingles < MIN_SHINGLES:
+        return None
+    bins = [_EMPTY_BIN] * SIGNATURE_BINS
+    for i in range(shingles):
+        value = zlib.crc32(" ".join(tokens[i:i + SHINGLE_SIZE]).encode())
+        slot = value % SIGNATURE_BINS
+        if value < bins[slot]:
+            bins[slot] = value
+    for slot in range(SIGNATURE_BINS):
+        offset = 1
+        while bins[slot] == _EMPTY_BIN:
+            bins[slot] = bins[(slot + offset) % SIGNATURE_BINS]
+            offset += 1
+    return struct.pack(f">{SIGNATURE_BINS}I", *bins)
+
+
+def similarity(first: bytes, second: bytes) -> float:
+    """Estimated Jaccard similarity of two signatures: the fraction of bins that agree."""
+    return sum(first[i:i + BIN_BYTES] == second[i:i + BIN_BYTES] for i in range(0, len(first), BIN_BYTES)) / SIGNATURE_BINS
+
+
+def find_duplicates(files: List[Tuple[str, str, Optional[str], Optional[bytes]]], threshold: float,
+                    rank: Optional[Dict[str, float]] = None) -> Dict[str, List[str]]:
+    """Group (path, language, content hash, signature) records into clusters of duplicate files.
+
+    Exact duplicates share a content hash; near duplicates are found with LSH over the signatures
+    and kept when their estimated similarity to the representative reaches `threshold`.
+    Returns {representative path: [member paths]} for clusters of two or more files. The
+    representative is the most central file (by `rank`), then the one with the shortest path.
+    """
+    rank = rank or {}
+    choose = lambda paths: min(paths, key=lambda path: (-rank.get(path, 0.0), len(path), path))
+
+    # Exact duplicates: same language and content hash
+    by_hash = {}
+    signatures = {}
+    for path, language, content_hash, signature in files:
+        if content_hash is not None:
+            by_hash.setdefault((language, content_hash), []).append(path)
+            if signature is not None:
+                signatures[path] = signature
+    exact = {}
+    for paths in by_hash.values():
+        exact[choose(paths)] = paths
+
+    # Near duplicates among the exact representatives: band the signatures into LSH buckets
+    parent = {path: path for path in exact}
+    languages = {path: language for path, language, _, _ in files}
+
+    def find(path: str) -> str:
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    buckets = {}
+    for path in exact:
+        signature = signatures.get(path)
+        if signature is None:
+            continue
+        for band in range(LSH_BANDS):
+            key = (languages[path], band, signature[band * LSH_ROWS * BIN_BYTES:(band + 1) * LSH_ROWS * BIN_BYTES])
+            other = buckets.setdefault(key, path)
+            if other != path and similarity(signature, signatures[other]) >= threshold:
+                parent[find(path)] = find(other)
+
+    groups = {}
+    for path in exact:
+        groups.setdefault(find(path), []).append(path)
+
+    clusters = {}
+    for group in groups.values():
+        representative = choose(group)
+        members = []
+        for path in group:
+            # Chained matches are only kept when they are close to the representative itself
+            if path == representative or similarity(signatures[path], signatures[representative]) >= threshold:
+                members.extend(member for member in exact[path] if member != representative)
+            else:
+                clusters.setdefault(path, []).extend(member for member in exact[path] if member != path)
+        clusters.setdefault(representative, []).extend(members)
+    return {path: sorted(members) for path, members in clusters.items() if members}
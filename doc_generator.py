@@ -1,249 +1,758 @@
 import os
 import json
+import time
+import asyncio
 from importlib import import_module
-from typing import Dict, Any, List
-from contextlib import nullcontext
-from langchain_google_genai import GoogleGenerativeAI
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema.document import Document
-from langchain.callbacks.tracers import LangChainTracer
-from langchain.callbacks.manager import CallbackManager
-from langsmith import Client
-from prompts import overview_prompt, component_prompt, integration_prompt
-from config import MODEL_NAME, TEMPERATURE, MAX_OUTPUT_TOKENS, GOOGLE_API_KEY, ANALYSIS_CHUNK_SIZE, ANALYSIS_CHUNK_OVERLAP
-from config import LANGSMITH_API_KEY, LANGSMITH_PROJECT, LANGSMITH_TRACING
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, List, Optional, Tuple, Type
+from cache import AnalysisCache
+from chunker import Chunk, ChunkPart
+from llm_runner import LLMRunner
+from model_router import ModelRouter, LIGHT_TIER, STRONG_TIER
+from planner import AnalysisPlan, Budget, BudgetExceeded, chunk_prompt_tokens, OVERVIEW_SAMPLE_TOKENS
+from retrieval import BM25Index, INTEGRATION_QUERIES, OVERVIEW_QUERIES, INTEGRATION_COMPONENTS, OVERVIEW_SAMPLE_FILES
+from retrieval import fuse_rankings, select_within_budget
+from scan_model import DirectoryNode
+from metrics import Metrics
+from utils import estimate_tokens, write_json_atomic
+from spec_writer import SpecWriter
+from journal import RunJournal, JOURNAL_FILE
+from output_parser import OutputParseError, parse_structured
+from schemas import ComponentAnalysis, ComponentBatch, OverviewDocument, IntegrationAnalysis, DirectorySummary
+from prompts import overview_prompt, component_prompt, multi_component_prompt, integration_prompt, directory_prompt
+from prompts import with_repair_instructions
+from config import MODEL_NAME, TEMPERATURE, MAX_OUTPUT_TOKENS, GOOGLE_API_KEY
+from config import LANGSMITH_API_KEY, LANGSMITH_PROJECT
+from config import REDUCE_TOKEN_BUDGET, STRUCTURE_TOKEN_BUDGET, STRUCTURED_OUTPUT_RETRIES, INTEGRATION_CONTEXT_TOKENS
+from config import LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY
+from config import LIGHT_MODEL_NAME, LIGHT_MAX_OUTPUT_TOKENS, LIGHT_MAX_CONCURRENCY, LLM_CALL_TIMEOUT
+
+def create_runner(llm=None, max_concurrency: int = LLM_MAX_CONCURRENCY, metrics: Optional[Metrics] = None) -> ModelRouter:
+    """Create the Gemini clients, with LangSmith tracing when configured, behind rate-limited runners.
+    
+    With LIGHT_MODEL_NAME set there is a second, light tier for routine component analyses; a passed-in
+    LLM (such as a local fake) then serves both tiers.
+    """
+    # The LLM client libraries are imported here, and only when needed, as they take seconds to load
+    callback_manager = None
+    if LANGSMITH_API_KEY:
+        from langchain.callbacks.tracers import LangChainTracer
+        from langchain.callbacks.manager import CallbackManager
+        tracer = LangChainTracer(project_name=LANGSMITH_PROJECT)
+        callback_manager = CallbackManager([tracer])
+        print(f"LangSmith tracing enabled for project: {LANGSMITH_PROJECT}")
+    else:
+        print("LangSmith API key not found. Tracing disabled.")
+    
+    # All tiers record into the same metrics
+    metrics = metrics or Metrics()
+    tiers = {STRONG_TIER: (MODEL_NAME, MAX_OUTPUT_TOKENS, max_concurrency)}
+    if LIGHT_MODEL_NAME:
+        tiers[LIGHT_TIER] = (LIGHT_MODEL_NAME, LIGHT_MAX_OUTPUT_TOKENS, LIGHT_MAX_CONCURRENCY)
+    runners = {}
+    for tier, (model, max_output_tokens, concurrency) in tiers.items():
+        tier_llm = llm
+        if tier_llm is None:
+            from langchain_google_genai import GoogleGenerativeAI
+            tier_llm = GoogleGenerativeAI(
+                model=model,
+                google_api_key=GOOGLE_API_KEY,
+                temperature=TEMPERATURE,
+                max_output_tokens=max_output_tokens,
+                callbacks=callback_manager
+            )
+        runners[tier] = LLMRunner(
+            tier_llm,
+            max_concurrency=concurrency,
+            requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+            max_retries=LLM_MAX_RETRIES,
+            retry_base_delay=LLM_RETRY_BASE_DELAY,
+            metrics=metrics,
+            timeout=LLM_CALL_TIMEOUT,
+            tier=tier if len(tiers) > 1 else None
+        )
+    return ModelRouter(runners, {tier: model for tier, (model, _, _) in tiers.items()},
+                       fallbacks={LIGHT_TIER: STRONG_TIER, STRONG_TIER: LIGHT_TIER})
 
 class DocumentGenerator:
-    def __init__(self, code_analysis: Dict[str, Any]):
+    def __init__(self, code_analysis: Dict[str, Any], cache: Optional[AnalysisCache] = None,
+                 llm=None, runner=None, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 previous_spec: Optional[Dict[str, Any]] = None, changes: Optional[Dict[str, List[str]]] = None,
+                 metrics: Optional[Metrics] = None, resume: bool = False, budget: Optional[Budget] = None):
         self.code_analysis = code_analysis
+        self.cache = cache
+        self.metrics = metrics or (runner.metrics if runner else Metrics())
         
-        # Set up LangSmith tracing
-        self.callback_manager = None
-        if LANGSMITH_API_KEY:
-            tracer = LangChainTracer(project_name=LANGSMITH_PROJECT)
-            self.callback_manager = CallbackManager([tracer])
-            self.langsmith_client = Client(api_key=LANGSMITH_API_KEY)
-            print(f"LangSmith tracing enabled for project: {LANGSMITH_PROJECT}")
-        else:
-            print("LangSmith API key not found. Tracing disabled.")
-        
-        # Initialize LLM
-        self.llm = GoogleGenerativeAI(
-            model=MODEL_NAME,
-            google_api_key=GOOGLE_API_KEY,
-            temperature=TEMPERATURE,
-            max_output_tokens=MAX_OUTPUT_TOKENS,
-            callbacks=self.callback_manager
-        )
+        # Incremental mode: patch a previous specification using the files changed since it was generated
+        self.previous_spec = previous_spec
+        self.changes = changes
         
-        # Initialize text splitter for handling large code bases
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=ANALYSIS_CHUNK_SIZE,
-            chunk_overlap=ANALYSIS_CHUNK_OVERLAP
-        )
+        # Limits on the prompt tokens and LLM calls of the run (unlimited by default)
+        self.budget = budget or Budget()
+        
+        # Completed work is journaled in the output directory; with resume it is picked up again
+        self.resume = resume
+        self.journal = None
+        
+        # Initialize LLM (a prebuilt runner or router, shared between generators, or an LLM such as a local fake
+        # can be passed in). A plain runner is routed as the only tier.
+        runner = runner or create_runner(llm, max_concurrency, self.metrics)
+        self.runner = runner if isinstance(runner, ModelRouter) else ModelRouter({STRONG_TIER: runner},
+                                                                                 {STRONG_TIER: MODEL_NAME})
+        self.llm = self.runner.llm
+    
+    def generate_documents(self, output_dir: str) -> Dict[str, str]:
+        """Generate the overview and specification documents concurrently."""
+        return asyncio.run(self.agenerate_documents(output_dir))
+    
+    async def agenerate_documents(self, output_dir: str) -> Dict[str, str]:
+        """Generate the overview and specification documents concurrently."""
+        with self._journaled(output_dir):
+            if self.budget.limited:
+                # The overview is paid for from the share the plan reserved for it, which the component
+                # analyses must not see spent while they run
+                spec_file = await self.agenerate_specification_document(output_dir)
+                overview_file = await self.agenerate_overview_document(output_dir)
+                print(f"Budget: {self.budget.tokens} prompt tokens in {self.budget.calls} LLM calls used "
+                      f"with the overview")
+            else:
+                # The overview does not depend on the component analyses, so both phases run at once
+                overview_file, spec_file = await asyncio.gather(
+                    self.agenerate_overview_document(output_dir),
+                    self.agenerate_specification_document(output_dir)
+                )
+        return {"overview": overview_file, "specification": spec_file}
+    
+    @contextmanager
+    def _journaled(self, output_dir: str):
+        """Open the run journal for the outermost generation call and remove it once that call succeeds."""
+        if self.journal is not None:
+            yield self.journal
+            return
+        self.journal = RunJournal(os.path.join(output_dir, JOURNAL_FILE), resume=self.resume)
+        try:
+            self.journal.start([[file.path, file.content_hash] for file in self.code_analysis["files"]])
+            yield self.journal
+        except BaseException:
+            self.journal.close()
+            raise
+        else:
+            self.journal.close(remove=True)
+        finally:
+            self.journal = None
     
     def generate_overview_document(self, output_dir: str) -> str:
         """Generate a high-level software overview document in JSON format."""
+        return asyncio.run(self.agenerate_overview_document(output_dir))
+    
+    async def agenerate_overview_document(self, output_dir: str) -> str:
+        """Generate a high-level software overview document in JSON format."""
+        with self._journaled(output_dir):
+            return await self._generate_overview_document(output_dir)
+    
+    async def _generate_overview_document(self, output_dir: str) -> str:
         # Prepare data for the overview
         languages = self.code_analysis.get("languages", {})
         key_components = self.code_analysis.get("key_components", [])
         
-        # Create code samples from key components (limited to keep prompt size reasonable)
-        code_samples = []
-        for component in key_components[:3]:  # Limit to top 3 components
-            for file in self.code_analysis["files"]:
-                if file["path"] == component["path"]:
-                    # Truncate content if too large
-                    content = file["content"][:2000] + "..." if len(file["content"]) > 2000 else file["content"]
-                    code_samples.append(f"File: {file['path']}\n```{file['language'].lower()}\n{content}\n```")
+        # In incremental mode the overview is only regenerated when a key component changed
+        output_file = os.path.join(output_dir, "overview_doc.json")
+        if self.changes is not None and os.path.exists(output_file):
+            changed_paths = set(self.changes["added"]) | set(self.changes["modified"]) | set(self.changes["deleted"])
+            if not any(component["path"] in changed_paths for component in key_components):
+                print("No key components changed. Keeping the existing overview document.")
+                return output_file
+        
+        # Code samples: the key components most relevant to how the application starts and is wired together
+        code_samples = self._overview_samples(key_components)
         
         code_samples_text = "\n\n".join(code_samples)
         
         # Run the chain with LangSmith tracing
-        with self._get_trace_context("overview_document_generation"):
-            chain = overview_prompt | self.llm
-            result = chain.invoke({
+        try:
+            overview_json = await self._ainvoke_structured(overview_prompt, {
                 "languages": json.dumps(languages, indent=2),
                 "components": json.dumps(key_components, indent=2),
                 "code_samples": code_samples_text
-            })
+            }, "overview_document_generation", "overview", OverviewDocument, "overview")
+        except BudgetExceeded:
+            overview_json = {"introduction": "Not generated: the LLM budget of this run was exhausted"}
+        if overview_json is None:
+            overview_json = {"introduction": "Error parsing overview"}
         
-        try:
-            # Parse the result to ensure it's valid JSON
-            overview_json = json.loads(result)
-            
-            # Save result to file
-            output_file = os.path.join(output_dir, "overview_doc.json")
-            with open(output_file, 'w') as f:
-                json.dump(overview_json, f, indent=2)
-            
-            return output_file
-        except json.JSONDecodeError:
-            # If parsing fails, extract JSON from the response
-            print("Warning: LLM response was not valid JSON. Attempting to extract JSON content...")
-            json_content = self._extract_json_from_text(result)
-            output_file = os.path.join(output_dir, "overview_doc.json")
-            with open(output_file, 'w') as f:
-                f.write(json_content)
-            
-            return output_file
+        # Save result to file
+        with self.metrics.span("write_overview", "write"):
+            write_json_atomic(output_file, overview_json)
+        
+        return output_file
     
     def generate_specification_document(self, output_dir: str) -> str:
         """Generate a detailed software specification document in JSON format."""
+        return asyncio.run(self.agenerate_specification_document(output_dir))
+    
+    async def agenerate_specification_document(self, output_dir: str) -> str:
+        """Generate a detailed software specification document in JSON format."""
+        with self._journaled(output_dir):
+            return await self._generate_specification_document(output_dir)
+    
+    async def _generate_specification_document(self, output_dir: str) -> str:
         # Process code files in chunks to handle large codebases
         all_files = self.code_analysis["files"]
         
-        # Sort files by likely importance
-        all_files.sort(key=lambda x: self._calculate_file_importance(x))
-        
-        # Prepare documents for sequential processing
-        documents = []
-        for file_info in all_files:
-            if file_info["content"]:
-                doc = Document(
-                    page_content=file_info["content"],
-                    metadata={"path": file_info["path"], "language": file_info["language"]}
-                )
-                documents.append(doc)
+        # Decide which files to analyze and what to reuse from the previous specification
+        plan = AnalysisPlan(self.code_analysis, self.previous_spec, self.changes, self.budget)
+        all_files = plan.files
+        clusters = plan.clusters
+        duplicates = plan.duplicates
+        previous_components = plan.previous_components
+        reusable_summaries = plan.reusable_summaries
+        dirty_directories = None
+        history = self.code_analysis.get("git_history")
+        if plan.incremental:
+            dirty_directories = self._ancestor_directories(plan.stale)
+            print(f"Incremental mode: analyzing {len(plan.files_to_analyze)} new or changed files, "
+                  f"reusing {len(previous_components)} components.")
+        if self.budget.limited:
+            print(plan.describe_budget())
         
-        # Split into manageable chunks if needed
-        if sum(len(doc.page_content) for doc in documents) > ANALYSIS_CHUNK_SIZE:
-            chunked_documents = self.text_splitter.split_documents(documents)
-        else:
-            chunked_documents = documents
-        
-        # Process each chunk and collect information
-        component_analyses = []
-        component_analyses_json = []
-        
-        for i, doc in enumerate(chunked_documents[:10]):  # Limit to first 10 chunks for reasonable processing
-            with self._get_trace_context(f"component_analysis_{doc.metadata['path']}"):
-                chain = component_prompt | self.llm
-                result = chain.invoke({
-                    "file_path": doc.metadata["path"],
-                    "language": doc.metadata["language"],
-                    "code": doc.page_content
-                })
+        # Map: analyze chunks concurrently, streaming each result to disk as soon as it is parsed
+        writer = SpecWriter(output_dir)
+        try:
+            chunk_keys_by_path = await self._map_chunks(plan)
             
-            try:
-                # Parse the result to ensure it's valid JSON
-                component_json = json.loads(result)
-                component_analyses_json.append(component_json)
-                component_analyses.append(result)
-            except json.JSONDecodeError:
-                # If parsing fails, extract JSON from the response
-                json_content = self._extract_json_from_text(result)
-                if json_content:
-                    component_analyses.append(json_content)
-                    try:
-                        component_analyses_json.append(json.loads(json_content))
-                    except:
-                        print(f"Warning: Could not parse JSON for component {doc.metadata['path']}")
-        
-        # Generate integration analysis
-        with self._get_trace_context("integration_analysis"):
-            chain = integration_prompt | self.llm
-            integration_result = chain.invoke({
-                "components": "\n\n".join(component_analyses),
-                "project_structure": json.dumps(self.code_analysis["project_structure"], indent=2)
-            })
+            # Reduce per file: merge the analyses of every chunk of the same file and stream it out
+            writer.begin_components()
+            compact_components = []
+            # Compact analyses are indexed so the integration stage can retrieve the relevant ones
+            retrieval = BM25Index()
+            outlined = 0
+            for file_info in all_files:
+                if file_info.path in duplicates:
+                    continue
+                parts = [
+                    component_json
+                    for key in chunk_keys_by_path.get(file_info.path, [])
+                    # Chunks refused by the budget have no record
+                    if self.journal.is_done("chunk", key)
+                    for path, component_json in self.journal.get("chunk", key)["analyses"] if path == file_info.path
+                ]
+                if parts:
+                    component_json = self._merge_component_analyses(file_info.path, parts)
+                elif file_info.path in previous_components:
+                    component_json = previous_components[file_info.path]
+                elif self.budget.limited:
+                    # Files the budget did not cover are still listed, from static analysis
+                    component_json = self._outline_component(file_info)
+                    outlined += 1
+                else:
+                    continue
+                if file_info.path in clusters:
+                    component_json["clusterMembers"] = clusters[file_info.path]
+                else:
+                    component_json.pop("clusterMembers", None)
+                file_history = history.file_summary(file_info.path) if history else None
+                if file_history:
+                    component_json["history"] = file_history
+                else:
+                    component_json.pop("history", None)
+                writer.write_component(component_json)
+                compact = self._compact_component(component_json)
+                compact_components.append((file_info.path, compact))
+                retrieval.add(file_info.path, compact)
+            
+            # Reduce per directory, bottom-up along the project structure
+            directory_summaries = {}
+            top_level_analyses = await self._reduce_project(
+                compact_components, directory_summaries, reusable_summaries, dirty_directories,
+                plan.summary_directories
+            )
+            compact_by_path = dict(compact_components)
+            del compact_components
+            
+            # Generate integration analysis from the final summaries and the change coupling in the history
+            coupling = history.coupled_pairs(file_info.path for file_info in all_files) if history else []
+            if dirty_directories is not None and not dirty_directories and "integration" in self.previous_spec:
+                integration_json = self.previous_spec["integration"]
+            else:
+                try:
+                    integration_json = await self._ainvoke_structured(integration_prompt, {
+                        "components": self._integration_context(top_level_analyses, retrieval, compact_by_path,
+                                                                coupling),
+                        "project_structure": self._compact_structure(self.code_analysis["project_structure"]),
+                        "change_coupling": "\n".join(
+                            f"{pair['files'][0]} <-> {pair['files'][1]}: {pair['commits']} commits "
+                            f"(confidence {pair['confidence']})" for pair in coupling
+                        ) or "No git history available."
+                    }, "integration_analysis", "integration", IntegrationAnalysis, "integration analysis")
+                except BudgetExceeded:
+                    integration_json = {"systemArchitecture": "Not generated: the LLM budget of this run was exhausted"}
+                if integration_json is None:
+                    integration_json = {"systemArchitecture": "Error parsing integration analysis"}
+            if coupling:
+                integration_json["changeCoupling"] = coupling
+            
+            metadata = {
+                "generatedAt": str(import_module('datetime').datetime.now()),
+                "sourceCodeAnalysisVersion": "1.0",
+                "sourceCommit": (self.code_analysis.get("git_info") or {}).get("head_commit")
+            }
+            if self.budget.limited:
+                metadata["budget"] = dict(self.budget.summary(), outlinedFiles=outlined)
+                print(f"Budget: used {self.budget.tokens} prompt tokens in {self.budget.calls} LLM calls, "
+                      f"{self.budget.refused} calls refused, {outlined} files outlined without the LLM")
+            
+            # Finish the specification document and move it into place atomically
+            with self.metrics.span("write_specification", "write"):
+                return writer.finish({
+                    "directorySummaries": directory_summaries,
+                    "integration": integration_json,
+                    "projectStructure": self.code_analysis["project_structure"].to_dict(),
+                    "technologies": self.code_analysis["languages"],
+                    "metadata": metadata
+                })
+        finally:
+            writer.close()
+    
+    async def _map_chunks(self, plan: AnalysisPlan) -> Dict[str, List[str]]:
+        """Analyze the chunks of the planned files, recording each result in the run journal.
+        
+        Chunks are produced lazily and only a bounded number are in flight, so memory does not
+        grow with the size of the repository. Chunks already in the journal are skipped.
+        Returns, for every file, the keys of its chunks in order.
+        """
+        chunk_keys_by_path = {}
+        window = self.runner.max_concurrency * 2
+        pending = set()
+        chunking_seconds = 0.0
+        chunk_count = 0
+        skipped = 0
+        first_pending = None
+        over_budget = 0
+        chunking_started_at = time.perf_counter()
+        compaction = {"before": 0, "after": 0}
+        
+        chunks = plan.chunks(compaction)
+        while True:
+            started_at = time.perf_counter()
+            chunk = next(chunks, None)
+            chunking_seconds += time.perf_counter() - started_at
+            if chunk is None:
+                break
+            tier = plan.tier(chunk)
+            key = self._chunk_key(chunk, tier)
+            self.journal.plan(chunk_count, key, chunk.paths, chunk.tokens)
+            chunk_count += 1
+            for path in dict.fromkeys(chunk.paths):
+                chunk_keys_by_path.setdefault(path, []).append(key)
+            # A chunk answered by a fallback model is analyzed again on its planned tier
+            model = self.runner.model_name(tier)
+            if self.journal.is_done("chunk", key) and self.journal.get("chunk", key).get("model", model) == model:
+                skipped += 1
+                continue
+            if first_pending is None:
+                first_pending = chunk_count - 1
+            if self.budget.limited and not self.budget.allows(chunk_prompt_tokens(chunk), 1, "component_analysis"):
+                over_budget += 1
+                continue
+            pending.add(asyncio.ensure_future(self._analyze_and_record(chunk, key, tier)))
+            if len(pending) >= window:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        await asyncio.gather(*pending)
+        if self.resume:
+            self.journal.report_resume(skipped, chunk_count, first_pending)
         
+        saved = compaction["before"] - compaction["after"]
+        self.metrics.record("chunking", "chunking", chunking_started_at, chunking_seconds,
+                            files=len(plan.files_to_analyze), chunks=chunk_count, resumed=skipped, tokensSaved=saved)
+        if compaction["before"]:
+            print(f"Compaction: {compaction['before']} -> {compaction['after']} estimated code tokens "
+                  f"({saved / compaction['before']:.0%} saved, {len(plan.signature_paths & {f.path for f in plan.files_to_analyze})} "
+                  f"files as signatures only)")
+        if over_budget:
+            print(f"Warning: {over_budget} of {chunk_count} chunks did not fit in the budget and were not analyzed.")
+        return chunk_keys_by_path
+    
+    async def _analyze_and_record(self, chunk: Chunk, key: str, tier: str):
+        answered = set()
         try:
-            integration_json = json.loads(integration_result)
-        except json.JSONDecodeError:
-            integration_content = self._extract_json_from_text(integration_result)
+            analyses = await self._analyze_chunk(chunk, tier, answered)
+        except BudgetExceeded:
+            # Left unrecorded: its files are outlined, and a resumed run may still analyze them
+            return
+        # The key names the planned tier's model; the record names the model that answered
+        model = self.runner.model_name(tier)
+        fallbacks = sorted(answered - {model})
+        self.journal.record("chunk", key, analyses=analyses, model=fallbacks[0] if fallbacks else model)
+    
+    def _chunk_key(self, chunk: Chunk, tier: str) -> str:
+        """Identify a chunk by its content and everything else that affects its analysis."""
+        template = (component_prompt if len(chunk.parts) == 1 else multi_component_prompt).template
+        return AnalysisCache.make_key(
+            template, [[part.path, part.language, part.code] for part in chunk.parts], self.runner.model_name(tier),
+            TEMPERATURE
+        )
+    
+    async def _reduce_project(self, compact_components: List[Tuple[str, str]], directory_summaries: Dict[str, Any],
+                              reusable_summaries: Optional[Dict[str, Any]] = None,
+                              dirty_directories: Optional[set] = None,
+                              summary_directories: Optional[set] = None) -> List[str]:
+        """Summarize (path, compact analysis) pairs directory by directory and return the top-level analyses.
+        
+        Summaries in reusable_summaries are kept for directories outside dirty_directories. With
+        summary_directories (the budget plan's), other directories are listed without the LLM.
+        """
+        reusable_summaries = reusable_summaries or {}
+        components_by_dir = {}
+        for path, compact in compact_components:
+            components_by_dir.setdefault(os.path.dirname(path), []).append(compact)
+        
+        async def reduce_directory(rel_path: str, node: DirectoryNode) -> List[str]:
+            # Sibling directories are reduced concurrently, so throughput follows the concurrency limit
+            child_results = await asyncio.gather(*[
+                reduce_directory(os.path.join(rel_path, name), child)
+                for name, child in node.directories.items()
+            ])
+            items = components_by_dir.pop(rel_path, [])
+            for child_items in child_results:
+                items.extend(child_items)
+            if not rel_path or len(items) <= 1:
+                return items
+            if dirty_directories is not None and rel_path not in dirty_directories and rel_path in reusable_summaries:
+                directory_summaries[rel_path] = reusable_summaries[rel_path]
+                return [json.dumps(reusable_summaries[rel_path], separators=(',', ':'))]
+            if summary_directories is not None and rel_path not in summary_directories:
+                summary = json.dumps({"directory": rel_path,
+                                      "summary": "Not summarized: outside the LLM budget of this run",
+                                      "keyComponents": self._item_names(items)}, separators=(',', ':'))
+            else:
+                summary = await self._summarize(rel_path, items)
+            directory_summaries[rel_path] = json.loads(summary)
+            return [summary]
+        
+        top_level = await reduce_directory("", self.code_analysis["project_structure"])
+        # Components outside the known structure are treated as top-level
+        for leftover in components_by_dir.values():
+            top_level.extend(leftover)
+        # Not summarized further: the integration stage retrieves what fits its budget (_integration_context)
+        return top_level
+    
+    async def _summarize(self, directory: str, items: List[str]) -> str:
+        """Summarize a directory's analyses into a single summary, staying within the token budget."""
+        items = await self._fit_to_budget(directory, items)
+        if len(items) == 1:
+            return items[0]
+        return await self._summarize_group(directory, items, f"directory_summary_{directory}")
+    
+    async def _summarize_group(self, directory: str, items: List[str], run_name: str) -> str:
+        """Summarize one group of analyses, returned as compact JSON."""
+        try:
+            summary = await self._ainvoke_structured(directory_prompt, {
+                "directory": directory,
+                "components": "\n\n".join(items)
+            }, run_name, "directory_summary", DirectorySummary, f"directory {directory}")
+        except BudgetExceeded:
+            summary = {"directory": directory, "summary": "Not summarized: the LLM budget of this run was exhausted",
+                       "keyComponents": self._item_names(items)}
+        if summary is None:
+            summary = {"directory": directory, "summary": "Error parsing directory summary"}
+        return json.dumps(summary, separators=(',', ':'))
+    
+    async def _fit_to_budget(self, directory: str, items: List[str]) -> List[str]:
+        """Repeatedly summarize groups of analyses until they fit into a single prompt."""
+        while True:
+            groups = self._pack_to_budget(items, REDUCE_TOKEN_BUDGET)
+            if len(groups) <= 1:
+                return items
+            items = await asyncio.gather(*[
+                self._summarize_group(directory, group, f"directory_summary_{directory}_part_{i}")
+                for i, group in enumerate(groups)
+            ])
+    
+    def _ancestor_directories(self, paths: set) -> set:
+        """Return every directory containing one of the given paths, including the root ("")."""
+        directories = set()
+        for path in paths:
+            directory = os.path.dirname(path)
+            while directory not in directories:
+                directories.add(directory)
+                if not directory:
+                    break
+                directory = os.path.dirname(directory)
+        return directories
+    
+    def _pack_to_budget(self, items: List[str], budget: int) -> List[List[str]]:
+        """Greedily pack items into groups whose estimated token count stays within the budget."""
+        groups = []
+        current = []
+        current_tokens = 0
+        for item in items:
+            tokens = estimate_tokens(item)
+            if tokens > budget:
+                # A single oversized item is truncated so every group can fit in a prompt
+                item = item[:budget * 4]
+                tokens = budget
+            if current and current_tokens + tokens > budget:
+                groups.append(current)
+                current = []
+                current_tokens = 0
+            current.append(item)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+    
+    def _item_names(self, items: List[str]) -> List[str]:
+        """Names of the components and directories in compact analyses, for summaries made without the LLM."""
+        names = []
+        for item in items:
             try:
-                integration_json = json.loads(integration_content)
-            except:
-                print("Warning: Could not parse JSON for integration analysis")
-                integration_json = {"systemArchitecture": "Error parsing integration analysis"}
-        
-        # Build final specification document as JSON
-        specification_json = {
-            "components": component_analyses_json,
-            "integration": integration_json,
-            "projectStructure": self.code_analysis["project_structure"],
-            "technologies": self.code_analysis["languages"],
-            "metadata": {
-                "generatedAt": str(import_module('datetime').datetime.now()),
-                "sourceCodeAnalysisVersion": "1.0"
-            }
+                value = json.loads(item)
+            except ValueError:
+                continue
+            name = value.get("componentName") or value.get("directory") if isinstance(value, dict) else None
+            if name:
+                names.append(name)
+        return names
+    
+    def _outline_component(self, file_info) -> Dict[str, Any]:
+        """Describe a file from the structure index alone, for files the budget left unanalyzed."""
+        index = self.code_analysis.get("structure_index")
+        component = ComponentAnalysis(
+            sourcePath=file_info.path,
+            componentName=os.path.splitext(os.path.basename(file_info.path))[0],
+            primaryFunctionality="Not analyzed: outside the LLM budget of this run. Listed from static analysis.",
+            publicInterface=list(index.symbols.get(file_info.path, ())) if index else [],
+            dependencies=index.dependencies.get(file_info.path, []) if index else []
+        ).model_dump()
+        # Outlines are not reused by incremental runs, so the file is analyzed once the budget allows
+        component["outline"] = True
+        return component
+    
+    def _compact_component(self, component: Dict[str, Any]) -> str:
+        """Render the parts of a component analysis needed for summarization as compact JSON."""
+        compact = {
+            "sourcePath": component.get("sourcePath"),
+            "componentName": component.get("componentName"),
+            "componentType": component.get("componentType"),
+            "primaryFunctionality": component.get("primaryFunctionality"),
+            "publicInterface": [
+                item.get("name") if isinstance(item, dict) else item
+                for item in component.get("publicInterface", [])
+            ],
+            "dependencies": component.get("dependencies", [])
         }
+        return json.dumps(compact, separators=(',', ':'))
+    
+    def _overview_samples(self, key_components: List[Dict[str, Any]]) -> List[str]:
+        """Code samples of the key components that best show where the application starts and how it is wired.
         
-        # Save result to file
-        output_file = os.path.join(output_dir, "spec_doc.json")
-        with open(output_file, 'w') as f:
-            json.dump(specification_json, f, indent=2)
+        Key components keep their centrality order, fused with a BM25 search of their paths and symbols;
+        each sample gets an equal share of OVERVIEW_SAMPLE_TOKENS.
+        """
+        files_by_path = {file.path: file for file in self.code_analysis["files"]}
+        index = self.code_analysis.get("structure_index")
+        candidates = [component["path"] for component in key_components if component["path"] in files_by_path]
+        descriptors = BM25Index()
+        for path in candidates:
+            descriptors.add(path, " ".join([path, *(index.symbols.get(path, ()) if index else ())]))
         
-        return output_file
+        samples = []
+        sample_chars = OVERVIEW_SAMPLE_TOKENS // OVERVIEW_SAMPLE_FILES * 4
+        for path in fuse_rankings([candidates, descriptors.rank(OVERVIEW_QUERIES)])[:OVERVIEW_SAMPLE_FILES]:
+            file = files_by_path[path]
+            content = file.content
+            content = content[:sample_chars] + "..." if len(content) > sample_chars else content
+            samples.append(f"File: {file.path}\n```{file.language.lower()}\n{content}\n```")
+        return samples
+    
+    def _integration_context(self, top_level: List[str], retrieval: BM25Index, compact_by_path: Dict[str, str],
+                             coupling: List[Dict[str, Any]]) -> str:
+        """Choose the analyses the integration prompt sees, keeping it within INTEGRATION_CONTEXT_TOKENS.
+        
+        Top-level summaries come first, the most relevant to integration concerns (APIs, storage, messaging,
+        external services, configuration, auth) first when they do not all fit. Components retrieved from the
+        whole project, starting with files that often change together, fill the rest; what is left out is named.
+        """
+        items = {str(i): item for i, item in enumerate(top_level)}
+        summaries = BM25Index()
+        for key, item in items.items():
+            summaries.add(key, item)
+        selected, left_out = select_within_budget(
+            items, fuse_rankings([summaries.rank(INTEGRATION_QUERIES), list(items)]), INTEGRATION_CONTEXT_TOKENS
+        )
+        selected.sort(key=int)
+        parts = [items[key] for key in selected]
+        
+        shown = set(parts)
+        coupled = [path for pair in coupling for path in pair["files"]]
+        candidates = [path for path in dict.fromkeys(coupled + retrieval.rank(INTEGRATION_QUERIES))
+                      if path in compact_by_path and compact_by_path[path] not in shown][:INTEGRATION_COMPONENTS]
+        used = sum(estimate_tokens(part) for part in parts)
+        retrieved, _ = select_within_budget(compact_by_path, candidates, INTEGRATION_CONTEXT_TOKENS - used)
+        if retrieved:
+            parts.append("Relevant components:")
+            parts.extend(compact_by_path[path] for path in retrieved)
+        if left_out:
+            parts.append("Also in the project (not shown): " + ", ".join(self._item_names([items[key] for key in left_out])))
+        return "\n\n".join(parts)
     
-    def _get_trace_context(self, run_name):
-        """Get a context manager for tracing with LangSmith or a no-op context manager if disabled."""
-        if LANGSMITH_API_KEY and LANGSMITH_TRACING:
+    def _compact_structure(self, structure: DirectoryNode) -> str:
+        """Render the directory tree without file lists, trimmed to the structure token budget."""
+        lines = []
+        
+        def walk(node: DirectoryNode, depth: int):
+            for name, child in node.directories.items():
+                lines.append(f"{'  ' * depth}{name}/ ({len(child.files)} files)")
+                walk(child, depth + 1)
+        
+        walk(structure, 0)
+        text = "\n".join(lines)
+        if estimate_tokens(text) > STRUCTURE_TOKEN_BUDGET:
+            text = text[:STRUCTURE_TOKEN_BUDGET * 4].rsplit("\n", 1)[0] + "\n..."
+        return text
+    
+    def _merge_component_analyses(self, path: str, parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Merge the analyses of all chunks of one file into a single component analysis."""
+        merged = dict(parts[0])
+        for part in parts[1:]:
+            for key, value in part.items():
+                if key not in merged or not merged[key]:
+                    merged[key] = value
+                elif isinstance(merged[key], list) and isinstance(value, list):
+                    seen = {json.dumps(item, sort_keys=True) for item in merged[key]}
+                    merged[key] = merged[key] + [item for item in value if json.dumps(item, sort_keys=True) not in seen]
+                elif key in ("primaryFunctionality", "errorHandling", "notes") and isinstance(value, str) and value not in merged[key]:
+                    merged[key] = f"{merged[key]} {value}"
+        merged["sourcePath"] = path
+        return merged
+    
+    async def _ainvoke_structured(self, prompt, inputs: Dict[str, Any], run_name: str, stage: str,
+                                  schema: Type, label: str, journaled: bool = True,
+                                  tier: Optional[str] = None, answered: Optional[set] = None) -> Optional[Dict[str, Any]]:
+        """Run a prompt and validate the response against a schema, re-prompting only this request on failure.
+        
+        Returns the validated response as a dict, or None if it still fails after STRUCTURED_OUTPUT_RETRIES.
+        """
+        parse = lambda result: parse_structured(result, schema).model_dump()
+        request_prompt, request_inputs = prompt, inputs
+        for attempt in range(STRUCTURED_OUTPUT_RETRIES + 1):
             try:
-                # For LangChain 0.1.0+ we use a different approach
-                from contextlib import contextmanager
-                
-                @contextmanager
-                def langsmith_context(name):
-                    # Set run name via environment variable instead
-                    old_run_name = os.environ.get("LANGCHAIN_RUN_NAME")
-                    os.environ["LANGCHAIN_RUN_NAME"] = name
-                    try:
-                        yield
-                    finally:
-                        if old_run_name:
-                            os.environ["LANGCHAIN_RUN_NAME"] = old_run_name
-                        else:
-                            os.environ.pop("LANGCHAIN_RUN_NAME", None)
-                
-                return langsmith_context(run_name)
-                
-            except Exception as e:
-                print(f"Warning: Error setting up tracing: {e}. Using null context.")
-                return nullcontext()
-        else:
-            return nullcontext()
+                return await self._ainvoke(request_prompt, request_inputs, run_name, stage, journaled, parse, tier,
+                                           answered)
+            except OutputParseError as e:
+                if attempt == STRUCTURED_OUTPUT_RETRIES:
+                    print(f"Warning: Could not parse the response for {label}: {e}")
+                    return None
+                print(f"Warning: Invalid response for {label} ({e}). Asking the model to correct it.")
+                request_prompt = with_repair_instructions(prompt)
+                request_inputs = {**inputs, "error": str(e)}
     
-    def _calculate_file_importance(self, file_info: Dict[str, Any]) -> float:
-        """Calculate a heuristic importance score for a file."""
-        importance = 0.0
-        path = file_info["path"].lower()
+    async def _ainvoke(self, prompt, inputs: Dict[str, Any], run_name: str, stage: str,
+                       journaled: bool = True, parse: Optional[Callable[[str], Any]] = None,
+                       tier: Optional[str] = None, answered: Optional[set] = None) -> Any:
+        """Run a prompt through the LLM, reusing a cached or journaled result when the inputs are unchanged.
         
-        # Files that are likely more important
-        if any(keyword in path for keyword in ['main', 'app', 'index', 'core']):
-            importance += 10.0
-            
-        if 'test' in path:
-            importance -= 5.0  # Tests are less important for specifications
-            
-        # Consider file size (larger files might contain more logic)
-        # But not too large as they might be data files
-        size = file_info["size"]
-        if 100 <= size <= 10000:
-            importance += min(size / 1000, 5.0)
-            
-        return importance
-    
-    def _extract_json_from_text(self, text: str) -> str:
-        """Extract JSON from text that may contain additional content."""
-        import re
-        json_pattern = r'```json\s*([\s\S]*?)\s*```|```\s*([\s\S]*?)\s*```|\{\s*"[^"]+"\s*:[\s\S]*\}'
-        match = re.search(json_pattern, text)
-        
-        if match:
-            # Get the match from either the first or second group
-            json_str = match.group(1) or match.group(2)
-            if not json_str:
-                # If no match in the code blocks, try to find a JSON object
-                match = re.search(r'\{[\s\S]*\}', text)
-                if match:
-                    json_str = match.group(0)
+        Calls whose parsed result is journaled by the caller pass journaled=False. With parse, the
+        parsed response is returned, and a response that fails to parse is neither cached nor journaled.
+        The call goes to the model tier given (the strong one by default). A response from a fallback
+        model is cached and journaled under that model's key, and its name is added to answered.
+        """
+        parse = parse or (lambda result: result)
+        # The key covers the prompt inputs (code, path, language), the template and the model settings
+        started_at = time.perf_counter()
+        key = AnalysisCache.make_key(prompt.template, inputs, self.runner.model_name(tier), TEMPERATURE)
+        journal = self.journal if journaled else None
+        if journal and journal.is_done("call", key):
+            self.metrics.record(run_name, stage, started_at, time.perf_counter() - started_at, resumed=1)
+            return parse(journal.get("call", key)["result"])
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                try:
+                    value = parse(cached)
+                except OutputParseError:
+                    # An unusable result cached by an earlier version is replaced
+                    pass
                 else:
-                    return "{}"
-            return json_str.strip()
-        else:
-            # If no JSON pattern found, return empty object
-            return "{}"
-
-
+                    self.metrics.record(run_name, stage, started_at, time.perf_counter() - started_at, cacheHits=1)
+                    return value
+        
+        if self.budget.limited:
+            self.budget.spend(estimate_tokens(prompt.format(**inputs)), 1, stage)
+        
+        # The run name is passed per call so LangSmith traces stay correct under concurrency
+        result, answered_tier = await self.runner.ainvoke(prompt, inputs, run_name, stage, self.metrics, tier)
+        value = parse(result)
+        model = self.runner.model_name(answered_tier)
+        if answered is not None:
+            answered.add(model)
+        if model != self.runner.model_name(tier):
+            key = AnalysisCache.make_key(prompt.template, inputs, model, TEMPERATURE)
+        
+        if self.cache:
+            self.cache.put(key, result)
+        if journal:
+            journal.record("call", key, stage=stage, result=result)
+        return value
+    
+    async def _analyze_chunk(self, chunk: Chunk, tier: str, answered: Optional[set] = None) -> List[tuple]:
+        """Analyze one chunk on a model tier and return (path, component analysis) pairs for the files it contains.
+        
+        The models that answered its calls are added to answered.
+        """
+        if len(chunk.parts) == 1:
+            return await self._analyze_part(chunk.parts[0], tier, answered)
+        
+        files_text = "\n\n".join(
+            f"File path: {part.path}\nLanguage: {part.language}\n\nCode:\n```\n{part.code}\n```"
+            for part in chunk.parts
+        )
+        batch = await self._ainvoke_structured(multi_component_prompt, {"files": files_text},
+                                               f"component_analysis_{chunk.paths[0]}_and_{len(chunk.parts) - 1}_more",
+                                               "component_analysis", ComponentBatch,
+                                               f"components {', '.join(chunk.paths)}", journaled=False, tier=tier,
+                                               answered=answered)
+        
+        analyses = []
+        for i, entry in enumerate(batch["components"] if batch else []):
+            try:
+                component_json = ComponentAnalysis.model_validate(entry).model_dump()
+            except ValueError:
+                continue
+            # Fall back to the request order when the model does not echo the path back
+            path = component_json.get("sourcePath")
+            if path not in chunk.paths:
+                if i >= len(chunk.parts):
+                    continue
+                path = chunk.parts[i].path
+            analyses.append((path, component_json))
+        
+        # Files missing from the response (truncated or invalid entries) are analyzed on their own
+        analyzed = {path for path, _ in analyses}
+        missing = [part for part in chunk.parts if part.path not in analyzed]
+        if missing:
+            print(f"Warning: {len(missing)} of {len(chunk.parts)} files missing from a batched analysis. "
+                  f"Analyzing them individually.")
+            results = await asyncio.gather(*[self._analyze_part(part, tier, answered) for part in missing], return_exceptions=True)
+            for part_analyses in results:
+                # Files refused by the budget are outlined instead
+                if isinstance(part_analyses, BudgetExceeded):
+                    continue
+                if isinstance(part_analyses, BaseException):
+                    raise part_analyses
+                analyses.extend(part_analyses)
+        return analyses
+    
+    async def _analyze_part(self, part: ChunkPart, tier: str, answered: Optional[set] = None) -> List[tuple]:
+        """Analyze a single file (or part of a file) with the component prompt."""
+        component_json = await self._ainvoke_structured(component_prompt, {
+            "file_path": part.path,
+            "language": part.language,
+            "code": part.code
+        }, f"component_analysis_{part.path}", "component_analysis", ComponentAnalysis,
+            f"component {part.path}", journaled=False, tier=tier, answered=answered)
+        return [(part.path, component_json)] if component_json is not None else []
+    
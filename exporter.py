@@ -0,0 +1,457 @@
+import os
+import re
+import sys
+import json
+import time
+import zipfile
+import hashlib
+import argparse
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+from config import EXPORT_FORMATS
+
+# Bumped whenever the rendering changes, so cached sections and documents are rendered again
+EXPORT_VERSION = "1"
+
+# Written next to the exported files: hashes of the exported documents, and their rendered sections
+# (kept apart so checking for unchanged documents stays cheap)
+EXPORT_CACHE_FILE = ".export_cache.json"
+EXPORT_SECTIONS_FILE = ".export_sections.json"
+
+# Source documents of an output directory and the name of their exports (without extension)
+DOCUMENTS = [("overview_doc.json", "software_overview"), ("spec_doc.json", "software_specification")]
+
+# Order of the known fields of each section; fields that are not listed follow in their own order
+OVERVIEW_FIELDS = ['introduction', 'architecture', 'technologies', 'components', 'dataFlow',
+                   'integrationPoints', 'developmentConsiderations']
+INTEGRATION_FIELDS = ['systemArchitecture', 'componentInteractions', 'dataFlow', 'integrationPoints',
+                      'dependencies', 'apiContracts', 'systemRequirements', 'deploymentArchitecture', 'changeCoupling']
+COMPONENT_FIELDS = ['componentType', 'primaryFunctionality', 'publicInterface', 'dependencies', 'dataStructures',
+                    'errorHandling', 'notes', 'history']
+
+# XML 1.0 does not allow most control characters, which LLM output occasionally contains
+_INVALID_XML = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# A rendered block: ("heading", level, text), ("paragraph", text) or ("bullet", text)
+Block = Tuple[Any, ...]
+
+
+@lru_cache(maxsize=1024)
+def _title(name: str) -> str:
+    """Turn a camelCase field name into a heading ("primaryFunctionality" -> "Primary functionality")."""
+    words = re.sub(r'(?<=[a-z0-9])(?=[A-Z])', ' ', name).split()
+    return " ".join([words[0].capitalize()] + [word.lower() if not word.isupper() else word for word in words[1:]])
+
+
+def _inline(value: Any) -> str:
+    """One-line text for a list item."""
+    if isinstance(value, dict):
+        if "files" in value and "commits" in value:
+            return f"{' <-> '.join(value['files'])}: {value['commits']} commits (confidence {value.get('confidence')})"
+        if "source" in value and "target" in value:
+            text = f"{value['source']} -> {value['target']}"
+            return f"{text}: {value['description']}" if value.get("description") else text
+        if "endpoint" in value:
+            text = f"{value.get('method', '')} {value['endpoint']}".strip()
+            if value.get("parameters"):
+                text += f" ({', '.join(value['parameters'])})"
+            if value.get("response"):
+                text += f" -> {value['response']}"
+            return text
+        if "name" in value:
+            name = value["name"]
+            if "parameters" in value or "returnType" in value:
+                name = f"{name}({', '.join(value.get('parameters') or [])})"
+                if value.get("returnType"):
+                    name += f" -> {value['returnType']}"
+            if value.get("fields"):
+                name += f" {{{', '.join(value['fields'])}}}"
+            detail = value.get("description") or value.get("purpose") or value.get("role") or ""
+            return f"{name}: {detail}" if detail else name
+        return ", ".join(f"{_title(key)}: {_inline(item)}" for key, item in value.items())
+    if isinstance(value, list):
+        return ", ".join(_inline(item) for item in value)
+    return str(value)
+
+
+def _value_blocks(value: Any, level: int) -> Iterator[Block]:
+    """Blocks for the value of a field, below a heading of the given level."""
+    if value is None or value == "" or value == [] or value == {}:
+        return
+    if isinstance(value, str):
+        for paragraph in value.split("\n\n"):
+            if paragraph.strip():
+                yield ("paragraph", paragraph.strip())
+    elif isinstance(value, list):
+        for item in value:
+            # Named entries with their own responsibilities get a sub-heading
+            if isinstance(item, dict) and item.get("responsibilities"):
+                yield ("heading", level + 1, str(item.get("name", "")))
+                yield from _value_blocks(item.get("description"), level + 1)
+                yield from _value_blocks(item["responsibilities"], level + 1)
+            else:
+                yield ("bullet", _inline(item))
+    elif isinstance(value, dict):
+        # Flat mappings (dependencies per component, history counters) become one bullet per key
+        if not any(isinstance(item, dict) for item in value.values()):
+            for key, item in value.items():
+                yield ("bullet", f"{key}: {_inline(item)}")
+        else:
+            yield from _fields_blocks(value, list(value), level + 1)
+    else:
+        yield ("paragraph", str(value))
+
+
+def _fields_blocks(section: Dict[str, Any], order: List[str], level: int, skip: Iterable[str] = ()) -> Iterator[Block]:
+    """One heading per non-empty field, known fields first."""
+    skip = set(skip)
+    for field in list(dict.fromkeys(order + list(section))):
+        if field in skip or field not in section:
+            continue
+        blocks = list(_value_blocks(section[field], level))
+        if blocks:
+            yield ("heading", level, _title(field))
+            yield from blocks
+
+
+def overview_sections(overview: Dict[str, Any], title: str) -> Iterator[Tuple[str, Any, Iterator[Block]]]:
+    """Sections of the overview document as (key, content, blocks); blocks are only built when iterated."""
+    yield "title", title, iter([("heading", 1, f"{title}: Software Overview")])
+    for field in list(dict.fromkeys(OVERVIEW_FIELDS + list(overview))):
+        if field in overview:
+            yield field, overview[field], _fields_blocks({field: overview[field]}, [field], 2)
+
+
+def specification_sections(spec: Dict[str, Any], title: str) -> Iterator[Tuple[str, Any, Iterator[Block]]]:
+    """Sections of the specification document as (key, content, blocks); one section per component."""
+    metadata = spec.get("metadata", {})
+    header = [("heading", 1, f"{title}: Software Specification")]
+    details = [f"{key}: {metadata[key]}" for key in ("generatedAt", "sourceCommit") if metadata.get(key)]
+    if details:
+        header.append(("paragraph", "; ".join(details)))
+    yield "header", [title, metadata], iter(header)
+
+    integration = spec.get("integration") or {}
+    yield "integration", integration, _section("System integration", integration, INTEGRATION_FIELDS)
+    if spec.get("technologies"):
+        technologies = [f"{language}: {count} files" for language, count in spec["technologies"].items()]
+        yield "technologies", spec["technologies"], iter([("heading", 2, "Technologies")] +
+                                                         [("bullet", item) for item in technologies])
+
+    components = spec.get("components", [])
+    if components:
+        yield "components", None, iter([("heading", 2, "Components")])
+    for component in components:
+        name = component.get("componentName") or component.get("sourcePath") or "Component"
+        heading = f"{name} ({component['sourcePath']})" if component.get("sourcePath") and component["sourcePath"] != name else name
+        blocks = [("heading", 3, heading)]
+        yield (f"component:{component.get('sourcePath', name)}", component,
+               _chain(blocks, _fields_blocks(component, COMPONENT_FIELDS, 4, skip=("componentName", "sourcePath"))))
+
+    summaries = spec.get("directorySummaries") or {}
+    if summaries:
+        yield "directories", None, iter([("heading", 2, "Directories")])
+    for directory, summary in summaries.items():
+        yield (f"directory:{directory}", summary,
+               _chain([("heading", 3, directory)], _fields_blocks(summary, ["summary", "keyComponents"], 4,
+                                                                  skip=("directory",))))
+
+
+def _section(heading: str, content: Dict[str, Any], order: List[str]) -> Iterator[Block]:
+    if content:
+        yield ("heading", 2, heading)
+        yield from _fields_blocks(content, order, 3)
+
+
+def _chain(first: List[Block], rest: Iterator[Block]) -> Iterator[Block]:
+    yield from first
+    yield from rest
+
+
+def render_markdown(blocks: Iterable[Block]) -> str:
+    """Markdown for a run of blocks."""
+    parts = []
+    previous = None
+    for block in blocks:
+        kind = block[0]
+        if previous == "bullet" and kind != "bullet":
+            parts.append("\n")
+        if kind == "heading":
+            parts.append(f"{'#' * block[1]} {block[2]}\n\n")
+        elif kind == "paragraph":
+            parts.append(f"{block[1]}\n\n")
+        else:
+            parts.append("- " + block[1].replace("\n", "\n  ") + "\n")
+        previous = kind
+    if previous == "bullet":
+        parts.append("\n")
+    return "".join(parts)
+
+
+def _runs(text: str) -> str:
+    text = escape(_INVALID_XML.sub('', text))
+    return '<w:t xml:space="preserve">' + text.replace("\n", '</w:t><w:br/><w:t xml:space="preserve">') + '</w:t>'
+
+
+# Paragraph properties by block kind (headings by level)
+_PARAGRAPH_PROPERTIES = {"paragraph": "", "bullet": '<w:pPr><w:pStyle w:val="ListBullet"/></w:pPr>'}
+_PARAGRAPH_PROPERTIES.update({level: f'<w:pPr><w:pStyle w:val="Heading{min(level, 4)}"/></w:pPr>' for level in range(1, 7)})
+
+
+def render_docx_xml(blocks: Iterable[Block]) -> str:
+    """WordprocessingML paragraphs for a run of blocks."""
+    parts = []
+    for block in blocks:
+        if block[0] == "heading":
+            properties, text = _PARAGRAPH_PROPERTIES[min(block[1], 6)], block[2]
+        else:
+            properties, text = _PARAGRAPH_PROPERTIES[block[0]], block[1]
+        parts.append(f"<w:p>{properties}<w:r>{_runs(text)}</w:r></w:p>")
+    return "".join(parts)
+
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>
+<Override PartName="/word/numbering.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"/>
+</Types>"""
+
+_PACKAGE_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+_DOCUMENT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/numbering" Target="numbering.xml"/>
+</Relationships>"""
+
+_W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def _heading_style(level: int, size: int) -> str:
+    return (f'<w:style w:type="paragraph" w:styleId="Heading{level}"><w:name w:val="heading {level}"/>'
+            f'<w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:pPr><w:keepNext/><w:spacing w:before="240" '
+            f'w:after="120"/><w:outlineLvl w:val="{level - 1}"/></w:pPr><w:rPr><w:b/><w:sz w:val="{size}"/></w:rPr>'
+            f'</w:style>')
+
+
+_STYLES = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:styles {_W}>'
+           '<w:docDefaults><w:rPrDefault><w:rPr><w:rFonts w:ascii="Calibri" w:hAnsi="Calibri" w:cs="Calibri"/>'
+           '<w:sz w:val="22"/></w:rPr></w:rPrDefault><w:pPrDefault><w:pPr><w:spacing w:after="120"/></w:pPr>'
+           '</w:pPrDefault></w:docDefaults>'
+           '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>'
+           + "".join(_heading_style(level, size) for level, size in ((1, 36), (2, 30), (3, 26), (4, 22))) +
+           '<w:style w:type="paragraph" w:styleId="ListBullet"><w:name w:val="List Bullet"/><w:basedOn w:val="Normal"/>'
+           '<w:pPr><w:numPr><w:numId w:val="1"/></w:numPr><w:spacing w:after="40"/></w:pPr></w:style></w:styles>')
+
+_NUMBERING = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:numbering {_W}>'
+              '<w:abstractNum w:abstractNumId="0"><w:lvl w:ilvl="0"><w:numFmt w:val="bullet"/><w:lvlText w:val="•"/>'
+              '<w:lvlJc w:val="left"/><w:pPr><w:ind w:left="720" w:hanging="360"/></w:pPr></w:lvl></w:abstractNum>'
+              '<w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num></w:numbering>')
+
+
+class _SectionCache:
+    """Rendered sections by content hash, so sections that did not change are not rendered again."""
+
+    def __init__(self, previous: Dict[str, Dict[str, str]]):
+        self.previous = previous
+        self.current = {}
+        # Sections of the document being exported
+        self.used = []
+        self.rendered = 0
+        self.reused = 0
+
+    def keep(self, digests: List[str]):
+        """Carry the sections of a document that is not exported again over to the new cache."""
+        self.current.update((digest, self.previous[digest]) for digest in digests if digest in self.previous)
+
+    def render(self, key: str, content: Any, blocks: Iterator[Block], formats: List[str]) -> Dict[str, str]:
+        digest = hashlib.sha256(json.dumps([EXPORT_VERSION, key, content], default=str).encode()).hexdigest()[:24]
+        fragments = self.previous.get(digest)
+        if fragments is not None and all(fmt in fragments for fmt in formats):
+            self.reused += 1
+        else:
+            blocks = list(blocks)
+            fragments = {}
+            if "md" in formats:
+                fragments["md"] = render_markdown(blocks)
+            if "docx" in formats:
+                fragments["docx"] = render_docx_xml(blocks)
+            self.rendered += 1
+        self.current[digest] = fragments
+        self.used.append(digest)
+        return fragments
+
+
+def export_document(source_path: str, target_base: str, kind: str, title: str, formats: List[str],
+                    sections: _SectionCache) -> List[str]:
+    """Render one JSON document to <target_base>.md and/or .docx, streaming section by section."""
+    with open(source_path, encoding='utf-8') as f:
+        document = json.load(f)
+    iter_sections = overview_sections if kind == "overview_doc.json" else specification_sections
+
+    outputs = {fmt: f"{target_base}.{fmt}" for fmt in formats}
+    markdown = open(outputs["md"] + ".tmp", 'w', encoding='utf-8') if "md" in outputs else None
+    docx = zipfile.ZipFile(outputs["docx"] + ".tmp", 'w', zipfile.ZIP_DEFLATED) if "docx" in outputs else None
+    body = None
+    try:
+        if docx:
+            docx.writestr("[Content_Types].xml", _CONTENT_TYPES)
+            docx.writestr("_rels/.rels", _PACKAGE_RELS)
+            docx.writestr("word/_rels/document.xml.rels", _DOCUMENT_RELS)
+            docx.writestr("word/styles.xml", _STYLES)
+            docx.writestr("word/numbering.xml", _NUMBERING)
+            body = docx.open("word/document.xml", 'w')
+            body.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:document {_W}><w:body>'.encode())
+        for key, content, blocks in iter_sections(document, title):
+            fragments = sections.render(key, content, blocks, formats)
+            if markdown:
+                markdown.write(fragments["md"])
+            if body:
+                body.write(fragments["docx"].encode('utf-8'))
+        if body:
+            body.write(b'<w:sectPr><w:pgSz w:w="11906" w:h="16838"/><w:pgMar w:top="1440" w:right="1440" '
+                       b'w:bottom="1440" w:left="1440" w:header="708" w:footer="708" w:gutter="0"/></w:sectPr>'
+                       b'</w:body></w:document>')
+            body.close()
+            body = None
+    finally:
+        if body:
+            body.close()
+        for handle in (markdown, docx):
+            if handle:
+                handle.close()
+    for path in outputs.values():
+        os.replace(path + ".tmp", path)
+    return list(outputs.values())
+
+
+def _load_json(path: str) -> Dict[str, Any]:
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if data.get("version") == EXPORT_VERSION else {}
+
+
+def _write_json(path: str, data: Dict[str, Any]):
+    with open(path + ".tmp", 'w') as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def export_documents(output_dir: str, formats: Iterable[str] = EXPORT_FORMATS, target_dir: Optional[str] = None,
+                     title: Optional[str] = None, force: bool = False) -> Dict[str, Any]:
+    """Export the overview and specification of an output directory to Markdown and/or DOCX.
+
+    Documents whose JSON and requested formats are unchanged since the last export are skipped, and
+    unchanged sections of changed documents are reused from the export cache.
+    """
+    formats = [fmt for fmt in formats if fmt]
+    unknown = set(formats) - {"md", "docx"}
+    if unknown:
+        raise ValueError(f"unknown export format(s): {', '.join(sorted(unknown))}")
+    target_dir = target_dir or output_dir
+    title = title or os.path.basename(os.path.normpath(os.path.abspath(output_dir)))
+    os.makedirs(target_dir, exist_ok=True)
+    cache_file = os.path.join(target_dir, EXPORT_CACHE_FILE)
+    sections_file = os.path.join(target_dir, EXPORT_SECTIONS_FILE)
+    previous_documents = _load_json(cache_file).get("documents", {})
+
+    result = {"output": output_dir, "written": [], "skipped": [], "sectionsRendered": 0, "sectionsReused": 0}
+    documents = {}
+    stale = []
+    for source_name, target_name in DOCUMENTS:
+        source_path = os.path.join(output_dir, source_name)
+        if not os.path.exists(source_path):
+            continue
+        with open(source_path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        target_base = os.path.join(target_dir, target_name)
+        state = {"hash": digest, "title": title, "formats": sorted(formats)}
+        previous = previous_documents.get(source_name, {})
+        if (not force and {key: previous.get(key) for key in state} == state
+                and all(os.path.exists(f"{target_base}.{fmt}") for fmt in formats)):
+            result["skipped"].extend(f"{target_base}.{fmt}" for fmt in formats)
+            documents[source_name] = previous
+        else:
+            stale.append((source_name, source_path, target_base, state))
+    if not stale:
+        return result
+
+    # Rendered sections are only loaded when a document changed
+    sections = _SectionCache(_load_json(sections_file).get("sections", {}))
+    for document in documents.values():
+        sections.keep(document.get("sections", []))
+    for source_name, source_path, target_base, state in stale:
+        sections.used = []
+        result["written"].extend(export_document(source_path, target_base, source_name, title, formats, sections))
+        documents[source_name] = dict(state, sections=sections.used)
+    result["sectionsRendered"] = sections.rendered
+    result["sectionsReused"] = sections.reused
+
+    _write_json(sections_file, {"version": EXPORT_VERSION, "sections": sections.current})
+    _write_json(cache_file, {"version": EXPORT_VERSION, "documents": documents})
+    return result
+
+
+def _export_entry(entry: Tuple[str, List[str], bool]) -> Dict[str, Any]:
+    # Module-level so it can run in a worker process
+    output_dir, formats, force = entry
+    try:
+        return export_documents(output_dir, formats, force=force)
+    except (OSError, ValueError) as e:
+        return {"output": output_dir, "error": f"{type(e).__name__}: {e}", "written": [], "skipped": []}
+
+
+def export_many(output_dirs: List[str], formats: Iterable[str] = EXPORT_FORMATS, workers: int = 1,
+                force: bool = False) -> List[Dict[str, Any]]:
+    """Export the documents of many output directories in one process (or a pool of `workers` processes)."""
+    entries = [(output_dir, list(formats), force) for output_dir in output_dirs]
+    if workers <= 1 or len(entries) <= 1:
+        return [_export_entry(entry) for entry in entries]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(_export_entry, entries, chunksize=max(1, len(entries) // (workers * 4))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export generated documents to Markdown and DOCX")
+    parser.add_argument("outputs", nargs="*", help="Output directories containing overview_doc.json/spec_doc.json")
+    parser.add_argument("--manifest", help="Batch manifest (JSONL); the output directory of every entry is exported")
+    parser.add_argument("--format", default=",".join(EXPORT_FORMATS), help="Comma-separated formats: md, docx")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to export many directories")
+    parser.add_argument("--force", action="store_true", help="Export again even if nothing changed")
+    args = parser.parse_args()
+
+    output_dirs = list(args.outputs)
+    if args.manifest:
+        # Read here rather than with batch.load_manifest, which would load the LLM libraries
+        with open(args.manifest) as f:
+            output_dirs.extend(json.loads(line)["output"] for line in f if line.strip())
+    if not output_dirs:
+        parser.error("no output directories given")
+
+    started_at = time.perf_counter()
+    results = export_many(output_dirs, args.format.split(","), args.workers, args.force)
+    failed = [result for result in results if result.get("error")]
+    for result in failed:
+        print(f"Error: {result['output']}: {result['error']}")
+    written = sum(len(result["written"]) for result in results)
+    skipped = sum(len(result["skipped"]) for result in results)
+    rendered = sum(result.get("sectionsRendered", 0) for result in results)
+    reused = sum(result.get("sectionsReused", 0) for result in results)
+    print(f"Export: {len(results)} directories, {written} files written, {skipped} unchanged, "
+          f"{rendered} sections rendered, {reused} reused in {time.perf_counter() - started_at:.2f}s")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
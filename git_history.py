@@ -0,0 +1,165 @@
+import os
+import json
+import math
+import heapq
+import subprocess
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Commits touching more files than this (mass renames, reformatting) say little about coupling
+COUPLING_MAX_FILES = 20
+# Pairs of files counted at most; beyond this only the half most often changed together are kept
+MAX_COUPLING_PAIRS = 200000
+# Pairs must have changed together this often to be reported
+MIN_COUPLING_COMMITS = 3
+
+_COMMIT_MARKER = '\x1e'
+_FIELD_SEPARATOR = '\x1f'
+
+
+class HistoryIndex:
+    """Churn, ownership and change coupling of the files in a git repository.
+
+    Built from one streamed `git log --numstat` and cached per source directory, keyed by the commit it
+    was built at; later runs only read the commits added since.
+    """
+
+    def __init__(self):
+        self.head = None
+        self.commits = 0
+        # path -> {"commits", "linesAdded", "linesDeleted", "lastChanged", "authors": {author: commits}}
+        self.files = {}
+        # "path\tpath" (sorted) -> commits touching both
+        self.pairs = {}
+
+    def update(self, source_dir: str, head: str, max_commits: int = 0):
+        """Read the commits since the indexed head (all of them, or the latest max_commits, at first)."""
+        if head == self.head:
+            return
+        revisions = [head]
+        if self.head and _is_ancestor(source_dir, self.head, head):
+            revisions = [f"{self.head}..{head}"]
+        else:
+            # History was rewritten (or nothing is indexed yet): start over
+            self.__init__()
+            if max_commits:
+                revisions.append(f"--max-count={max_commits}")
+        command = ['git', '-c', 'core.quotePath=false', 'log', '--numstat', '--no-merges', '--no-renames',
+                   '--relative', f'--format={_COMMIT_MARKER}%H{_FIELD_SEPARATOR}%ct{_FIELD_SEPARATOR}%aN',
+                   *revisions, '--', '.']
+        process = subprocess.Popen(command, cwd=source_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                   text=True, encoding='utf-8', errors='replace')
+        for commit in _parse_log(process.stdout):
+            self._add_commit(*commit)
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, command)
+        self.head = head
+
+    def _add_commit(self, timestamp: int, author: str, changes: List[Tuple[str, int, int]]):
+        self.commits += 1
+        for path, added, deleted in changes:
+            stats = self.files.get(path)
+            if stats is None:
+                stats = self.files[path] = {"commits": 0, "linesAdded": 0, "linesDeleted": 0,
+                                            "lastChanged": timestamp, "authors": {}}
+            stats["commits"] += 1
+            stats["linesAdded"] += added
+            stats["linesDeleted"] += deleted
+            stats["lastChanged"] = max(stats["lastChanged"], timestamp)
+            stats["authors"][author] = stats["authors"].get(author, 0) + 1
+
+        paths = sorted({path for path, _, _ in changes})
+        if 2 <= len(paths) <= COUPLING_MAX_FILES:
+            for i, first in enumerate(paths):
+                for second in paths[i + 1:]:
+                    key = f"{first}\t{second}"
+                    self.pairs[key] = self.pairs.get(key, 0) + 1
+            if len(self.pairs) > MAX_COUPLING_PAIRS:
+                # Pruning to half the cap frees room for many commits, so the rebuild stays rare
+                self.pairs = dict(heapq.nlargest(MAX_COUPLING_PAIRS // 2, self.pairs.items(), key=lambda item: item[1]))
+
+    def churn(self) -> Dict[str, float]:
+        """Change frequency of every file, scaled logarithmically to 0..1 (the most changed file is 1)."""
+        if not self.files:
+            return {}
+        top = math.log1p(max(stats["commits"] for stats in self.files.values()))
+        return {path: math.log1p(stats["commits"]) / top for path, stats in self.files.items()}
+
+    def file_summary(self, path: str) -> Optional[Dict[str, Any]]:
+        """Churn and ownership of one file: commits, lines changed, authors and the main author's share."""
+        stats = self.files.get(path)
+        if stats is None:
+            return None
+        owner, owned = max(stats["authors"].items(), key=lambda item: item[1])
+        return {
+            "commits": stats["commits"],
+            "linesChanged": stats["linesAdded"] + stats["linesDeleted"],
+            "authors": len(stats["authors"]),
+            "mainAuthor": owner,
+            "mainAuthorShare": round(owned / stats["commits"], 2),
+            "lastChanged": stats["lastChanged"]
+        }
+
+    def coupled_pairs(self, paths: Optional[Iterable[str]] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Files that often change together, strongest first.
+
+        Confidence is the share of the less frequently changed file's commits that also touched the other.
+        Only pairs of the given paths (e.g. the files still in the scan) are considered.
+        """
+        known = set(paths) if paths is not None else None
+        pairs = []
+        for key, count in self.pairs.items():
+            if count < MIN_COUPLING_COMMITS:
+                continue
+            first, second = key.split('\t')
+            if known is not None and (first not in known or second not in known):
+                continue
+            base = min(self.files[first]["commits"], self.files[second]["commits"])
+            pairs.append({"files": [first, second], "commits": count, "confidence": round(count / base, 2)})
+        pairs.sort(key=lambda pair: (-pair["confidence"] * pair["commits"], pair["files"]))
+        return pairs[:limit]
+
+    def load(self, cache_file: str):
+        """Load the aggregates of a previous run."""
+        try:
+            with open(cache_file) as f:
+                data = json.load(f)
+            self.head, self.commits, self.files, self.pairs = data["head"], data["commits"], data["files"], data["pairs"]
+        except (OSError, ValueError, KeyError):
+            self.__init__()
+
+    def save(self, cache_file: str):
+        """Persist the aggregates so the next run only reads new commits."""
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(cache_file + ".tmp", 'w') as f:
+            json.dump({"head": self.head, "commits": self.commits, "files": self.files, "pairs": self.pairs}, f)
+        os.replace(cache_file + ".tmp", cache_file)
+
+
+def _is_ancestor(source_dir: str, ancestor: str, head: str) -> bool:
+    return subprocess.run(['git', 'merge-base', '--is-ancestor', ancestor, head], cwd=source_dir,
+                          capture_output=True).returncode == 0
+
+
+def _parse_log(lines: Iterable[str]) -> Iterable[Tuple[int, str, List[Tuple[str, int, int]]]]:
+    """Parse streamed `git log --numstat` output into (timestamp, author, [(path, added, deleted)])."""
+    header = None
+    changes = []
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.startswith(_COMMIT_MARKER):
+            if header is not None:
+                yield header[0], header[1], changes
+            _, timestamp, author = line[1:].split(_FIELD_SEPARATOR, 2)
+            header = (int(timestamp), author)
+            changes = []
+        elif line and header is not None:
+            fields = line.split('\t', 2)
+            if len(fields) != 3:
+                continue
+            added, deleted, path = fields
+            if path.startswith('"') and path.endswith('"'):
+                path = path[1:-1]
+            # Binary files show "-" instead of line counts
+            changes.append((path, int(added) if added.isdigit() else 0, int(deleted) if deleted.isdigit() else 0))
+    if header is not None:
+        yield header[0], header[1], changes
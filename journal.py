@@ -0,0 +1,118 @@
+import os
+import json
+from typing import Any, Dict, List, Optional
+
+JOURNAL_FILE = "run_journal.jsonl"
+
+
+class RunJournal:
+    """Append-only JSON Lines record of a run, used to resume it after a failure.
+
+    Records have a "type":
+    - "scan": fingerprint of the scanned source (path and content hash of every file)
+    - "plan": one analysis chunk, in the order chunks are produced
+    - "chunk": the parsed component analyses of a finished chunk, and the model that answered them
+    - "call": the raw response of any other finished LLM call (overview, directory summaries, integration)
+
+    Only the offsets of finished records are kept in memory; their contents are read back on demand.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self._offsets = {}
+        self._planned = {}
+        self._scan_offset = None
+        self._last_read = (None, None)
+        if resume:
+            self._load()
+        elif os.path.exists(path):
+            os.remove(path)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _load(self):
+        """Index the records of a previous, interrupted run."""
+        if not os.path.exists(self.path):
+            print(f"Warning: No run journal found at {self.path}. Starting from the beginning.")
+            return
+        valid_end = 0
+        with open(self.path, 'rb') as f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A partially written last line from a crash is discarded
+                    break
+                valid_end = f.tell()
+                if record["type"] == "scan":
+                    self._scan_offset = offset
+                elif record["type"] == "plan":
+                    self._planned.setdefault(record["key"], record["index"])
+                else:
+                    self._offsets[(record["type"], record["key"])] = offset
+        with open(self.path, 'r+b') as f:
+            f.truncate(valid_end)
+        # How much of the current plan this covers is reported once the chunks are planned (report_resume)
+        print(f"Resuming run from {self.path}.")
+
+    def start(self, files: List[List[str]]):
+        """Record the scanned files, reporting files that changed since the interrupted run."""
+        if self._scan_offset is not None:
+            previous = dict(map(tuple, self._read(self._scan_offset)["files"]))
+            changed = sum(1 for path, content_hash in files if previous.get(path) != content_hash)
+            if changed:
+                print(f"Warning: {changed} files changed since the interrupted run. They will be analyzed again.")
+        self._scan_offset = self._append({"type": "scan", "files": files})
+
+    def plan(self, index: int, key: str, paths: List[str], tokens: int):
+        """Record a chunk of the analysis plan."""
+        if key not in self._planned:
+            self._planned[key] = index
+            self._append({"type": "plan", "index": index, "key": key, "paths": paths, "tokens": tokens})
+
+    def report_resume(self, done: int, planned: int, first_pending: Optional[int]):
+        """Report how many chunks of the current plan the interrupted run had already analyzed."""
+        next_step = (f"continued at chunk {first_pending + 1}" if first_pending is not None
+                     else "continued after the component analysis")
+        print(f"Resumed run from {self.path}: {done} of {planned} planned chunks were already analyzed, {next_step}.")
+
+    def is_done(self, kind: str, key: str) -> bool:
+        """Check whether a record of the given type and key was completed."""
+        return (kind, key) in self._offsets
+
+    def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """Read back a completed record, or None."""
+        offset = self._offsets.get((kind, key))
+        if offset is None:
+            return None
+        if self._last_read[0] == offset:
+            return self._last_read[1]
+        record = self._read(offset)
+        self._last_read = (offset, record)
+        return record
+
+    def record(self, kind: str, key: str, **fields: Any):
+        """Append a completed record."""
+        self._offsets[(kind, key)] = self._append({"type": kind, "key": key, **fields})
+
+    def _append(self, record: Dict[str, Any]) -> int:
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        return offset
+
+    def _read(self, offset: int) -> Dict[str, Any]:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def close(self, remove: bool = False):
+        """Close the journal; it is removed only once the run completed."""
+        if not self._file.closed:
+            self._file.close()
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,134 @@
+import time
+import random
+import asyncio
+from typing import Any, Dict, List, Optional
+from metrics import Metrics
+from utils import count_tokens
+
+# Substrings that identify rate-limit and transient server errors across LLM client libraries
+RETRYABLE_MARKERS = ['429', 'ResourceExhausted', 'Too Many Requests', 'rate limit',
+                     '500', '502', '503', '504', 'ServiceUnavailable', 'InternalServerError',
+                     'DeadlineExceeded', 'temporarily unavailable']
+
+
+class TokenBucket:
+    """Token bucket that refills continuously at a fixed rate per minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0):
+        """Wait until the requested amount is available, then take it."""
+        # Requests larger than the bucket would never fit, so cap them at a full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Check whether an LLM error is a rate limit (429) or a transient server error (5xx)."""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if callable(status):
+        status = status()
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        status = None
+    if status is not None and (status == 429 or 500 <= status < 600):
+        return True
+    text = f"{type(error).__name__} {error}"
+    return any(marker.lower() in text.lower() for marker in RETRYABLE_MARKERS)
+
+
+class LLMRunner:
+    """Runs prompts against an LLM with bounded concurrency, rate limiting and retries."""
+
+    def __init__(self, llm, max_concurrency: int = 4, requests_per_minute: float = 60,
+                 tokens_per_minute: float = 1000000, max_retries: int = 5,
+                 retry_base_delay: float = 1.0, retry_max_delay: float = 60.0,
+                 metrics: Optional[Metrics] = None, timeout: float = 0, tier: Optional[str] = None):
+        self.llm = llm
+        self.metrics = metrics or Metrics()
+        self.max_concurrency = max(1, max_concurrency)
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.retries = 0
+        # Seconds an attempt may take (0 = no limit). A timed-out call is not retried on the same model.
+        self.timeout = timeout
+        # Model tier of this runner when several are routed (model_router.py); tags its events
+        self.tier = tier
+        self._semaphores = {}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Semaphores are bound to an event loop, so keep one per running loop
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop]
+
+    async def ainvoke(self, prompt, inputs: Dict[str, Any], run_name: Optional[str] = None,
+                      stage: str = "llm", metrics: Optional[Metrics] = None, **fields: Any) -> str:
+        """Run a prompt with the given inputs, retrying rate-limit and server errors with jittered backoff.
+        
+        Events are recorded in `metrics` when given (e.g. per repository), otherwise in the runner's own,
+        with any extra fields.
+        """
+        metrics = metrics or self.metrics
+        if self.tier:
+            fields["tier"] = self.tier
+        chain = prompt | self.llm
+        config = {"run_name": run_name} if run_name else None
+        prompt_tokens = count_tokens(prompt.format(**inputs))
+        
+        queued_at = time.perf_counter()
+        async with self._semaphore():
+            attempt = 0
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(prompt_tokens)
+            # Latency covers every attempt; waiting for the first one's rate limit counts as queueing
+            started_at = time.perf_counter()
+            while True:
+                try:
+                    result = await asyncio.wait_for(chain.ainvoke(inputs, config=config), self.timeout or None)
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable_error(e):
+                        metrics.record(run_name or stage, stage, started_at, time.perf_counter() - started_at,
+                                       promptTokens=prompt_tokens, retries=attempt, error=type(e).__name__, **fields)
+                        raise
+                    # Full jitter keeps concurrent workers from retrying in lockstep
+                    delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+                    attempt += 1
+                    self.retries += 1
+                    print(f"Warning: LLM call failed ({e}). Retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries})")
+                    await asyncio.sleep(delay)
+                    await self.request_bucket.acquire(1)
+                    await self.token_bucket.acquire(prompt_tokens)
+                    continue
+                
+                metrics.record(run_name or stage, stage, started_at, time.perf_counter() - started_at,
+                               promptTokens=prompt_tokens, completionTokens=count_tokens(result),
+                               retries=attempt, queueSeconds=round(started_at - queued_at, 4), **fields)
+                return result
+
+    async def amap(self, prompt, inputs_list: List[Dict[str, Any]], run_names: Optional[List[str]] = None,
+                   stage: str = "llm") -> List[str]:
+        """Run a prompt over many inputs concurrently, returning results in input order."""
+        run_names = run_names or [None] * len(inputs_list)
+        return await asyncio.gather(*[
+            self.ainvoke(prompt, inputs, run_name, stage) for inputs, run_name in zip(inputs_list, run_names)
+        ])
@@ -1,9 +1,15 @@
 import os
+import json
 import argparse
+from typing import Optional
 from code_analyzer import CodeAnalyzer
-from doc_generator import DocumentGenerator
+from exporter import export_documents
+from metrics import Metrics
+from planner import AnalysisPlan, Budget, chunk_prompt_tokens
 from utils import setup_directories
 from config import LANGSMITH_API_KEY, LANGSMITH_PROJECT, LANGSMITH_ENDPOINT, LANGSMITH_TRACING
+from config import CACHE_DIR, CACHE_MAX_SIZE_MB, CACHE_MAX_AGE_DAYS, LLM_MAX_CONCURRENCY, SCAN_WORKERS
+from config import MAX_RUN_TOKENS, MAX_RUN_CALLS, EXPORT_FORMATS
 
 def setup_langsmith():
     """Set up LangSmith tracing if API key is available."""
@@ -27,30 +33,145 @@ def setup_langsmith():
     else:
         print("LangSmith API key not found. Tracing disabled.")
 
+def load_incremental_state(analyzer: CodeAnalyzer, output_dir: str, incremental: bool = False,
+                           since: Optional[str] = None):
+    """Load the previous specification and the files changed since it, or (None, None) for a full run."""
+    if not (incremental or since):
+        return None, None
+    
+    spec_path = os.path.join(output_dir, "spec_doc.json")
+    if not analyzer.git_repo:
+        print("Warning: Incremental mode requires a git repository. Running a full analysis.")
+        return None, None
+    if not os.path.exists(spec_path):
+        print(f"Warning: {spec_path} not found. Running a full analysis.")
+        return None, None
+    
+    with open(spec_path) as f:
+        previous_spec = json.load(f)
+    if any("sourcePath" not in component for component in previous_spec.get("components", [])):
+        print("Warning: Existing specification predates incremental mode. Running a full analysis.")
+        return None, None
+    
+    since = since or previous_spec.get("metadata", {}).get("sourceCommit")
+    if not since:
+        print("Warning: Existing specification has no source commit. Running a full analysis.")
+        return None, None
+    
+    changes = analyzer.diff_since(since)
+    print(f"Changes since {since[:12]}: {len(changes['added'])} added, "
+          f"{len(changes['modified'])} modified, {len(changes['deleted'])} deleted")
+    return previous_spec, changes
+
+def print_plan(plan: AnalysisPlan):
+    """Print the analysis chunks a run would send, with their estimated prompt tokens."""
+    compaction = {"before": 0, "after": 0}
+    chunk_count = 0
+    tokens = 0
+    print("Chunk plan:")
+    for chunk in plan.chunks(compaction):
+        chunk_tokens = chunk_prompt_tokens(chunk)
+        more = f" and {len(chunk.parts) - 1} more" if len(chunk.parts) > 1 else ""
+        print(f"  {chunk_count:5d}  {chunk_tokens:6d} tokens  {chunk.paths[0]}{more}")
+        chunk_count += 1
+        tokens += chunk_tokens
+    signatures = len(plan.signature_paths & {file_info.path for file_info in plan.files_to_analyze})
+    print(f"Files: {len(plan.files)} scanned, {len(plan.duplicates)} duplicates, "
+          f"{len(plan.files_to_analyze)} to analyze ({signatures} as signatures only), {len(plan.outline_paths)} outlined")
+    print(f"Estimated: {chunk_count} component analysis calls, {tokens} prompt tokens ({compaction['after']} of them "
+          f"code, {compaction['before']} before compaction), plus directory summaries, overview and integration")
+    if plan.budget.limited:
+        print(plan.describe_budget())
+
 def main():
     parser = argparse.ArgumentParser(description="Generate specification documents from source code")
     parser.add_argument("--source", "-s", help="Path to source code directory", default="source_code")
     parser.add_argument("--output", "-o", help="Output directory for generated docs", default="generated_docs")
+    parser.add_argument("--cache-dir", help="Directory for the persistent LLM result cache", default=CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true", help="Disable the persistent LLM result cache")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only re-analyze files changed since the commit recorded in the existing spec_doc.json")
+    parser.add_argument("--since", metavar="REF",
+                        help="Only re-analyze files changed since this git ref (implies --incremental)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run from the run journal in the output directory")
+    parser.add_argument("--concurrency", "-j", type=int, default=LLM_MAX_CONCURRENCY,
+                        help="Maximum number of concurrent LLM calls")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Write the run metrics report here (.prom for a Prometheus textfile, "
+                             "otherwise JSON; default: <output>/run_metrics.json)")
+    parser.add_argument("--trace", metavar="PATH", help="Also write a Chrome trace of the run to this file")
+    parser.add_argument("--max-tokens", type=int, default=MAX_RUN_TOKENS,
+                        help="Budget of estimated prompt tokens for the run (0 = unlimited); files that do not fit "
+                             "are analyzed from signatures or outlined without the LLM")
+    parser.add_argument("--max-calls", type=int, default=MAX_RUN_CALLS,
+                        help="Budget of LLM calls for the run (0 = unlimited)")
+    parser.add_argument("--dry-run", "--scan-only", dest="dry_run", action="store_true",
+                        help="Scan the source and print the chunk plan and token estimate without calling the LLM")
+    parser.add_argument("--scan-workers", type=int, default=SCAN_WORKERS,
+                        help="Threads/processes used to read and parse files during the scan (1 disables pools)")
+    parser.add_argument("--export", metavar="FORMATS", nargs="?", const=",".join(EXPORT_FORMATS),
+                        help="Also export the documents to these comma-separated formats (md, docx; default: both)")
     args = parser.parse_args()
     
+    # Record timings and token usage locally for every stage of the run
+    metrics = Metrics()
+    
+    # Analyze code
+    analyzer = CodeAnalyzer(args.source, cache_dir=None if args.no_cache else args.cache_dir,
+                            scan_workers=args.scan_workers, metrics=metrics)
+    code_analysis = analyzer.analyze()
+    
+    # Work out which files changed since the previous specification
+    previous_spec, changes = load_incremental_state(analyzer, args.output, args.incremental, args.since)
+    
+    budget = Budget(args.max_tokens, args.max_calls)
+    if args.dry_run:
+        print_plan(AnalysisPlan(code_analysis, previous_spec, changes, budget))
+        return
+    
+    # The LLM libraries take seconds to import, so they are only loaded for a real run
+    from doc_generator import DocumentGenerator
+    from cache import AnalysisCache
+    
     # Set up LangSmith for tracing
     setup_langsmith()
     
     # Set up directory structure
     setup_directories(args.output)
     
-    # Analyze code
-    analyzer = CodeAnalyzer(args.source)
-    code_analysis = analyzer.analyze()
+    # Reuse LLM results from previous runs where the inputs are unchanged
+    cache = None if args.no_cache else AnalysisCache(args.cache_dir, CACHE_MAX_SIZE_MB, CACHE_MAX_AGE_DAYS)
     
     # Generate documents
-    doc_generator = DocumentGenerator(code_analysis)
-    overview_file = doc_generator.generate_overview_document(args.output)
-    spec_file = doc_generator.generate_specification_document(args.output)
+    doc_generator = DocumentGenerator(code_analysis, cache=cache, max_concurrency=args.concurrency,
+                                      previous_spec=previous_spec, changes=changes, metrics=metrics,
+                                      resume=args.resume, budget=budget)
+    try:
+        documents = doc_generator.generate_documents(args.output)
+    except Exception:
+        print("Error: Document generation failed. Completed work is kept in the run journal; "
+              "run again with --resume to continue from there.")
+        raise
     
     print(f"Documents generated successfully:")
-    print(f"- Overview: {overview_file}")
-    print(f"- Specification: {spec_file}")
+    print(f"- Overview: {documents['overview']}")
+    print(f"- Specification: {documents['specification']}")
+    if args.export:
+        with metrics.span("export", "write"):
+            exported = export_documents(args.output, args.export.split(","))
+        for path in exported["written"] + exported["skipped"]:
+            print(f"- Export: {path}")
+    
+    if cache:
+        stats = cache.stats()
+        cache.close()
+        print(f"Cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hitRate']:.0%} hit rate)")
+    
+    print(metrics.format_summary())
+    metrics.write_report(args.metrics or os.path.join(args.output, "run_metrics.json"))
+    if args.trace:
+        metrics.write_chrome_trace(args.trace)
 
 if __name__ == "__main__": 
     main()
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# Per-event fields that are summed in the per-stage report
+SUMMED_FIELDS = ['promptTokens', 'completionTokens', 'retries', 'cacheHits', 'resumed', 'tokensSaved', 'bytes', 'files',
+                 'fallbacks']
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Metrics:
+    """Local, in-process record of where a run spends its time and tokens.
+    
+    Events are timed spans tagged with a stage (scan, chunking, component_analysis, ...) and
+    optional counters. Reports are written as JSON, a Prometheus textfile or a Chrome trace.
+    """
+
+    def __init__(self, listener: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.events = []
+        # Called with every event as it is recorded (e.g. to stream the progress of a server job)
+        self.listener = listener
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.started_at = time.time()
+
+    def _track_id(self) -> int:
+        # Concurrent coroutines get their own track so overlapping calls stay readable in a trace
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        return id(task) if task is not None else threading.get_ident()
+
+    def record(self, name: str, stage: str, start: float, duration: float, **fields: Any):
+        """Record an event that started at `start` (time.perf_counter) and lasted `duration` seconds."""
+        event = {
+            "name": name,
+            "stage": stage,
+            "start": start - self._origin,
+            "seconds": duration,
+            "track": self._track_id()
+        }
+        event.update(fields)
+        with self._lock:
+            self.events.append(event)
+        if self.listener:
+            self.listener(event)
+
+    @contextmanager
+    def span(self, name: str, stage: Optional[str] = None, **fields: Any):
+        """Time a block of work. The yielded dict can be updated with counters such as tokens."""
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.record(name, stage or name, start, time.perf_counter() - start, **fields)
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate events per stage (and per model tier, for routed LLM calls): count, wall time
+        percentiles and summed counters."""
+        stages = {}
+        tiers = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            stages.setdefault(event["stage"], []).append(event)
+            if "tier" in event:
+                tiers.setdefault(event["tier"], []).append(event)
+        
+        report = {
+            "startedAt": self.started_at,
+            "wallSeconds": round(time.perf_counter() - self._origin, 4),
+            "stages": {stage: _aggregate(stage_events) for stage, stage_events in stages.items()}
+        }
+        if tiers:
+            report["tiers"] = {tier: _aggregate(tier_events) for tier, tier_events in tiers.items()}
+        return report
+
+    def llm_totals(self) -> Dict[str, int]:
+        """LLM calls actually made (cache hits and resumed calls excluded) and their token counts."""
+        llm_stages = [entry for entry in self.summary()["stages"].values() if "promptTokens" in entry]
+        return {
+            "llmCalls": sum(entry["count"] - entry.get("cacheHits", 0) - entry.get("resumed", 0) for entry in llm_stages),
+            "promptTokens": sum(entry["promptTokens"] for entry in llm_stages),
+            "completionTokens": sum(entry.get("completionTokens", 0) for entry in llm_stages)
+        }
+
+    def format_summary(self) -> str:
+        """Human-readable one-line-per-stage summary."""
+        lines = ["Run metrics:"]
+        for stage, entry in self.summary()["stages"].items():
+            tokens = ""
+            if "promptTokens" in entry:
+                tokens = f", {entry['promptTokens']} prompt / {entry.get('completionTokens', 0)} completion tokens"
+            cache = f", {entry['cacheHits']} cached" if entry.get("cacheHits") else ""
+            resumed = f", {entry['resumed']} resumed" if entry.get("resumed") else ""
+            lines.append(f"  - {stage}: {entry['count']} x, {entry['totalSeconds']:.2f}s total, "
+                         f"p95 {entry['p95Seconds']:.2f}s{tokens}{cache}{resumed}")
+        for tier, entry in self.summary().get("tiers", {}).items():
+            failures = f", {entry['errors']} failed" if entry.get("errors") else ""
+            fallbacks = f", {entry['fallbacks']} taken over from another tier" if entry.get("fallbacks") else ""
+            lines.append(f"  - {tier} model: {entry['count']} calls, p50 {entry['p50Seconds']:.2f}s, "
+                         f"p95 {entry['p95Seconds']:.2f}s, {entry.get('promptTokens', 0)} prompt / "
+                         f"{entry.get('completionTokens', 0)} completion tokens{failures}{fallbacks}")
+        return "\n".join(lines)
+
+    def write_report(self, path: str):
+        """Write the per-stage report as JSON, or as a Prometheus textfile if the path ends in .prom."""
+        _ensure_parent(path)
+        if path.endswith(".prom"):
+            with open(path, 'w') as f:
+                f.write(self.to_prometheus())
+        else:
+            with open(path, 'w') as f:
+                json.dump(self.summary(), f, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Render the per-stage report in the Prometheus textfile exposition format."""
+        summary = self.summary()
+        lines = [
+            "# HELP specdoc_run_wall_seconds Wall time of the documentation run.",
+            "# TYPE specdoc_run_wall_seconds gauge",
+            f"specdoc_run_wall_seconds {summary['wallSeconds']}"
+        ]
+        metrics = [("count", "events", "Number of events per stage."),
+                   ("totalSeconds", "seconds_total", "Summed wall time per stage."),
+                   ("p95Seconds", "seconds_p95", "95th percentile wall time per stage.")]
+        metrics += [(field, _snake(field) + "_total", f"Summed {field} per stage.") for field in SUMMED_FIELDS]
+        for key, name, help_text in metrics:
+            samples = [(stage, entry[key]) for stage, entry in summary["stages"].items() if key in entry]
+            if not samples:
+                continue
+            lines.append(f"# HELP specdoc_stage_{name} {help_text}")
+            lines.append(f"# TYPE specdoc_stage_{name} gauge")
+            for stage, value in samples:
+                lines.append(f'specdoc_stage_{name}{{stage="{stage}"}} {value}')
+        metrics = [("count", "calls", "LLM calls per model tier."),
+                   ("totalSeconds", "seconds_total", "Summed LLM call time per model tier."),
+                   ("p95Seconds", "seconds_p95", "95th percentile LLM call time per model tier."),
+                   ("errors", "errors_total", "Failed LLM calls per model tier."),
+                   ("promptTokens", "prompt_tokens_total", "Summed prompt tokens per model tier."),
+                   ("completionTokens", "completion_tokens_total", "Summed completion tokens per model tier."),
+                   ("fallbacks", "fallbacks_total", "Calls taken over from another model tier.")]
+        for key, name, help_text in metrics:
+            samples = [(tier, entry[key]) for tier, entry in summary.get("tiers", {}).items() if key in entry]
+            if not samples:
+                continue
+            lines.append(f"# HELP specdoc_tier_{name} {help_text}")
+            lines.append(f"# TYPE specdoc_tier_{name} gauge")
+            for tier, value in samples:
+                lines.append(f'specdoc_tier_{name}{{tier="{tier}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write_chrome_trace(self, path: str):
+        """Write events in the Chrome trace format (open in chrome://tracing or Perfetto)."""
+        _ensure_parent(path)
+        pid = os.getpid()
+        tracks = {}
+        trace_events = []
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            tid = tracks.setdefault(event["track"], len(tracks) + 1)
+            args = {key: value for key, value in event.items() if key not in ("name", "stage", "start", "seconds", "track")}
+            trace_events.append({
+                "name": event["name"],
+                "cat": event["stage"],
+                "ph": "X",
+                "ts": round(event["start"] * 1e6),
+                "dur": round(event["seconds"] * 1e6),
+                "pid": pid,
+                "tid": tid,
+                "args": args
+            })
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+def _aggregate(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    durations = [event["seconds"] for event in events]
+    entry = {
+        "count": len(events),
+        "totalSeconds": round(sum(durations), 4),
+        "p50Seconds": round(_percentile(durations, 0.5), 4),
+        "p95Seconds": round(_percentile(durations, 0.95), 4),
+        "maxSeconds": round(max(durations), 4)
+    }
+    errors = sum(1 for event in events if "error" in event)
+    if errors:
+        entry["errors"] = errors
+    for field in SUMMED_FIELDS:
+        values = [event[field] for event in events if field in event]
+        if values:
+            entry[field] = sum(values)
+    return entry
+
+
+def _snake(name: str) -> str:
+    return ''.join(f"_{ch.lower()}" if ch.isupper() else ch for ch in name)
+
+
+def _ensure_parent(path: str):
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
@@ -0,0 +1,69 @@
+import asyncio
+from typing import Any, Dict, Optional, Tuple
+from llm_runner import LLMRunner, is_retryable_error
+from metrics import Metrics
+
+# Model tiers: light for routine component analyses, strong for core files and the later stages
+LIGHT_TIER = "light"
+STRONG_TIER = "strong"
+
+
+class ModelRouter:
+    """Sends each LLM call to a model tier, each tier with its own runner (client, output cap,
+    concurrency and rate limits).
+
+    A call that still fails on its tier after that runner's retries with a rate limit or server error
+    (429/5xx), or times out, is tried once on the tier's fallback. Other errors (authentication, bad
+    requests, prompt errors) would fail there too and are raised. Calls to a tier that is not
+    configured go to the strong tier, so a router with a single runner behaves like that runner.
+    Runners tag their metrics events with the tier, which gives the per-tier latency and token report
+    (Metrics.summary()["tiers"]).
+    """
+
+    def __init__(self, runners: Dict[str, LLMRunner], models: Dict[str, str],
+                 fallbacks: Optional[Dict[str, str]] = None):
+        self.runners = runners
+        self.models = models
+        self.fallbacks = fallbacks or {}
+        self.default_tier = STRONG_TIER if STRONG_TIER in runners else next(iter(runners))
+
+    @property
+    def routed(self) -> bool:
+        return len(self.runners) > 1
+
+    @property
+    def llm(self):
+        return self.runners[self.default_tier].llm
+
+    @property
+    def metrics(self) -> Metrics:
+        return self.runners[self.default_tier].metrics
+
+    @property
+    def max_concurrency(self) -> int:
+        return sum(runner.max_concurrency for runner in self.runners.values())
+
+    def tier(self, tier: Optional[str]) -> str:
+        """The configured tier a call for `tier` goes to."""
+        return tier if tier in self.runners else self.default_tier
+
+    def model_name(self, tier: Optional[str] = None) -> str:
+        """Model behind a tier; part of cache and journal keys, as results differ between models."""
+        return self.models[self.tier(tier)]
+
+    async def ainvoke(self, prompt, inputs: Dict[str, Any], run_name: Optional[str] = None, stage: str = "llm",
+                      metrics: Optional[Metrics] = None, tier: Optional[str] = None) -> Tuple[str, str]:
+        """Run a prompt on a tier, falling back to another tier if it fails there.
+
+        Returns the response and the tier that answered it.
+        """
+        tier = self.tier(tier)
+        try:
+            return await self.runners[tier].ainvoke(prompt, inputs, run_name, stage, metrics), tier
+        except Exception as e:
+            fallback = self.fallbacks.get(tier)
+            if fallback not in self.runners or not (isinstance(e, asyncio.TimeoutError) or is_retryable_error(e)):
+                raise
+            print(f"Warning: {stage} call on the {tier} model failed ({type(e).__name__}: {e}). "
+                  f"Trying the {fallback} model.")
+            return await self.runners[fallback].ainvoke(prompt, inputs, run_name, stage, metrics, fallbacks=1), fallback
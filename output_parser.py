@@ -0,0 +1,117 @@
+import json
+from typing import Any, List, Optional, Tuple, Type, TypeVar
+from pydantic import BaseModel, ValidationError
+
+Schema = TypeVar("Schema", bound=BaseModel)
+
+# Control characters inside strings (raw newlines, tabs) are accepted, as models often emit them
+_decoder = json.JSONDecoder(strict=False)
+_CLOSERS = {'{': '}', '[': ']'}
+# Bounds the work spent on a response that is not JSON at all
+MAX_START_CANDIDATES = 3
+MAX_REPAIR_ATTEMPTS = 12
+
+
+class OutputParseError(ValueError):
+    """Raised when an LLM response cannot be turned into the expected structure."""
+
+
+def parse_json(text: str) -> Tuple[Any, bool]:
+    """Parse the first JSON object in an LLM response and return (value, repaired).
+
+    Prose and code fences around the object are skipped. If the object does not decode as is,
+    trailing commas are dropped and a truncated object is closed after its last complete value.
+    """
+    start = text.find('{')
+    for _ in range(MAX_START_CANDIDATES):
+        if start < 0:
+            break
+        try:
+            # raw_decode stops at the end of the object, so trailing text costs nothing
+            return _decoder.raw_decode(text, start)[0], False
+        except json.JSONDecodeError:
+            pass
+        repaired = _repair(text, start)
+        if repaired is not None:
+            return repaired, True
+        start = text.find('{', start + 1)
+    raise OutputParseError("no JSON object found in the response")
+
+
+def _repair(text: str, start: int) -> Optional[Any]:
+    """Scan the object starting at `start` once, fixing what can be fixed, and decode the result."""
+    out = []
+    stack = []
+    cut_points = []  # (length of out, open brackets) just before each comma
+    in_string = escape = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(char)
+        elif char in '}]':
+            if not stack:
+                break
+            # Drop a trailing comma before the closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            stack.pop()
+            out.append(char)
+            if not stack:
+                return _loads(''.join(out))
+            continue
+        elif char == ',':
+            cut_points.append((len(out), ''.join(stack)))
+        out.append(char)
+
+    # The response ended inside the object: close it at the end, or after the last complete element
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    candidates = [(len(out), ''.join(stack))] + cut_points[::-1]
+    for length, open_brackets in candidates[:MAX_REPAIR_ATTEMPTS]:
+        value = _loads(''.join(out[:length]) + ''.join(_CLOSERS[c] for c in reversed(open_brackets)))
+        if value is not None:
+            return value
+    return None
+
+
+def _loads(text: str) -> Optional[Any]:
+    try:
+        return _decoder.decode(text)
+    except json.JSONDecodeError:
+        return None
+
+
+def parse_structured(text: str, schema: Type[Schema]) -> Schema:
+    """Parse an LLM response and validate it against a pydantic schema."""
+    value, _ = parse_json(text)
+    if not isinstance(value, dict):
+        raise OutputParseError("expected a JSON object")
+    try:
+        return schema.model_validate(value)
+    except ValidationError as e:
+        raise OutputParseError(describe_errors(e)) from e
+
+
+def describe_errors(error: ValidationError, limit: int = 3) -> str:
+    """Summarize validation errors in one line, suitable for re-prompting the model."""
+    messages: List[str] = [
+        f"{'.'.join(str(part) for part in item['loc']) or 'response'}: {item['msg']}"
+        for item in error.errors()[:limit]
+    ]
+    more = len(error.errors()) - limit
+    return "; ".join(messages) + (f" (and {more} more)" if more > 0 else "")
@@ -0,0 +1,136 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+from structure_index import parse_source
+
+# Number of leading bytes inspected to decide whether a file is binary
+BINARY_SNIFF_BYTES = 8192
+
+
+def is_binary(head: bytes) -> bool:
+    """Sniff whether a file is binary from its first bytes."""
+    if b'\0' in head:
+        return True
+    # Mostly non-text control characters also indicate binary data
+    control = sum(1 for byte in head if byte < 32 and byte not in (9, 10, 12, 13))
+    return bool(head) and control / len(head) > 0.3
+
+
+def read_source(abs_path: str) -> Tuple[Optional[str], int]:
+    """Read a file as text. Returns (None, size) for binary or unreadable files."""
+    try:
+        with open(abs_path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        print(f"Error reading {abs_path}: {e}")
+        return None, 0
+    if is_binary(data[:BINARY_SNIFF_BYTES]):
+        return None, len(data)
+    return data.decode('utf-8', errors='ignore'), len(data)
+
+
+class ScanStats:
+    """Throughput counters for the file reading and parsing phase of a scan."""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.binary = 0
+        self.cached = 0
+        self.started_at = time.perf_counter()
+        self.seconds = 0.0
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        seconds = self.seconds or 1e-9
+        return {
+            "filesRead": self.files,
+            "bytesRead": self.bytes,
+            "binarySkipped": self.binary,
+            "cachedFiles": self.cached,
+            "seconds": round(self.seconds, 3),
+            "filesPerSecond": round(self.files / seconds, 1),
+            "bytesPerSecond": round(self.bytes / seconds, 1)
+        }
+
+    def report(self) -> str:
+        stats = self.to_dict()
+        return (f"Scan: read {stats['filesRead']} files ({stats['bytesRead'] / 1e6:.1f} MB) in {stats['seconds']:.2f}s "
+                f"({stats['filesPerSecond']:.0f} files/s, {stats['bytesPerSecond'] / 1e6:.1f} MB/s), "
+                f"{stats['cachedFiles']} unchanged, {stats['binarySkipped']} binary skipped")
+
+
+class ScanPools:
+    """Reader threads and parser processes that several scans can share, so workers start only once."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.readers = ThreadPoolExecutor(max_workers=workers)
+        self.parsers = ProcessPoolExecutor(max_workers=workers)
+
+    def close(self):
+        self.readers.shutdown()
+        self.parsers.shutdown()
+
+    def __enter__(self) -> "ScanPools":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def parse_files(records: Iterable[Any], workers: int, stats: ScanStats,
+                pools: Optional[ScanPools] = None) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+    """Read files on a thread pool and parse them on a process pool, yielding (record, parse result).
+    
+    Records need path, abs_path, language, size and mtime attributes. At most a few batches
+    of file contents are in flight at once, so memory stays bounded. With one worker and no
+    shared pools, files are read and parsed in the calling thread.
+    """
+    def count(content, size):
+        stats.files += 1
+        stats.bytes += size
+        if content is None:
+            stats.binary += 1
+        return content
+    
+    if pools is None and workers <= 1:
+        for record in records:
+            content, size = read_source(record.abs_path)
+            content = count(content, size)
+            yield record, parse_source(record.path, record.language, content, [record.size, record.mtime])
+        return
+    
+    if pools is None:
+        with ScanPools(workers) as own_pools:
+            yield from parse_files(records, workers, stats, own_pools)
+        return
+    
+    window = pools.workers * 4
+    reads = deque()
+    parses = deque()
+    
+    def drain_read():
+        record, future = reads.popleft()
+        content, size = future.result()
+        content = count(content, size)
+        parses.append((record, pools.parsers.submit(
+            parse_source, record.path, record.language, content, [record.size, record.mtime]
+        )))
+    
+    for record in records:
+        reads.append((record, pools.readers.submit(read_source, record.abs_path)))
+        if len(reads) >= window:
+            drain_read()
+        while len(parses) >= window:
+            record, future = parses.popleft()
+            yield record, future.result()
+    
+    while reads:
+        drain_read()
+    while parses:
+        record, future = parses.popleft()
+        yield record, future.result()
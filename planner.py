@@ -0,0 +1,356 @@
+import os
+import json
+import math
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from chunker import Chunk, iter_chunks
+from utils import estimate_tokens
+from prompts import COMPONENT_TEMPLATE, MULTI_COMPONENT_TEMPLATE, DIRECTORY_TEMPLATE, OVERVIEW_TEMPLATE
+from prompts import INTEGRATION_TEMPLATE
+from config import ANALYSIS_CHUNK_TOKENS, MAX_FILES_PER_CHUNK, SIGNATURE_ONLY_FRACTION, BUDGET_RESERVE_FRACTION
+from config import SUMMARY_BUDGET_FRACTION, REDUCE_TOKEN_BUDGET
+from config import STRUCTURE_TOKEN_BUDGET, INTEGRATION_CONTEXT_TOKENS, MAX_OUTPUT_TOKENS
+from config import STRONG_TIER_FRACTION, LIGHT_TIER_MAX_CHUNK_TOKENS, LIGHT_MAX_OUTPUT_TOKENS
+from model_router import LIGHT_TIER, STRONG_TIER
+
+# Under a budget a file is analyzed in full, from its signatures only (about SIGNATURE_TOKEN_RATIO of
+# the tokens), or outlined from the structure index without an LLM call
+SIGNATURE_TOKEN_RATIO = 0.5
+# Rough size of one compact component analysis when it is fed into a summary
+COMPACT_COMPONENT_TOKENS = 150
+# Code of the key components sent with the overview prompt (3 samples of up to 2000 characters), and the
+# change coupling sent with the integration prompt
+OVERVIEW_SAMPLE_TOKENS = 1500
+COUPLING_PROMPT_TOKENS = 500
+# Output tokens a component analysis may take: batching packs as many files as fit in MAX_OUTPUT_TOKENS
+COMPONENT_OUTPUT_TOKENS = MAX_OUTPUT_TOKENS // MAX_FILES_PER_CHUNK
+# Weight of a file's change frequency (0..1) in its importance; the most changed file gains as much as
+# a 3 KB file does from its size
+CHURN_WEIGHT = 3.0
+
+# Framing around each file of a multi-file prompt
+_PART_FRAMING = "File path: \nLanguage: \n\nCode:\n```\n\n```\n\n"
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised when an LLM call would take the run over its token or call budget."""
+
+
+class Budget:
+    """Limits on the prompt tokens and LLM calls of one run (0 means unlimited).
+
+    Every call is checked before it is sent. Part of the budget is held back for the later stages:
+    component analyses leave the reserve for directory summaries, integration and the overview,
+    directory summaries leave the part kept for integration and the overview, and integration leaves
+    the overview's. With a budget the overview runs last (DocumentGenerator.agenerate_documents).
+    """
+
+    def __init__(self, max_tokens: int = 0, max_calls: int = 0):
+        self.max_tokens = max_tokens
+        self.max_calls = max_calls
+        self.tokens = 0
+        self.calls = 0
+        self.refused = 0
+        self.reserve = {}
+
+    @property
+    def limited(self) -> bool:
+        return bool(self.max_tokens or self.max_calls)
+
+    def set_reserve(self, summary: Tuple[int, int], integration: Tuple[int, int], overview: Tuple[int, int]):
+        """Hold back (tokens, calls) for directory summaries, integration and the overview."""
+        self.reserve = {
+            "component_analysis": (summary[0] + integration[0] + overview[0], summary[1] + integration[1] + overview[1]),
+            "directory_summary": (integration[0] + overview[0], integration[1] + overview[1]),
+            "integration": overview
+        }
+
+    def allows(self, tokens: int, calls: int = 1, stage: str = "") -> bool:
+        """Whether a call of the given stage fits in what is left, keeping the reserve of later stages."""
+        keep_tokens, keep_calls = self.reserve.get(stage, (0, 0))
+        if self.max_tokens and self.tokens + tokens > self.max_tokens - keep_tokens:
+            return False
+        if self.max_calls and self.calls + calls > self.max_calls - keep_calls:
+            return False
+        return True
+
+    def spend(self, tokens: int, calls: int = 1, stage: str = ""):
+        """Account for a call about to be sent, or raise BudgetExceeded if it does not fit."""
+        if not self.allows(tokens, calls, stage):
+            self.refused += 1
+            raise BudgetExceeded(f"{stage or 'LLM'} call of about {tokens} tokens is over the run's budget")
+        self.tokens += tokens
+        self.calls += calls
+
+    def summary(self) -> Dict[str, int]:
+        return {"maxTokens": self.max_tokens, "maxCalls": self.max_calls, "usedTokens": self.tokens,
+                "usedCalls": self.calls, "refusedCalls": self.refused}
+
+
+def chunk_prompt_tokens(chunk: Chunk) -> int:
+    """Estimated prompt tokens of the component analysis request for a chunk."""
+    if len(chunk.parts) == 1:
+        part = chunk.parts[0]
+        return estimate_tokens(COMPONENT_TEMPLATE + part.path + part.language) + part.tokens
+    return estimate_tokens(MULTI_COMPONENT_TEMPLATE) + sum(
+        estimate_tokens(_PART_FRAMING + part.path + part.language) + part.tokens for part in chunk.parts
+    )
+
+
+def file_importance(file_info, index=None, churn: Optional[Dict[str, float]] = None) -> float:
+    """Calculate an importance score for a file from its centrality in the import graph and its churn."""
+    importance = 0.0
+    path = file_info.path.lower()
+
+    if index is not None and index.rank:
+        # Files that many other files depend on (directly or transitively) matter most
+        importance += 10.0 * index.rank.get(file_info.path, 0.0)
+    elif any(keyword in path for keyword in ['main', 'app', 'index', 'core']):
+        importance += 10.0
+
+    if 'test' in path:
+        importance -= 5.0  # Tests are less important for specifications
+
+    # Files that change often are where the active development happens
+    if churn:
+        importance += CHURN_WEIGHT * churn.get(file_info.path, 0.0)
+
+    # Consider file size (larger files might contain more logic)
+    # But not too large as they might be data files
+    size = file_info.size
+    if 100 <= size <= 10000:
+        importance += min(size / 1000, 5.0)
+
+    return importance
+
+
+def iter_analysis_chunks(files: List[Any], signature_paths: Optional[set] = None,
+                         compaction: Optional[Dict[str, int]] = None) -> Iterator[Chunk]:
+    """Yield analysis chunks, reading and compacting each file only when it is reached.
+
+    Estimated tokens before and after compaction are added up in `compaction`.
+    """
+    signature_paths = signature_paths or set()
+    compaction = compaction if compaction is not None else {"before": 0, "after": 0}
+
+    def contents():
+        for file_info in files:
+            content = file_info.read(signatures_only=file_info.path in signature_paths)
+            # File sizes are in bytes, close enough to characters for an estimate
+            compaction["before"] += file_info.size // 4 + 1
+            compaction["after"] += estimate_tokens(content)
+            yield file_info.path, file_info.language, content
+
+    return iter_chunks(contents(), ANALYSIS_CHUNK_TOKENS, MAX_FILES_PER_CHUNK)
+
+
+class AnalysisPlan:
+    """Which files a run analyzes and how, worked out from the scan alone.
+
+    Building a plan needs no LLM libraries, so it also backs the --dry-run mode of main.py. With a
+    limited budget, files are taken in order of importance and each is analyzed in full, from its
+    signatures or only outlined, depending on what still fits.
+    """
+
+    def __init__(self, code_analysis: Dict[str, Any], previous_spec: Optional[Dict[str, Any]] = None,
+                 changes: Optional[Dict[str, List[str]]] = None, budget: Optional[Budget] = None):
+        # Sort files by likely importance
+        index = code_analysis.get("structure_index")
+        history = code_analysis.get("git_history")
+        churn = history.churn() if history else None
+        self.files = sorted(code_analysis["files"], key=lambda file_info: file_importance(file_info, index, churn))
+
+        # Duplicates are analyzed once, through the representative of their cluster
+        self.clusters = code_analysis.get("duplicate_clusters", {})
+        self.duplicates = {member for members in self.clusters.values() for member in members}
+
+        # In incremental mode only added and modified files are analyzed again
+        self.previous_components = {}
+        self.reusable_summaries = {}
+        self.stale = None
+        self.files_to_analyze = [file_info for file_info in self.files if file_info.path not in self.duplicates]
+        if previous_spec is not None and changes is not None:
+            changed = set(changes["added"]) | set(changes["modified"])
+            self.stale = changed | set(changes["deleted"])
+            self.previous_components = {
+                component["sourcePath"]: component
+                for component in previous_spec.get("components", [])
+                if component.get("sourcePath") not in self.stale and not component.get("outline")
+            }
+            self.reusable_summaries = previous_spec.get("directorySummaries", {})
+            # Files that stopped being duplicates have no previous component of their own
+            self.files_to_analyze = [file_info for file_info in self.files_to_analyze
+                                     if file_info.path in changed or file_info.path not in self.previous_components]
+
+        # The least important files are analyzed from their signatures only
+        self.signature_paths = {file_info.path for file_info in self.files[:int(len(self.files) * SIGNATURE_ONLY_FRACTION)]}
+        # ...and the most important ones by the strong model tier
+        strong_count = math.ceil(len(self.files) * STRONG_TIER_FRACTION)
+        self.strong_paths = {file_info.path for file_info in self.files[len(self.files) - strong_count:]}
+
+        # Files left to a cheap outline, and the directories summarized by the LLM (None: all), because
+        # of the budget
+        self.outline_paths = set()
+        self.summary_directories = None
+        self.unsummarized = 0
+        self.budget = budget or Budget()
+        self.estimate = {"tokens": 0, "calls": 0}
+        if self.budget.limited:
+            self._apply_budget(code_analysis)
+
+    @property
+    def incremental(self) -> bool:
+        return self.stale is not None
+
+    def chunks(self, compaction: Optional[Dict[str, int]] = None) -> Iterator[Chunk]:
+        """Yield the analysis chunks of the files to analyze.
+
+        Without a budget the most important files come last; with one they come first, so that if the
+        estimates were too low the budget runs out on the least important files.
+        """
+        files = self.files_to_analyze[::-1] if self.budget.limited else self.files_to_analyze
+        return iter_analysis_chunks(files, self.signature_paths, compaction)
+
+    def tier(self, chunk: Chunk) -> str:
+        """Model tier for a chunk: strong for important files and for chunks too large for the light model."""
+        if any(part.path in self.strong_paths for part in chunk.parts):
+            return STRONG_TIER
+        if chunk.tokens > LIGHT_TIER_MAX_CHUNK_TOKENS or len(chunk.parts) * COMPONENT_OUTPUT_TOKENS > LIGHT_MAX_OUTPUT_TOKENS:
+            return STRONG_TIER
+        return LIGHT_TIER
+
+    def describe_budget(self) -> str:
+        """One line on how the budget is spent, for the start of a run and for --dry-run."""
+        analyzed = len(self.files_to_analyze)
+        signatures = len(self.signature_paths & {file_info.path for file_info in self.files_to_analyze})
+        limits = ", ".join(f"{value} {name}" for name, value in
+                           [("prompt tokens", self.budget.max_tokens), ("calls", self.budget.max_calls)] if value)
+        line = (f"Budget of {limits}: {analyzed - signatures} files analyzed in full, {signatures} from signatures, "
+                f"{len(self.outline_paths)} outlined without the LLM (about {self.estimate['tokens']} prompt tokens "
+                f"in {self.estimate['calls']} component analysis calls)")
+        summarized = len(self.summary_directories or ())
+        if self.unsummarized:
+            line += (f"; {summarized} of {summarized + self.unsummarized} directories summarized, "
+                     f"{self.unsummarized} listed without the LLM")
+        return line
+
+    def _plan_summaries(self, paths: List[str], final: Tuple[int, int]) -> Tuple[int, int]:
+        """Pick the directories summarized by the LLM, largest first, and return their (tokens, calls).
+
+        Every directory with more than one item (file analyses and sub-directory summaries) is summarized,
+        as in DocumentGenerator._reduce_project. Those that do not fit in SUMMARY_BUDGET_FRACTION of the
+        budget are listed without the LLM.
+        """
+        budget = self.budget
+        items = {}
+        for path in paths:
+            directory = os.path.dirname(path)
+            items[directory] = items.get(directory, 0) + 1
+        directories = set()
+        for directory in list(items):
+            while directory and directory not in directories:
+                directories.add(directory)
+                directory = os.path.dirname(directory)
+        # Deepest first, so a directory's items are all counted before it is counted in its parent
+        for directory in sorted(directories, key=lambda directory: directory.count("/"), reverse=True):
+            if items.get(directory):
+                parent = os.path.dirname(directory)
+                items[parent] = items.get(parent, 0) + 1
+
+        # In incremental mode the summaries of unchanged directories are reused
+        dirty = set()
+        for path in self.stale or ():
+            directory = os.path.dirname(path)
+            while directory and directory not in dirty:
+                dirty.add(directory)
+                directory = os.path.dirname(directory)
+        candidates = sorted(((count, directory) for directory, count in items.items()
+                             if directory and count > 1
+                             and not (self.incremental and directory not in dirty and directory in self.reusable_summaries)),
+                            reverse=True)
+
+        token_cap = math.inf
+        if budget.max_tokens:
+            token_cap = min(budget.max_tokens * SUMMARY_BUDGET_FRACTION, budget.max_tokens - final[0])
+        call_cap = math.inf
+        if budget.max_calls:
+            call_cap = min(math.floor(budget.max_calls * SUMMARY_BUDGET_FRACTION), budget.max_calls - final[1])
+        template_tokens = estimate_tokens(DIRECTORY_TEMPLATE)
+        tokens = calls = 0
+        self.summary_directories = set()
+        for count, directory in candidates:
+            directory_tokens = template_tokens + count * COMPACT_COMPONENT_TOKENS
+            # Directories too large for one prompt are summarized in groups, then the group summaries
+            groups = math.ceil(directory_tokens / REDUCE_TOKEN_BUDGET)
+            directory_calls = groups + 1 if groups > 1 else 1
+            directory_tokens += (directory_calls - 1) * (template_tokens + COMPACT_COMPONENT_TOKENS)
+            if tokens + directory_tokens <= token_cap and calls + directory_calls <= call_cap:
+                tokens += directory_tokens
+                calls += directory_calls
+                self.summary_directories.add(directory)
+        self.unsummarized = len(candidates) - len(self.summary_directories)
+        return tokens, calls
+
+    def _apply_budget(self, code_analysis: Dict[str, Any]):
+        """Reserve budget for the later stages, then pick how to analyze each file, most important first."""
+        budget = self.budget
+        paths = [file_info.path for file_info in self.files if file_info.path not in self.duplicates]
+        overview_tokens = (estimate_tokens(OVERVIEW_TEMPLATE) + OVERVIEW_SAMPLE_TOKENS
+                           + estimate_tokens(json.dumps(code_analysis.get("key_components", []), indent=2)))
+        integration_tokens = (estimate_tokens(INTEGRATION_TEMPLATE) + STRUCTURE_TOKEN_BUDGET + COUPLING_PROMPT_TOKENS
+                              + min(INTEGRATION_CONTEXT_TOKENS, len(paths) * COMPACT_COMPONENT_TOKENS))
+        final_tokens = overview_tokens + integration_tokens
+        # The overview and integration never take more than BUDGET_RESERVE_FRACTION of the budget, nor the
+        # directory summaries more than SUMMARY_BUDGET_FRACTION; a call over its stage's share is refused
+        # (and the section is filled in without the LLM) at run time
+        token_cap = int(budget.max_tokens * BUDGET_RESERVE_FRACTION)
+        call_cap = min(budget.max_calls, max(2, math.ceil(budget.max_calls * BUDGET_RESERVE_FRACTION)))
+        final = (min(final_tokens, token_cap), min(2, call_cap))
+        summary = self._plan_summaries(paths, final)
+        # The final share is split between the overview and integration in proportion to their estimates
+        overview = (final[0] * overview_tokens // final_tokens, min(1, final[1]))
+        budget.set_reserve(summary, (final[0] - overview[0], final[1] - overview[1]), overview)
+
+        tokens_left = budget.max_tokens - final[0] - summary[0] if budget.max_tokens else math.inf
+        calls_left = budget.max_calls - final[1] - summary[1] if budget.max_calls else math.inf
+        call_overhead = estimate_tokens(MULTI_COMPONENT_TEMPLATE)
+
+        def cost(file_info, ratio: float) -> Tuple[float, float]:
+            code = (file_info.size // 4 + 1) * ratio + estimate_tokens(_PART_FRAMING + file_info.path)
+            # Small files share a call; large ones are split over several
+            calls = max(code / ANALYSIS_CHUNK_TOKENS, 1 / MAX_FILES_PER_CHUNK)
+            return code + calls * call_overhead, calls
+
+        tokens = calls = 0.0
+        for file_info in reversed(self.files_to_analyze):
+            ratios = [SIGNATURE_TOKEN_RATIO] if file_info.path in self.signature_paths else [1.0, SIGNATURE_TOKEN_RATIO]
+            for ratio in ratios:
+                file_tokens, file_calls = cost(file_info, ratio)
+                if tokens + file_tokens <= tokens_left and calls + file_calls <= calls_left:
+                    tokens += file_tokens
+                    calls += file_calls
+                    if ratio < 1.0:
+                        self.signature_paths.add(file_info.path)
+                    break
+            else:
+                self.outline_paths.add(file_info.path)
+        self.files_to_analyze = [file_info for file_info in self.files_to_analyze
+                                 if file_info.path not in self.outline_paths]
+
+        # File sizes only approximate the prompts. The real chunks (files read and compacted) are checked
+        # the way the run admits them, and the files of chunks that would be refused are outlined, so the
+        # run analyzes exactly the files planned here.
+        while True:
+            refused = set()
+            tokens = calls = 0
+            for chunk in self.chunks():
+                chunk_tokens = chunk_prompt_tokens(chunk)
+                if tokens + chunk_tokens <= tokens_left and calls + 1 <= calls_left:
+                    tokens += chunk_tokens
+                    calls += 1
+                else:
+                    refused.update(chunk.paths)
+            if not refused:
+                break
+            self.outline_paths |= refused
+            self.files_to_analyze = [file_info for file_info in self.files_to_analyze if file_info.path not in refused]
+        self.estimate = {"tokens": tokens, "calls": calls}
@@ -1,9 +1,8 @@
-from langchain.prompts import PromptTemplate
+# Templates are plain strings so that planning can size prompts without loading LangChain; the
+# PromptTemplate objects (overview_prompt, component_prompt, ...) are created on first access
 
 # Overview document prompt
-overview_prompt = PromptTemplate(
-    input_variables=["languages", "components", "code_samples"],
-    template="""
+OVERVIEW_TEMPLATE = """
     You are a software documentation specialist. Based on the code analysis provided, 
     generate a comprehensive software overview document in JSON format. Include:
 
@@ -40,12 +39,9 @@ overview_prompt = PromptTemplate(
       "developmentConsiderations": "Text describing development considerations..."
     }}
     """
-)
 
 # Component analysis prompt
-component_prompt = PromptTemplate(
-    input_variables=["file_path", "language", "code"],
-    template="""
+COMPONENT_TEMPLATE = """
     You are a software specification writer. For the following code, analyze the component and return a JSON object:
     
     File path: {file_path}
@@ -81,12 +77,48 @@ component_prompt = PromptTemplate(
       "notes": "Any important implementation details"
     }}
     """
-)
+
+# Multi-file component analysis prompt (several small files packed into one request)
+MULTI_COMPONENT_TEMPLATE = """
+    You are a software specification writer. For each of the following files, analyze the
+    component and return a JSON object containing one analysis per file:
+    
+    {files}
+    
+    Return ONLY a valid JSON object with the following structure, with one entry in
+    "components" for every file above, in the same order:
+    {{
+      "components": [
+        {{
+          "sourcePath": "File path exactly as given above",
+          "componentName": "Derived from filename or clear purpose in code",
+          "componentType": "module/class/utility/API/etc.",
+          "primaryFunctionality": "Brief description of what this component does",
+          "publicInterface": [
+            {{
+              "name": "methodName",
+              "parameters": ["param1:type", "param2:type"],
+              "returnType": "return type",
+              "description": "what the method does"
+            }}
+          ],
+          "dependencies": ["dependency1", "dependency2"],
+          "dataStructures": [
+            {{
+              "name": "structureName",
+              "fields": ["field1:type", "field2:type"],
+              "purpose": "what this structure is used for"
+            }}
+          ],
+          "errorHandling": "Description of error handling if present",
+          "notes": "Any important implementation details"
+        }}
+      ]
+    }}
+    """
 
 # Integration analysis prompt
-integration_prompt = PromptTemplate(
-    input_variables=["components", "project_structure"],
-    template="""
+INTEGRATION_TEMPLATE = """
     Based on the component analyses provided, create a comprehensive integration analysis
     showing how these components work together. Return the analysis as a JSON object.
     
@@ -96,6 +128,9 @@ integration_prompt = PromptTemplate(
     Project structure:
     {project_structure}
     
+    Files that often change together in the git history (coupling not always visible in the code):
+    {change_coupling}
+    
     Return ONLY a valid JSON object with the following structure:
     {{
       "systemArchitecture": "Description of overall architecture",
@@ -126,4 +161,61 @@ integration_prompt = PromptTemplate(
       "deploymentArchitecture": "Description of deployment architecture"
     }}
     """
-)
\ No newline at end of file
+# Directory summary prompt (reduce step of the map-reduce pipeline)
+DIRECTORY_TEMPLATE = """
+    You are a software architect. The following are analyses of the components and
+    sub-directories inside the directory "{directory}". Summarize what this part of the
+    codebase does as a whole. Return the summary as a JSON object.
+    
+    Component and sub-directory analyses:
+    {components}
+    
+    Return ONLY a valid JSON object with the following structure:
+    {{
+      "directory": "{directory}",
+      "summary": "What this part of the codebase is responsible for",
+      "keyComponents": [
+        {{
+          "name": "Component name",
+          "role": "What the component does within this directory"
+        }}
+      ],
+      "publicInterface": ["Most important entry points exposed to the rest of the system"],
+      "dependencies": ["dependency1", "dependency2"]
+    }}
+    """
+
+# Appended to a prompt when its previous response could not be parsed or validated
+REPAIR_INSTRUCTIONS = """
+    Your previous response to this request could not be used: {error}
+    Return ONLY the complete, valid JSON object with the structure described above, and no other text.
+    """
+
+# Template and input variables of each prompt, by the name its PromptTemplate is exported under
+PROMPTS = {
+    "overview_prompt": (OVERVIEW_TEMPLATE, ["languages", "components", "code_samples"]),
+    "component_prompt": (COMPONENT_TEMPLATE, ["file_path", "language", "code"]),
+    "multi_component_prompt": (MULTI_COMPONENT_TEMPLATE, ["files"]),
+    "integration_prompt": (INTEGRATION_TEMPLATE, ["components", "project_structure", "change_coupling"]),
+    "directory_prompt": (DIRECTORY_TEMPLATE, ["directory", "components"]),
+}
+_prompts = {}
+
+
+def __getattr__(name: str):
+    if name not in PROMPTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name not in _prompts:
+        from langchain.prompts import PromptTemplate
+        template, input_variables = PROMPTS[name]
+        _prompts[name] = PromptTemplate(input_variables=input_variables, template=template)
+    return _prompts[name]
+
+
+def with_repair_instructions(prompt):
+    """Return the prompt with instructions to fix a response that failed to parse, given as {error}."""
+    from langchain.prompts import PromptTemplate
+    return PromptTemplate(
+        input_variables=prompt.input_variables + ["error"],
+        template=prompt.template + REPAIR_INSTRUCTIONS
+    )
@@ -0,0 +1,114 @@
+import re
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+from utils import estimate_tokens
+
+# Words too common in analyses and code to tell components apart
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'in', 'is', 'it', 'its', 'of', 'on',
+    'or', 'that', 'the', 'this', 'to', 'with', 'self', 'none', 'true', 'false', 'def', 'return', 'import',
+    'component', 'components', 'file', 'module', 'class', 'function', 'functions', 'str', 'int', 'dict', 'list'
+}
+
+# What the integration stage needs to see: how components talk to each other and to the outside world
+INTEGRATION_QUERIES = [
+    "api endpoint route http request response handler controller rest graphql server",
+    "database storage repository model query schema sql orm migration cache",
+    "message queue event publish subscribe broker stream worker job scheduler",
+    "client external service integration sdk webhook provider gateway",
+    "config configuration environment settings deploy docker startup",
+    "auth authentication authorization token session user permission"
+]
+
+# What the overview stage needs to see: where the application starts and how it is wired together
+OVERVIEW_QUERIES = [
+    "main entry point app application cli command run start server",
+    "config configuration settings setup bootstrap router routes"
+]
+
+# Components retrieved for the integration stage at most, on top of the top-level summaries
+INTEGRATION_COMPONENTS = 24
+
+# Key components whose code is shown to the overview stage
+OVERVIEW_SAMPLE_FILES = 3
+
+# Constant of reciprocal rank fusion: how quickly lower ranks of one query lose weight
+FUSION_RANK_CONSTANT = 60
+
+_IDENTIFIER = re.compile(r'[A-Za-z][a-z]+|[A-Z]+(?![a-z])|[0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case terms of a text, with identifiers split at camelCase and snake_case boundaries."""
+    return [term for term in (word.lower() for word in _IDENTIFIER.findall(text))
+            if len(term) > 1 and term not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over short documents such as compact component analyses. Pure Python, in memory."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lengths = {}
+        # term -> {key: term frequency}
+        self.postings = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def add(self, key: str, text: str):
+        """Index a document under a key (a key is only expected once)."""
+        terms = Counter(tokenize(text))
+        self.lengths[key] = sum(terms.values())
+        self.total_length += self.lengths[key]
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[key] = count
+
+    def search(self, query: str, limit: int = 0) -> List[Tuple[str, float]]:
+        """Keys matching the query with their scores, best first."""
+        if not self.lengths:
+            return []
+        documents = len(self.lengths)
+        average_length = self.total_length / documents or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, count in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[key] / average_length)
+                scores[key] = scores.get(key, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+    def rank(self, queries: Iterable[str], limit: int = 0) -> List[str]:
+        """Keys matching any of the queries, combined by reciprocal rank fusion so every query gets a say."""
+        return fuse_rankings([[key for key, _ in self.search(query, limit)] for query in queries])
+
+
+def fuse_rankings(rankings: Iterable[List[str]]) -> List[str]:
+    """Combine ranked lists of keys into one (reciprocal rank fusion)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (FUSION_RANK_CONSTANT + rank)
+    return sorted(scores, key=lambda key: (-scores[key], key))
+
+
+def select_within_budget(items: Dict[str, str], order: Iterable[str], budget: int) -> Tuple[List[str], List[str]]:
+    """Take items in the given order while they fit the token budget; returns (selected keys, left out keys)."""
+    selected = []
+    left_out = []
+    used = 0
+    for key in order:
+        tokens = estimate_tokens(items[key])
+        if used + tokens <= budget:
+            selected.append(key)
+            used += tokens
+        else:
+            left_out.append(key)
+    return selected, left_out
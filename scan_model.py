@@ -0,0 +1,105 @@
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+from compactor import compact_code
+from config import COMPACTION_MODE
+from utils import clean_code_for_llm
+
+
+class DirectoryNode:
+    """A directory in the path trie of a scan; the project structure and every file record share it.
+
+    Names are interned, so a name repeated across directories (src, tests, __init__.py) is stored once.
+    The root node holds the absolute source directory; other nodes only their own name.
+    """
+
+    __slots__ = ('name', 'parent', 'directories', 'files')
+
+    def __init__(self, name: str, parent: Optional["DirectoryNode"] = None):
+        self.name = sys.intern(name)
+        self.parent = parent
+        self.directories = {}
+        self.files = []
+
+    def add_directory(self, name: str) -> "DirectoryNode":
+        child = DirectoryNode(name, self)
+        self.directories[child.name] = child
+        return child
+
+    def set_files(self, names: List[str]):
+        self.files = [sys.intern(name) for name in names]
+
+    @property
+    def path(self) -> str:
+        """Path relative to the source directory ('' for the root)."""
+        if self.parent is None:
+            return ''
+        parent = self.parent.path
+        return f"{parent}/{self.name}" if parent else self.name
+
+    @property
+    def abs_path(self) -> str:
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return os.path.join(node.name, self.path) if self.parent is not None else node.name
+
+    def walk(self) -> Iterator["DirectoryNode"]:
+        """This directory and all directories below it, parents first."""
+        yield self
+        for child in self.directories.values():
+            yield from child.walk()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The nested {"directories": {...}, "files": [...]} form used in the specification JSON."""
+        data = {"directories": {name: child.to_dict() for name, child in self.directories.items()}}
+        # The root lists only directories, as it always has
+        if self.parent is not None:
+            data["files"] = list(self.files)
+        return data
+
+
+class SourceFile:
+    """A source file found during the scan. Content is read from disk on access, never kept."""
+
+    __slots__ = ('directory', 'name', 'path', 'language', 'size', 'mtime', 'content_hash')
+
+    def __init__(self, directory: DirectoryNode, name: str, language: str, size: int, mtime: float = 0.0):
+        self.directory = directory
+        self.name = sys.intern(name)
+        # The one string every per-file table (structure index, plan, journal) uses as its key
+        self.path = f"{directory.path}/{name}" if directory.parent is not None else self.name
+        self.language = sys.intern(language)
+        self.size = size
+        self.mtime = mtime
+        # Shared with the structure index's parse result
+        self.content_hash = None
+
+    @property
+    def abs_path(self) -> str:
+        return os.path.join(self.directory.abs_path, self.name)
+
+    @property
+    def content(self) -> str:
+        """Read and compact the file content. Not cached, so memory stays flat."""
+        return self.read()
+
+    def read(self, signatures_only: bool = False) -> str:
+        """Read the file and prepare it for the LLM, optionally keeping only signatures."""
+        abs_path = self.abs_path
+        try:
+            with open(abs_path, 'r', errors='ignore') as f:
+                code = f.read()
+        except OSError as e:
+            print(f"Error reading {abs_path}: {e}")
+            return ""
+        if COMPACTION_MODE == "off":
+            return clean_code_for_llm(code)
+        return compact_code(code, self.language, self.path, signatures_only)
+
+    def to_dict(self, include_content: bool = False) -> Dict[str, Any]:
+        """Return the file record as a plain dict."""
+        data = {"path": self.path, "language": self.language, "size": self.size}
+        if include_content:
+            data["content"] = self.content
+        return data
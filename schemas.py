@@ -0,0 +1,143 @@
+import json
+from typing import Any, Dict, List, Optional
+from typing_extensions import Annotated
+from pydantic import BaseModel, BeforeValidator, ConfigDict, model_validator
+
+
+def _to_text(value: Any) -> str:
+    """Accept prose the model returned as a list or object instead of a string."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n".join(_to_text(item) for item in value)
+    return json.dumps(value)
+
+
+def _to_text_list(value: Any) -> List[str]:
+    """Accept a single string, or items that are objects, where a list of strings is expected."""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    items = []
+    for item in value:
+        if isinstance(item, dict):
+            item = item.get("name") or json.dumps(item)
+        items.append(_to_text(item))
+    return items
+
+
+def _to_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+Text = Annotated[str, BeforeValidator(_to_text)]
+TextList = Annotated[List[str], BeforeValidator(_to_text_list)]
+
+
+class _Schema(BaseModel):
+    # Fields the model adds beyond the schema are kept in the output
+    model_config = ConfigDict(extra="allow")
+
+
+class _Named(_Schema):
+    @model_validator(mode="before")
+    @classmethod
+    def _from_name(cls, value: Any) -> Any:
+        return {"name": value} if isinstance(value, str) else value
+
+
+class InterfaceMember(_Named):
+    name: Text
+    parameters: TextList = []
+    returnType: Text = ""
+    description: Text = ""
+
+
+class DataStructure(_Named):
+    name: Text
+    fields: TextList = []
+    purpose: Text = ""
+
+
+class ComponentAnalysis(_Schema):
+    """Schema of component_prompt and of each entry of multi_component_prompt."""
+    sourcePath: Optional[str] = None
+    componentName: Text
+    componentType: Text = ""
+    primaryFunctionality: Text = ""
+    publicInterface: Annotated[List[InterfaceMember], BeforeValidator(_to_list)] = []
+    dependencies: TextList = []
+    dataStructures: Annotated[List[DataStructure], BeforeValidator(_to_list)] = []
+    errorHandling: Text = ""
+    notes: Text = ""
+
+
+class ComponentBatch(_Schema):
+    """Schema of multi_component_prompt; entries are validated one by one so one bad entry does not fail the rest."""
+    components: Annotated[List[Any], BeforeValidator(_to_list)]
+
+
+class OverviewComponent(_Named):
+    name: Text
+    description: Text = ""
+    responsibilities: TextList = []
+
+
+class OverviewDocument(_Schema):
+    """Schema of overview_prompt."""
+    introduction: Text
+    architecture: Text = ""
+    technologies: TextList = []
+    components: Annotated[List[OverviewComponent], BeforeValidator(_to_list)] = []
+    dataFlow: Text = ""
+    integrationPoints: TextList = []
+    developmentConsiderations: Text = ""
+
+
+class ComponentInteraction(_Schema):
+    source: Text
+    target: Text
+    description: Text = ""
+
+
+class IntegrationPoint(_Named):
+    name: Text
+    description: Text = ""
+
+
+class ApiContract(_Schema):
+    endpoint: Text
+    method: Text = ""
+    parameters: TextList = []
+    response: Text = ""
+
+
+class IntegrationAnalysis(_Schema):
+    """Schema of integration_prompt."""
+    systemArchitecture: Text
+    componentInteractions: Annotated[List[ComponentInteraction], BeforeValidator(_to_list)] = []
+    dataFlow: Text = ""
+    integrationPoints: Annotated[List[IntegrationPoint], BeforeValidator(_to_list)] = []
+    dependencies: Dict[str, TextList] = {}
+    apiContracts: Annotated[List[ApiContract], BeforeValidator(_to_list)] = []
+    systemRequirements: TextList = []
+    deploymentArchitecture: Text = ""
+
+
+class DirectoryComponent(_Named):
+    name: Text
+    role: Text = ""
+
+
+class DirectorySummary(_Schema):
+    """Schema of directory_prompt."""
+    directory: Text = ""
+    summary: Text
+    keyComponents: Annotated[List[DirectoryComponent], BeforeValidator(_to_list)] = []
+    publicInterface: TextList = []
+    dependencies: TextList = []
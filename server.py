@@ -0,0 +1,454 @@
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import argparse
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+from batch import BatchRunner
+from doc_generator import create_runner
+from cache import AnalysisCache
+from metrics import Metrics
+from parallel_scan import ScanPools
+from main import setup_langsmith
+from config import CACHE_DIR, CACHE_MAX_SIZE_MB, CACHE_MAX_AGE_DAYS, LLM_MAX_CONCURRENCY, SCAN_WORKERS
+from config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_QUEUE_SIZE, SERVER_WORKDIR, SERVER_JOB_HISTORY
+
+# Event fields that only make sense inside one process
+_PRIVATE_EVENT_FIELDS = ('start', 'track')
+
+
+class ServerBusy(Exception):
+    """The job queue is full; the client should retry later."""
+
+
+class Job:
+    """A document-generation request and the progress events recorded while it runs."""
+
+    def __init__(self, request: Dict[str, Any], commit: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.request = request
+        self.commit = commit
+        self.status = "queued"
+        self.result = None
+        self.created_at = time.time()
+        self.events = []
+        self.listeners = []
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("ok", "failed")
+
+    def emit(self, event: str, **fields: Any):
+        """Record an event and wake up everyone streaming this job. Safe to call from any thread."""
+        with self._changed:
+            record = {"job": self.id, "seq": len(self.events), "event": event, "time": round(time.time(), 3)}
+            record.update(fields)
+            self.events.append(record)
+            self._changed.notify_all()
+        for listener in self.listeners:
+            listener(record)
+
+    def finish(self, status: str, result: Optional[Dict[str, Any]] = None):
+        self.result = result
+        self.status = status
+        self.emit(status, **(result or {}))
+
+    def wait_events(self, after: int, timeout: float = 15.0) -> List[Dict[str, Any]]:
+        """Events with a sequence number from `after` on, waiting up to `timeout` seconds for new ones."""
+        with self._changed:
+            if len(self.events) <= after and not self.finished:
+                self._changed.wait(timeout)
+            return self.events[after:]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "status": self.status, "request": self.request, "commit": self.commit,
+                "created": round(self.created_at, 3), "events": len(self.events), "result": self.result}
+
+
+class DocServer:
+    """Documents repositories on request, keeping the LLM client, result cache and indexes warm in memory.
+
+    Jobs go through a bounded queue and are run by a fixed number of workers; jobs for the same source
+    directory run one at a time. Documents generated for a commit are served again without a new run.
+    """
+
+    def __init__(self, batch: BatchRunner, workers: int = SERVER_WORKERS, queue_size: int = SERVER_QUEUE_SIZE,
+                 workdir: str = SERVER_WORKDIR, job_history: int = SERVER_JOB_HISTORY):
+        self.batch = batch
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.workdir = workdir
+        self.job_history = job_history
+        self.jobs = {}
+        # (source, commit) -> {"overview": path, "specification": path}; (source, None) is the latest run
+        self.documents = {}
+        self.loop = None
+        self.queue = None
+        self._lock = threading.Lock()
+        self._source_locks = {}
+        self._stopped = None
+
+    async def serve(self, frontend: Callable[["DocServer"], Callable[[], None]]):
+        """Run the workers until the frontend (HTTP or stdio) calls stop()."""
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.queue_size)
+        self._stopped = asyncio.Event()
+        workers = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        close_frontend = frontend(self)
+        try:
+            await self._stopped.wait()
+        finally:
+            close_frontend()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def stop(self):
+        """Stop serving. Safe to call from any thread."""
+        self.loop.call_soon_threadsafe(self._stopped.set)
+
+    def submit(self, request: Dict[str, Any], listener: Optional[Callable[[Dict[str, Any]], None]] = None) -> Job:
+        """Queue a job for {"source", "ref"?, "output"?, "incremental"?, "since"?, "resume"?, "force"?}.
+
+        Called from the frontend threads. Raises ValueError for a bad request and ServerBusy when the queue is full.
+        """
+        if not isinstance(request, dict) or not request.get("source"):
+            raise ValueError("a job needs a source directory")
+        source = os.path.abspath(request["source"])
+        if not os.path.isdir(source):
+            raise ValueError(f"source directory not found: {request['source']}")
+        commit = _resolve_commit(source, request["ref"]) if request.get("ref") else None
+
+        job = Job(dict(request, source=source), commit)
+        if listener:
+            job.listeners.append(listener)
+        documents = self.cached_documents(source, commit) if commit and not request.get("force") else None
+        self._add_job(job)
+        if documents:
+            job.finish("ok", {"documents": documents, "commit": commit, "cached": True})
+            return job
+        asyncio.run_coroutine_threadsafe(self._enqueue(job), self.loop).result()
+        return job
+
+    def cached_documents(self, source: str, commit: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """Documents generated for a commit of a source (or its latest run), if their files still exist."""
+        with self._lock:
+            documents = self.documents.get((os.path.abspath(source), commit))
+        if documents and all(os.path.exists(path) for path in documents.values()):
+            return documents
+        return None
+
+    def resolve_documents(self, source: str, ref: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """Documents for a source at a git ref, or for its latest run when no ref is given."""
+        source = os.path.abspath(source)
+        return self.cached_documents(source, _resolve_commit(source, ref) if ref else None)
+
+    def job(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+        report = {"queued": self.queue.qsize() if self.queue else 0, "queueSize": self.queue_size,
+                  "running": statuses.count("running"), "jobs": len(statuses),
+                  "documents": len(self.documents)}
+        if self.batch.cache:
+            report["cache"] = self.batch.cache.stats()
+        return report
+
+    def _add_job(self, job: Job):
+        with self._lock:
+            self.jobs[job.id] = job
+            # Only the most recent finished jobs are kept
+            finished = [job_id for job_id, old in self.jobs.items() if old.finished]
+            for job_id in finished[:max(0, len(self.jobs) - self.job_history)]:
+                del self.jobs[job_id]
+
+    async def _enqueue(self, job: Job):
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            with self._lock:
+                self.jobs.pop(job.id, None)
+            raise ServerBusy(f"the job queue is full ({self.queue_size} jobs waiting)")
+        job.emit("queued", position=self.queue.qsize())
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                source_lock = self._source_locks.setdefault(job.request["source"], asyncio.Lock())
+                async with source_lock:
+                    await self._run(job)
+            except Exception as e:
+                job.finish("failed", {"error": f"{type(e).__name__}: {e}"})
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: Job):
+        job.status = "running"
+        job.emit("started")
+        request = job.request
+        source = request["source"]
+        source_id = hashlib.sha256(source.encode()).hexdigest()[:16]
+        scan_dir = source
+        if job.commit:
+            scan_dir = await self.loop.run_in_executor(None, self._checkout, source, source_id, job.commit)
+        output = request.get("output") or os.path.join(self.workdir, "docs", source_id,
+                                                       job.commit[:12] if job.commit else "worktree")
+
+        def forward(event: Dict[str, Any]):
+            job.emit("progress", **{key: value for key, value in event.items() if key not in _PRIVATE_EVENT_FIELDS})
+
+        repo = {"name": os.path.basename(source), "source": scan_dir, "output": output,
+                "incremental": request.get("incremental", False), "since": request.get("since"),
+                "resume": request.get("resume", False)}
+        result = await self.batch.document(repo, Metrics(listener=forward))
+        if result["status"] == "ok":
+            with self._lock:
+                self.documents[(source, None)] = result["documents"]
+                if job.commit:
+                    self.documents[(source, job.commit)] = result["documents"]
+        job.finish(result["status"], result)
+
+    def _checkout(self, source: str, source_id: str, commit: str) -> str:
+        """Check out a commit into the server's worktree for the source and return the directory to scan.
+
+        The worktree is reused between jobs, so the structure index and git history stay warm.
+        """
+        toplevel = _git(source, "rev-parse", "--show-toplevel")
+        worktree = os.path.abspath(os.path.join(self.workdir, "worktrees", source_id))
+        if os.path.isdir(worktree):
+            _git(worktree, "checkout", "--quiet", "--force", "--detach", commit)
+        else:
+            os.makedirs(os.path.dirname(worktree), exist_ok=True)
+            _git(toplevel, "worktree", "add", "--quiet", "--force", "--detach", worktree, commit)
+        return os.path.normpath(os.path.join(worktree, os.path.relpath(source, toplevel)))
+
+
+def _git(cwd: str, *args: str) -> str:
+    return subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, check=True).stdout.strip()
+
+
+def _resolve_commit(source: str, ref: str) -> str:
+    try:
+        return _git(source, "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}")
+    except (OSError, subprocess.CalledProcessError):
+        raise ValueError(f"unknown git ref {ref!r} in {source}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """HTTP frontend: POST /jobs, GET /jobs/<id>, GET /jobs/<id>/events, GET /documents/<kind>, GET /health."""
+
+    server_version = "SpecDocGen"
+
+    @property
+    def docs(self) -> DocServer:
+        return self.server.docs
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip('/') != "/jobs":
+            return self._send_json(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            job = self.docs.submit(json.loads(self.rfile.read(length) or b"{}"))
+        except ServerBusy as e:
+            return self._send_json(503, {"error": str(e)}, {"Retry-After": "30"})
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        self._send_json(200 if job.finished else 202, job.to_dict())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if parts == ["health"]:
+            return self._send_json(200, self.docs.health())
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.docs.job(parts[1])
+            if job is None:
+                return self._send_json(404, {"error": f"unknown job {parts[1]}"})
+            if len(parts) == 2:
+                return self._send_json(200, job.to_dict())
+            if parts[2] == "events":
+                return self._stream_events(job, int(query.get("after", 0)))
+        if len(parts) == 2 and parts[0] == "documents" and parts[1] in ("overview", "specification"):
+            return self._send_document(parts[1], query)
+        self._send_json(404, {"error": "not found"})
+
+    def _send_document(self, kind: str, query: Dict[str, str]):
+        if not query.get("source"):
+            return self._send_json(400, {"error": "the source query parameter is required"})
+        try:
+            documents = self.docs.resolve_documents(query["source"], query.get("ref"))
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        if not documents:
+            return self._send_json(404, {"error": "no documents generated for this source and ref yet"})
+        with open(documents[kind], 'rb') as f:
+            body = f.read()
+        self._send(200, body)
+
+    def _stream_events(self, job: Job, after: int):
+        """Send the job's events as JSON lines, as they happen, until the job has finished."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            while True:
+                events = job.wait_events(after)
+                for event in events:
+                    self.wfile.write(json.dumps(event).encode() + b"\n")
+                self.wfile.flush()
+                after += len(events)
+                if job.finished and after >= len(job.events):
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+    def _send_json(self, status: int, data: Any, headers: Optional[Dict[str, str]] = None):
+        self._send(status, json.dumps(data).encode(), headers)
+
+    def _send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any):
+        sys.stderr.write(f"{self.address_string()} - {format % args}\n")
+
+
+def http_frontend(host: str, port: int) -> Callable[[DocServer], Callable[[], None]]:
+    """Serve the HTTP API from a thread pool next to the event loop."""
+    def start(docs: DocServer) -> Callable[[], None]:
+        httpd = ThreadingHTTPServer((host, port), _Handler)
+        httpd.daemon_threads = True
+        httpd.docs = docs
+        threading.Thread(target=httpd.serve_forever, name="http", daemon=True).start()
+        print(f"Serving on http://{host}:{httpd.server_address[1]}", file=sys.stderr)
+
+        def close():
+            httpd.shutdown()
+            httpd.server_close()
+        return close
+    return start
+
+
+def stdio_frontend(stdin=None, stdout=None) -> Callable[[DocServer], Callable[[], None]]:
+    """Read JSON requests from stdin, one per line, and write replies and job events to stdout as JSON lines.
+
+    Requests are {"op": "submit", ...job}, {"op": "status", "job": id}, {"op": "documents", "source", "ref"?}
+    and {"op": "health"}; an "id" field is echoed in the reply. At the end of the input, the submitted
+    jobs are finished before the server stops.
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    write_lock = threading.Lock()
+    submitted = []
+
+    def write(message: Dict[str, Any]):
+        with write_lock:
+            stdout.write(json.dumps(message) + "\n")
+            stdout.flush()
+
+    def handle(docs: DocServer, message: Dict[str, Any]) -> Dict[str, Any]:
+        op = message.get("op")
+        if op == "submit":
+            job = docs.submit({key: value for key, value in message.items() if key not in ("op", "id")}, write)
+            submitted.append(job)
+            return job.to_dict()
+        if op == "status":
+            job = docs.job(message.get("job", ""))
+            if job is None:
+                raise ValueError(f"unknown job {message.get('job')}")
+            return job.to_dict()
+        if op == "documents":
+            documents = docs.resolve_documents(message.get("source", "."), message.get("ref"))
+            if not documents:
+                raise ValueError("no documents generated for this source and ref yet")
+            return documents
+        if op == "health":
+            return docs.health()
+        raise ValueError(f"unknown op {op!r}")
+
+    def start(docs: DocServer) -> Callable[[], None]:
+        def read():
+            for line in stdin:
+                if not line.strip():
+                    continue
+                reply = {"id": None}
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError("each request must be a JSON object")
+                    reply["id"] = message.get("id")
+                    reply.update(ok=True, result=handle(docs, message))
+                except (ValueError, ServerBusy) as e:
+                    reply.update(ok=False, error=str(e))
+                write(reply)
+            for job in submitted:
+                while not job.finished:
+                    job.wait_events(len(job.events))
+            docs.stop()
+
+        threading.Thread(target=read, name="stdio", daemon=True).start()
+        return lambda: None
+    return start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve specification document generation with warm state")
+    parser.add_argument("--host", default=SERVER_HOST, help="Address to listen on")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="Port to listen on")
+    parser.add_argument("--stdio", action="store_true",
+                        help="Read JSON requests from stdin and write replies and events to stdout instead of HTTP")
+    parser.add_argument("--workdir", default=SERVER_WORKDIR,
+                        help="Directory for checked-out refs and the documents of jobs without an output directory")
+    parser.add_argument("--cache-dir", help="Directory for the persistent LLM result cache", default=CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true", help="Disable the persistent LLM result cache")
+    parser.add_argument("--concurrency", "-j", type=int, default=LLM_MAX_CONCURRENCY,
+                        help="Maximum number of concurrent LLM calls across all jobs")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Jobs run at the same time")
+    parser.add_argument("--queue-size", type=int, default=SERVER_QUEUE_SIZE,
+                        help="Jobs that may wait in the queue; further submissions are refused until it drains")
+    parser.add_argument("--scan-workers", type=int, default=SCAN_WORKERS,
+                        help="Threads/processes shared by the scans of all jobs")
+    args = parser.parse_args()
+
+    protocol_out = sys.stdout
+    if args.stdio:
+        # Progress output of the pipeline goes to stderr so stdout only carries the protocol
+        sys.stdout = sys.stderr
+    setup_langsmith()
+
+    # Built once and kept for every job: the LLM client and its connections, rate limits and caches
+    runner = create_runner(max_concurrency=args.concurrency)
+    cache = None if args.no_cache else AnalysisCache(args.cache_dir, CACHE_MAX_SIZE_MB, CACHE_MAX_AGE_DAYS)
+    frontend = stdio_frontend(stdout=protocol_out) if args.stdio else http_frontend(args.host, args.port)
+    try:
+        with ScanPools(args.scan_workers) as pools:
+            batch = BatchRunner(runner, cache, pools, None if args.no_cache else args.cache_dir, memory={})
+            asyncio.run(DocServer(batch, args.workers, args.queue_size, args.workdir).serve(frontend))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if cache:
+            cache.close()
+
+if __name__ == "__main__":
+    main()
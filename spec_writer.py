@@ -0,0 +1,49 @@
+import os
+import json
+import textwrap
+from typing import Any, Dict
+
+
+class SpecWriter:
+    """Streams spec_doc.json to disk with bounded memory.
+    
+    The document is written component by component into a temporary file and atomically
+    renamed into place once all sections are written, so readers never see a partial file.
+    """
+
+    def __init__(self, output_dir: str, filename: str = "spec_doc.json"):
+        self.path = os.path.join(output_dir, filename)
+        self._out = None
+        self._count = 0
+
+    def begin_components(self):
+        """Start writing the final document into a temporary file."""
+        self._out = open(self.path + ".tmp", 'w', encoding='utf-8')
+        self._out.write('{\n  "components": [')
+        self._count = 0
+
+    def write_component(self, component: Dict[str, Any]):
+        """Write one component of the final document."""
+        self._out.write(",\n" if self._count else "\n")
+        self._out.write(textwrap.indent(json.dumps(component, indent=2), '    '))
+        self._count += 1
+
+    def finish(self, sections: Dict[str, Any]) -> str:
+        """Write the remaining top-level sections and rename the document into place."""
+        self._out.write("\n  ]" if self._count else "]")
+        for key, value in sections.items():
+            body = json.dumps(value, indent=2).replace("\n", "\n  ")
+            self._out.write(f",\n  {json.dumps(key)}: {body}")
+        self._out.write("\n}")
+        self._out.flush()
+        os.fsync(self._out.fileno())
+        self._out.close()
+        os.replace(self.path + ".tmp", self.path)
+        return self.path
+
+    def close(self):
+        """Discard an unfinished document."""
+        if self._out is not None and not self._out.closed:
+            # An unfinished document is never left next to the real one
+            self._out.close()
+            os.remove(self.path + ".tmp")
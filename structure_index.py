@@ -0,0 +1,319 @@
+import os
+import re
+import ast
+import sys
+import json
+import hashlib
+from typing import Dict, List, Any, Iterator, Optional
+from dedupe import minhash_signature
+
+# Import statements by language; each pattern captures the imported module or path
+IMPORT_PATTERNS = {
+    'JavaScript': [r'''(?:import|export)\s[^'"]*?from\s+['"]([^'"]+)['"]''', r'''import\s+['"]([^'"]+)['"]''',
+                   r'''require\(\s*['"]([^'"]+)['"]\s*\)''', r'''import\(\s*['"]([^'"]+)['"]\s*\)'''],
+    'Java': [r'^\s*import\s+(?:static\s+)?([\w.]+)'],
+    'Kotlin': [r'^\s*import\s+([\w.]+)'],
+    'Scala': [r'^\s*import\s+([\w.]+)'],
+    'Go': [r'^\s*import\s+"([^"]+)"', r'^\s*(?:\w+\s+)?"([^"]+)"\s*$'],
+    'C': [r'^\s*#\s*include\s+"([^"]+)"'],
+    'C#': [r'^\s*using\s+(?:static\s+)?([\w.]+)\s*;'],
+    'Ruby': [r'''^\s*require(?:_relative)?\s+['"]([^'"]+)['"]'''],
+    'PHP': [r'''^\s*(?:require|include)(?:_once)?\s*\(?\s*['"]([^'"]+)['"]''', r'^\s*use\s+([\w\\]+)'],
+}
+IMPORT_PATTERNS['TypeScript'] = IMPORT_PATTERNS['JavaScript']
+IMPORT_PATTERNS['C++'] = IMPORT_PATTERNS['C']
+
+# Top-level symbol definitions for languages without an ast module
+SYMBOL_PATTERNS = {
+    'JavaScript': r'^(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function\*?|class|const|let|var)\s+([A-Za-z_$][\w$]*)',
+    'Java': r'^\s*(?:public\s+|abstract\s+|final\s+)*(?:class|interface|enum|record)\s+(\w+)',
+    'C#': r'^\s*(?:public\s+|internal\s+|static\s+|abstract\s+|sealed\s+|partial\s+)*(?:class|interface|enum|struct|record)\s+(\w+)',
+    'Go': r'^(?:func(?:\s+\([^)]*\))?|type)\s+(\w+)',
+    'Ruby': r'^\s*(?:class|module|def)\s+([\w:.]+)',
+    'PHP': r'^\s*(?:abstract\s+|final\s+)*(?:class|interface|trait|function)\s+(\w+)',
+    'C': r'^[A-Za-z_][\w\s\*]*?\b(\w+)\s*\([^;]*$',
+    'Kotlin': r'^\s*(?:\w+\s+)*(?:class|interface|object|fun)\s+(\w+)',
+    'Scala': r'^\s*(?:\w+\s+)*(?:class|trait|object|def)\s+(\w+)',
+}
+SYMBOL_PATTERNS['TypeScript'] = SYMBOL_PATTERNS['JavaScript']
+SYMBOL_PATTERNS['C++'] = SYMBOL_PATTERNS['C']
+
+# Extensions tried when resolving extension-less JavaScript/TypeScript imports
+SCRIPT_EXTENSIONS = ['', '.ts', '.tsx', '.js', '.jsx', '.mjs', '/index.ts', '/index.js']
+
+
+def parse_file(path: str, language: str, content: str) -> Dict[str, List[str]]:
+    """Extract the raw import references and top-level symbols defined in a file."""
+    if language == 'Python':
+        try:
+            return _parse_python(content)
+        except (SyntaxError, ValueError):
+            return {"imports": [], "symbols": []}
+    
+    imports = []
+    for pattern in IMPORT_PATTERNS.get(language, []):
+        imports.extend(re.findall(pattern, content, re.MULTILINE))
+    symbol_pattern = SYMBOL_PATTERNS.get(language)
+    symbols = re.findall(symbol_pattern, content, re.MULTILINE) if symbol_pattern else []
+    return {"imports": imports, "symbols": list(dict.fromkeys(symbols))}
+
+
+class ParsedFile:
+    """Parse result of one file: imports, top-level symbols, content hash and MinHash signature.
+
+    A slotted record with interned names, since the index keeps one per file between scans.
+    A binary file has no hash and `binary` set.
+    """
+
+    __slots__ = ('imports', 'symbols', 'hash', 'minhash', 'binary', 'stamp')
+
+    def __init__(self, imports: List[str], symbols: List[str], hash: Optional[str], minhash: Optional[bytes],
+                 binary: bool, stamp: Optional[List[Any]]):
+        # Imported modules recur across files (os, typing, react, ./utils); interned, each is stored once.
+        # Symbols are mostly unique to their file, where interning would only add to the intern table.
+        self.imports = tuple(sys.intern(ref) for ref in imports)
+        self.symbols = tuple(symbols)
+        self.hash = hash
+        self.minhash = minhash
+        self.binary = binary
+        self.stamp = tuple(stamp) if stamp is not None else None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Optional["ParsedFile"]:
+        """Read a record from the cache file. Entries written before MinHash signatures were added give None."""
+        if "minhash" not in data:
+            return None
+        minhash = bytes.fromhex(data["minhash"]) if data["minhash"] else None
+        return cls(data["imports"], data["symbols"], data["hash"], minhash, data["binary"], data["stamp"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "imports": list(self.imports),
+            "symbols": list(self.symbols),
+            "hash": self.hash,
+            "minhash": self.minhash.hex() if self.minhash else None,
+            "binary": self.binary,
+            "stamp": list(self.stamp) if self.stamp is not None else None
+        }
+
+
+def parse_source(path: str, language: str, content: Optional[str], stamp: Optional[List[Any]] = None) -> ParsedFile:
+    """Parse a file for the structure index. A content of None marks a binary file.
+    
+    Module-level so it can run in a worker process.
+    """
+    if content is None:
+        return ParsedFile([], [], None, None, True, stamp)
+    parsed = parse_file(path, language, content)
+    return ParsedFile(
+        parsed["imports"], parsed["symbols"], hashlib.sha256(content.encode("utf-8", errors="ignore")).hexdigest(),
+        minhash_signature(content), False, stamp
+    )
+
+
+def _iter_statements(body: List[ast.stmt]) -> Iterator[ast.stmt]:
+    """Yield statements recursively without visiting expressions, which ast.walk would (slowly) do."""
+    for node in body:
+        yield node
+        for field in ('body', 'orelse', 'finalbody', 'handlers'):
+            children = getattr(node, field, None)
+            if isinstance(children, list):
+                yield from _iter_statements(children)
+
+
+def _parse_python(content: str) -> Dict[str, List[str]]:
+    tree = ast.parse(content)
+    imports = []
+    for node in _iter_statements(tree.body):
+        if isinstance(node, ast.Import):
+            imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            # Relative imports keep their leading dots so they can be resolved against the importer
+            base = '.' * node.level + (node.module or '')
+            imports.append(base)
+            imports.extend(f"{base}.{alias.name}" if node.module else f"{base}{alias.name}" for alias in node.names)
+    symbols = [
+        node.name for node in tree.body
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+    ]
+    return {"imports": imports, "symbols": symbols}
+
+
+class StructureIndex:
+    """Import/dependency graph and symbol index over the scanned files, ranked by PageRank."""
+
+    def __init__(self, root_package: str = ''):
+        self.root_package = root_package
+        self.languages = {}
+        self.raw_imports = {}
+        self.symbols = {}
+        self.dependencies = {}
+        self.rank = {}
+        # Parse results of this scan, and of the previous one (from the cache file or memory) until build()
+        self._parsed = {}
+        self._previous = {}
+
+    def cached(self, path: str, stamp: List[Any]) -> Optional[ParsedFile]:
+        """Return the cached parse result of a file if its (size, mtime) stamp is unchanged."""
+        cached = self._previous.get(path)
+        if cached is not None and cached.stamp == tuple(stamp):
+            return cached
+        return None
+
+    def add_file(self, path: str, language: str, parsed: ParsedFile):
+        """Register a file with its parse result from parse_source."""
+        self._parsed[path] = parsed
+        self.languages[path] = language
+        self.raw_imports[path] = parsed.imports
+        self.symbols[path] = parsed.symbols
+
+    def is_binary(self, path: str) -> bool:
+        """Check whether a registered file was detected as binary."""
+        parsed = self._parsed.get(path)
+        return parsed is not None and parsed.binary
+
+    def content_hash(self, path: str) -> Optional[str]:
+        """SHA-256 of a registered file's content."""
+        parsed = self._parsed.get(path)
+        return parsed.hash if parsed is not None else None
+
+    def signature(self, path: str) -> Optional[bytes]:
+        """MinHash signature of a registered file's content, or None for very small files."""
+        parsed = self._parsed.get(path)
+        return parsed.minhash if parsed is not None else None
+
+    def build(self):
+        """Resolve imports to files in the scan and rank files by graph centrality."""
+        modules = self._module_table()
+        # Binary files take no part in the graph
+        for path in [path for path in self.languages if self.is_binary(path)]:
+            del self.languages[path], self.raw_imports[path], self.symbols[path]
+        paths = set(self.languages)
+        self.dependencies = {}
+        for path, imports in self.raw_imports.items():
+            targets = []
+            for ref in imports:
+                target = self._resolve(path, ref, modules, paths)
+                if target and target != path and target not in targets:
+                    targets.append(target)
+            self.dependencies[path] = targets
+        self.rank = self._pagerank()
+        # Only parse results for files still in the scan are kept
+        self._previous = {}
+        return self
+
+    @property
+    def symbol_index(self) -> Dict[str, List[str]]:
+        """Map each top-level symbol name to the files that define it."""
+        index = {}
+        for path, names in self.symbols.items():
+            for name in names:
+                index.setdefault(name, []).append(path)
+        return index
+
+    def dependents(self) -> Dict[str, List[str]]:
+        """Map each file to the files that import it."""
+        reverse = {path: [] for path in self.dependencies}
+        for path, targets in self.dependencies.items():
+            for target in targets:
+                reverse[target].append(path)
+        return reverse
+
+    def top_files(self, n: int) -> List[str]:
+        """Return the n most central files."""
+        return sorted(self.rank, key=lambda path: (-self.rank[path], path))[:n]
+
+    def _module_table(self) -> Dict[str, str]:
+        """Map dotted module names to file paths.
+        
+        Names are registered relative to every directory that is not itself a Python package,
+        so imports resolve regardless of the source root (e.g. src/).
+        """
+        packages = {os.path.dirname(path) for path in self.languages if os.path.basename(path) == '__init__.py'}
+        modules = {}
+        for path in sorted(self.languages, key=lambda p: p.count('/')):
+            stem, ext = os.path.splitext(path)
+            if ext not in ('.py', '.java', '.kt', '.scala', '.cs', '.php'):
+                continue
+            parts = stem.replace('\\', '/').split('/')
+            if parts[-1] == '__init__':
+                parts = parts[:-1]
+            for i in range(len(parts)):
+                if i and ext == '.py' and '/'.join(parts[:i]) in packages:
+                    continue
+                modules.setdefault('.'.join(parts[i:]), path)
+            # The scanned directory may itself be a package that files import by name
+            if '' in packages and ext == '.py':
+                modules.setdefault('.'.join([self.root_package] + parts), path)
+        return modules
+
+    def _resolve(self, importer: str, ref: str, modules: Dict[str, str], paths: set) -> Optional[str]:
+        language = self.languages[importer]
+        directory = os.path.dirname(importer)
+        if language == 'Python':
+            if ref.startswith('.'):
+                level = len(ref) - len(ref.lstrip('.'))
+                base = directory
+                for _ in range(level - 1):
+                    base = os.path.dirname(base)
+                prefix = base.replace(os.sep, '.')
+                ref = f"{prefix}.{ref.lstrip('.')}" if prefix else ref.lstrip('.')
+            # Absolute imports may carry a prefix outside the scan; drop it while the name stays qualified
+            parts = ref.split('.')
+            for i in range(max(1, len(parts) - 1)):
+                target = modules.get('.'.join(parts[i:]))
+                if target:
+                    return target
+            return None
+        if ref.startswith('.') or language in ('C', 'C++', 'Ruby', 'PHP'):
+            candidate = os.path.normpath(os.path.join(directory, ref))
+            for suffix in SCRIPT_EXTENSIONS + ['.rb', '.php']:
+                if candidate + suffix in paths:
+                    return candidate + suffix
+            return None
+        return modules.get(ref.replace('\\', '.'))
+
+    def _pagerank(self, damping: float = 0.85, iterations: int = 30) -> Dict[str, float]:
+        """PageRank over the import graph; rank flows from importers to the files they depend on."""
+        nodes = list(self.dependencies)
+        if not nodes:
+            return {}
+        n = len(nodes)
+        rank = {node: 1.0 / n for node in nodes}
+        for _ in range(iterations):
+            # Files without dependencies spread their rank evenly
+            dangling = sum(rank[node] for node in nodes if not self.dependencies[node])
+            new_rank = {node: (1.0 - damping) / n + damping * dangling / n for node in nodes}
+            for node in nodes:
+                targets = self.dependencies[node]
+                if targets:
+                    share = damping * rank[node] / len(targets)
+                    for target in targets:
+                        new_rank[target] += share
+            rank = new_rank
+        top = max(rank.values())
+        return {node: value / top for node, value in rank.items()}
+
+    def load(self, cache_file: str):
+        """Load cached per-file parse results from a previous scan."""
+        # Records are built as the file is decoded, so the plain dicts never all exist at once
+        hook = lambda data: ParsedFile.from_dict(data) if isinstance(data.get("stamp"), list) else data
+        try:
+            with open(cache_file) as f:
+                self._previous = json.load(f, object_hook=hook)
+        except (OSError, ValueError, KeyError, TypeError):
+            self._previous = {}
+
+    def reuse(self, previous: "StructureIndex"):
+        """Start from the parse results of an index still in memory instead of the cache file."""
+        self._previous = previous._parsed
+
+    def save(self, cache_file: str):
+        """Persist per-file parse results so unchanged files are not parsed again."""
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        # Written entry by entry, so the JSON form of the whole index is never held in memory
+        with open(cache_file, 'w') as f:
+            f.write('{')
+            for i, (path, parsed) in enumerate(self._parsed.items()):
+                f.write(f"{', ' if i else ''}{json.dumps(path)}: {json.dumps(parsed.to_dict())}")
+            f.write('}')
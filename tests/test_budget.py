@@ -0,0 +1,69 @@
+import os
+import io
+import json
+import shutil
+import tempfile
+import unittest
+import contextlib
+from benchmark import FakeLLM
+from code_analyzer import CodeAnalyzer
+from doc_generator import DocumentGenerator
+from planner import AnalysisPlan, Budget
+
+
+class BudgetPlanTest(unittest.TestCase):
+    """A budgeted run analyzes exactly the files its plan (describe_budget) promised."""
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.output = tempfile.mkdtemp()
+        words = ["load", "store", "parse", "render", "fetch", "merge", "split", "index", "score", "route", "queue"]
+        for package in range(4):
+            os.makedirs(os.path.join(self.source, f"pkg{package}"))
+            for module in range(10):
+                # Distinct names and arithmetic, so no two files are near-duplicates
+                body = "".join(f"def {words[(package * 7 + module * 3 + i) % len(words)]}_{package}_{module}_{i}"
+                               f"(value):\n    return value * {i * 13 + module} - {package * 31 + i}\n\n"
+                               for i in range(5 + module * 3))
+                imports = f"from pkg{(package + 1) % 4} import mod{module}\n\n"
+                with open(os.path.join(self.source, f"pkg{package}", f"mod{module}.py"), 'w') as f:
+                    f.write(imports + body)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.analysis = CodeAnalyzer(self.source).analyze()
+
+    def tearDown(self):
+        shutil.rmtree(self.source)
+        shutil.rmtree(self.output)
+
+    def run_with_budget(self, max_tokens: int, max_calls: int):
+        plan = AnalysisPlan(self.analysis, budget=Budget(max_tokens, max_calls))
+        generator = DocumentGenerator(self.analysis, llm=FakeLLM(), budget=Budget(max_tokens, max_calls))
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator.generate_documents(self.output)
+        with open(os.path.join(self.output, "spec_doc.json")) as f:
+            spec = json.load(f)
+        components = spec["components"]
+        analyzed = sum(1 for component in components if not component.get("outline"))
+        summarized = {directory for directory, summary in spec["directorySummaries"].items()
+                      if not summary["summary"].startswith("Not summarized")}
+        return plan, analyzed, len(components) - analyzed, summarized
+
+    def assert_plan_kept(self, max_tokens: int, max_calls: int):
+        plan, analyzed, outlined, summarized = self.run_with_budget(max_tokens, max_calls)
+        self.assertTrue(plan.outline_paths, "the budget should be tight enough to outline some files")
+        self.assertTrue(plan.files_to_analyze, "the budget should be large enough to analyze some files")
+        self.assertEqual(analyzed, len(plan.files_to_analyze), plan.describe_budget())
+        self.assertEqual(outlined, len(plan.outline_paths), plan.describe_budget())
+        # Directory summaries are planned too: none is refused at run time
+        self.assertTrue(plan.summary_directories, plan.describe_budget())
+        self.assertEqual(summarized, plan.summary_directories, plan.describe_budget())
+
+    def test_token_cap(self):
+        self.assert_plan_kept(12000, 0)
+
+    def test_call_cap(self):
+        self.assert_plan_kept(0, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import ast
+import unittest
+from compactor import compact_code, LITERAL_RUN_LINES
+
+
+class CompactorTest(unittest.TestCase):
+    """Compacted Python stays parseable, so the chunker can still split it by its syntax tree."""
+
+    def test_decorated_nested_function_signatures(self):
+        code = ("import functools\n\n"
+                "def outer(func):\n"
+                "    \"\"\"Wrap func.\"\"\"\n"
+                "    @functools.wraps(func)\n"
+                "    @staticmethod\n"
+                "    def inner(*args):\n"
+                "        return func(*args)\n"
+                "    return inner\n")
+        compacted = compact_code(code, 'Python', 'wrap.py', signatures_only=True)
+        ast.parse(compacted)
+        self.assertNotIn("@functools.wraps", compacted)
+        self.assertIn("def outer(func):", compacted)
+
+    def test_runs_stop_at_multi_line_expressions(self):
+        entries = [f"    'key{i}': ('name{i}', 'text {i} '\n               'more {i}'),\n" for i in range(LITERAL_RUN_LINES)]
+        table = "".join(f"    'key{i}': ('name{i}', 'text {i}'),\n" for i in range(LITERAL_RUN_LINES * 2))
+        # As in pydoc's topic table, the last entry fits on one line
+        code = ("TOPICS = {\n" + "".join(entries) + "    'last': ('name', 'text'),\n}\n\n"
+                "TABLE = {\n" + table + "}\n")
+        compacted = compact_code(code, 'Python', 'topics.py')
+        ast.parse(compacted)
+        # The table of single-line entries is still collapsed
+        self.assertIn("similar lines omitted", compacted)
+        self.assertIn("'more 0'", compacted)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+import os
+import re
+import subprocess
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Directories that are never descended into, whatever the ignore files say
+ALWAYS_IGNORED_DIRS = {'.git', '.hg', '.svn', 'node_modules', 'bower_components', '__pycache__',
+                       '.venv', 'venv', '.tox', '.nox', '.mypy_cache', '.pytest_cache',
+                       'vendor', 'third_party', 'site-packages', 'build', 'dist'}
+
+# Project-specific ignore file (gitignore syntax) read from the source root
+PROJECT_IGNORE_FILE = '.specdocignore'
+
+
+def _translate(pattern: str) -> str:
+    """Translate a gitignore glob into a regular expression body."""
+    i = 0
+    out = []
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            out.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            out.append('[^/]')
+            i += 1
+        elif pattern[i] == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                out.append(re.escape(pattern[i]))
+                i += 1
+            else:
+                body = pattern[i + 1:end].replace('\\', '\\\\')
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append(f'[{body}]')
+                i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return ''.join(out)
+
+
+class IgnoreRules:
+    """Gitignore-style rules from one ignore file, scoped to a directory and chained to its parent's rules."""
+
+    def __init__(self, base: str = '', parent: Optional['IgnoreRules'] = None):
+        self.base = base
+        self.parent = parent
+        self.rules = []
+
+    def add_lines(self, lines: List[str]):
+        for line in lines:
+            line = line.rstrip('\n').rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            anchored = '/' in line
+            line = line.lstrip('/')
+            prefix = '^' if anchored else '^(?:.*/)?'
+            self.rules.append((re.compile(prefix + _translate(line) + '$'), negate, dir_only))
+
+    def add_file(self, path: str) -> bool:
+        """Load rules from an ignore file. Returns False if the file does not exist."""
+        try:
+            with open(path, errors='ignore') as f:
+                self.add_lines(f.readlines())
+            return True
+        except OSError:
+            return False
+
+    def is_ignored(self, rel_path: str, is_dir: bool) -> bool:
+        """Check a path relative to the source root; the last matching rule of the deepest file wins."""
+        if self.base:
+            if not rel_path.startswith(self.base + '/'):
+                return self.parent.is_ignored(rel_path, is_dir) if self.parent else False
+            local = rel_path[len(self.base) + 1:]
+        else:
+            local = rel_path
+        for regex, negate, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(local):
+                return not negate
+        return self.parent.is_ignored(rel_path, is_dir) if self.parent else False
+
+
+class SourceTree:
+    """Single traversal engine for a source directory.
+    
+    Uses git's index listing when the source is inside a git repository, otherwise a pruned
+    os.scandir walk that honours .gitignore files. Both honour the project ignore file and
+    never descend into ALWAYS_IGNORED_DIRS or hidden directories.
+    """
+
+    def __init__(self, source_dir: str, git_repo=None):
+        self.source_dir = source_dir
+        self.git_repo = git_repo
+        self.project_rules = IgnoreRules()
+        self.project_rules.add_file(os.path.join(source_dir, PROJECT_IGNORE_FILE))
+
+    def walk(self) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """Yield (relative directory, subdirectory names, file names) top-down, like os.walk.
+        
+        The root directory is reported as '.'. Paths use '/' separators.
+        """
+        if self.git_repo is not None:
+            paths = self._git_paths()
+            if paths is not None:
+                return self._walk_paths(paths)
+        return self._walk_scandir()
+
+    def _skip_dir(self, name: str) -> bool:
+        return name.startswith('.') or name in ALWAYS_IGNORED_DIRS
+
+    def _walk_scandir(self) -> Iterator[Tuple[str, List[str], List[str]]]:
+        root_rules = IgnoreRules(parent=self.project_rules)
+        root_rules.add_file(os.path.join(self.source_dir, '.gitignore'))
+        stack = [('', root_rules)]
+        while stack:
+            rel_dir, rules = stack.pop()
+            abs_dir = os.path.join(self.source_dir, rel_dir) if rel_dir else self.source_dir
+            dirs = []
+            files = []
+            try:
+                with os.scandir(abs_dir) as entries:
+                    for entry in entries:
+                        rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            is_file = not is_dir and entry.is_file()
+                        except OSError:
+                            continue
+                        if is_dir:
+                            # Prune before descending
+                            if not self._skip_dir(entry.name) and not rules.is_ignored(rel_path, True):
+                                dirs.append(entry.name)
+                        elif is_file and not rules.is_ignored(rel_path, False):
+                            files.append(entry.name)
+            except OSError as e:
+                print(f"Error reading {abs_dir}: {e}")
+                continue
+            dirs.sort()
+            files.sort()
+            yield (rel_dir or '.'), dirs, files
+            # Push in reverse so directories are visited in sorted, depth-first order
+            for name in reversed(dirs):
+                child = f"{rel_dir}/{name}" if rel_dir else name
+                child_rules = IgnoreRules(base=child, parent=rules)
+                if not child_rules.add_file(os.path.join(self.source_dir, child, '.gitignore')):
+                    child_rules = rules
+                stack.append((child, child_rules))
+
+    def _git_paths(self) -> Optional[List[str]]:
+        """List tracked and untracked-but-not-ignored files under the source directory via git."""
+        prefix = os.path.relpath(os.path.abspath(self.source_dir), self.git_repo.working_tree_dir)
+        try:
+            output = subprocess.run(
+                ['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard', '--', prefix],
+                cwd=self.git_repo.working_tree_dir, capture_output=True, check=True
+            ).stdout.decode('utf-8', errors='ignore')
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Warning: git ls-files failed ({e}). Falling back to a directory walk.")
+            return None
+        paths = [path for path in output.split('\0') if path]
+        if prefix != '.':
+            paths = [path[len(prefix) + 1:] for path in paths if path.startswith(prefix + '/')]
+        return paths
+
+    def _walk_paths(self, paths: List[str]) -> Iterator[Tuple[str, List[str], List[str]]]:
+        tree: Dict[str, Tuple[set, List[str]]] = {'': (set(), [])}
+        skipped = set()
+        for path in paths:
+            parts = path.split('/')
+            # Deleted-but-tracked files and files under pruned directories are dropped
+            if any(self._skip_dir(part) for part in parts[:-1]):
+                continue
+            if not os.path.isfile(os.path.join(self.source_dir, path)):
+                continue
+            if self._project_ignored(parts, skipped):
+                continue
+            directory = ''
+            for part in parts[:-1]:
+                child = f"{directory}/{part}" if directory else part
+                if child not in tree:
+                    tree[child] = (set(), [])
+                    tree[directory][0].add(part)
+                directory = child
+            tree[directory][1].append(parts[-1])
+        
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            subdirs, files = tree.pop(rel_dir)
+            dirs = sorted(subdirs)
+            yield (rel_dir or '.'), dirs, sorted(files)
+            stack.extend(f"{rel_dir}/{name}" if rel_dir else name for name in reversed(dirs))
+
+    def _project_ignored(self, parts: List[str], skipped: set) -> bool:
+        """Apply the project ignore file to a path and each of its parent directories."""
+        if not self.project_rules.rules:
+            return False
+        for i in range(1, len(parts)):
+            directory = '/'.join(parts[:i])
+            if directory in skipped:
+                return True
+            if self.project_rules.is_ignored(directory, True):
+                skipped.add(directory)
+                return True
+        return self.project_rules.is_ignored('/'.join(parts), False)
@@ -1,5 +1,6 @@
 import os
 import re
+import json
 from typing import List, Dict, Any
 
 def setup_directories(output_dir: str):
@@ -7,6 +8,12 @@ def setup_directories(output_dir: str):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
+def write_json_atomic(path: str, data: Any):
+    """Write JSON to a temporary file and rename it into place, so readers never see a partial file."""
+    with open(path + ".tmp", 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(path + ".tmp", path)
+
 def extract_file_extension(filename: str) -> str:
     """Extract file extension from filename."""
     return os.path.splitext(filename)[1][1:]
@@ -36,3 +43,24 @@ def clean_code_for_llm(code_content: str) -> str:
     # Remove redundant comments or line numbers if needed
     # Normalize whitespace
     return code_content.strip()
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of model tokens in a piece of text."""
+    # Around four characters per token for code and English text
+    return len(text) // 4 + 1
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """Count model tokens with tiktoken when it is installed, otherwise estimate them."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # tiktoken is optional; fall back to the character-based estimate
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)